@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Один разобранный файл на весь путь: чтение → решение → перемещение → запись тегов
+
+AudioHandle берет запись из каталога тегов, а при промахе читает только
+заголовки (fast_tags; mutagen - если быстрое чтение не справилось). Полный
+разбор mutagen делается лениво - когда тег действительно нужно переписать,
+объект держится в памяти до записи. Перемещение только меняет путь объекта,
+запись тегов идет через тот же объект - файл разбирается mutagen не больше
+одного раза и пишется не больше одного раза.
+
+Счетчики (stats) показывают, сколько раз файлы разбирались и писались:
+    handle = AudioHandle(path)
+    record = handle.load()
+    ...
+    handle.moved(destination)
+    handle.update_tags({'genre': 'House'})
+    handle.release()
+
+Для перемещения на другой диск изменения можно внести в объект заранее
+(stage), а метаданные вписать прямо в копию (streamed) - см. move_engine
+
+    print(handle_stats())      # max_reads / max_writes должны быть <= 1
+"""
+
+import threading
+from pathlib import Path
+
+from format_sniff import open_audio
+from instrumentation import stage, count
+from flac_writer import plan_metadata
+from tag_catalog import get_catalog, record_from_audio, tags_to_dict
+from tag_writer import TagUpdate, plan_changes, print_plan, set_tag, commit, is_dry_run
+
+_lock = threading.Lock()
+# cached - из каталога, fast - чтение заголовков, parsed - полный разбор mutagen
+stats = {'files': 0, 'cached': 0, 'fast': 0, 'parsed': 0, 'written': 0, 'max_reads': 0, 'max_writes': 0}
+
+
+def handle_stats():
+    """Копия счетчиков по всем файлам процесса"""
+    with _lock:
+        return dict(stats)
+
+
+def _count(handle, key):
+    with _lock:
+        stats[key] += 1
+        if key == 'parsed':
+            handle.reads += 1
+            stats['max_reads'] = max(stats['max_reads'], handle.reads)
+        elif key == 'written':
+            handle.writes += 1
+            stats['max_writes'] = max(stats['max_writes'], handle.writes)
+
+
+class AudioHandle:
+    """
+    Запись каталога и (если файл уже разбирался) объект mutagen для одного файла
+    Объект не потокобезопасен: загружается в потоке предзагрузки,
+    дальше используется одним потоком
+    """
+
+    def __init__(self, path, opener=open_audio):
+        self.path = Path(path)
+        self.opener = opener
+        self.record = None
+        self.audio = None
+        self.reads = 0
+        self.writes = 0
+        with _lock:
+            stats['files'] += 1
+
+    def load(self):
+        """
+        Запись каталога для файла (None - формат не поддерживается)
+        При промахе - быстрое чтение заголовков, mutagen - только если оно не справилось
+        """
+        if self.record is not None:
+            return self.record
+
+        def keep_audio(path):
+            # Разобранный при промахе объект остается для записи тегов
+            self.audio = self.opener(path)
+            return self.audio
+
+        record, source = get_catalog().read_source(self.path, keep_audio)
+        if source is not None:
+            _count(self, source)
+        self.record = record
+        return record
+
+    def _open(self):
+        if self.audio is None:
+            with stage('parse'):
+                self.audio = self.opener(str(self.path))
+            _count(self, 'parsed')
+        return self.audio
+
+    def moved(self, destination):
+        """Файл переехал: дальше читаем и пишем по новому пути"""
+        self.path = Path(destination)
+        if self.audio is not None:
+            self.audio.filename = str(self.path)
+
+    def update_tags(self, changes, dry_run=None):
+        """
+        Как tag_writer.update_tags, но через уже разобранный объект
+        Возвращает TagUpdate
+        """
+        record = self.load()
+        if record is None:
+            raise ValueError(f"unsupported audio file: {self.path}")
+        if dry_run is None:
+            dry_run = is_dry_run()
+        if dry_run:
+            planned = plan_changes(self.path, record, changes)
+            if planned:
+                print_plan(planned)
+            return TagUpdate(str(self.path), planned, False, None)
+
+        planned = self.stage(changes)
+        if not planned:
+            return TagUpdate(str(self.path), [], False, None)
+        return self.save(planned)
+
+    def stage(self, changes):
+        """
+        Вносит изменения в объект mutagen, ничего не записывая
+        Возвращает список TagChange (пустой - менять нечего)
+        """
+        record = self.load()
+        if record is None:
+            raise ValueError(f"unsupported audio file: {self.path}")
+        planned = plan_changes(self.path, record, changes)
+        if planned:
+            audio = self._open()
+            # Запись каталога могла разойтись с файлом - сверяемся с тем, что в нем лежит
+            planned = plan_changes(self.path, {'format': type(audio).__name__, 'tags': tags_to_dict(audio)},
+                                   changes)
+            if not planned:
+                get_catalog().refresh(self.path, audio)
+                self.record = record_from_audio(audio)
+                return planned
+            for change in planned:
+                set_tag(audio, change.field, change.new)
+        return planned
+
+    def save(self, planned):
+        """Записывает изменения, внесенные stage(); возвращает TagUpdate"""
+        update = commit(self.audio, planned, dry_run=False)
+        self._written()
+        return update
+
+    def plan_metadata(self):
+        """
+        Новые метаданные FLAC после stage() для копии с заменой начала файла
+        (flac_writer.MetadataPlan) или None для других форматов
+        """
+        if type(self.audio).__name__ != 'FLAC':
+            return None
+        return plan_metadata(self.audio)
+
+    def streamed(self, destination, planned):
+        """
+        Копия с новыми метаданными уже лежит в destination (move_engine.copy_data)
+        Учитываем ее как запись файла; возвращает TagUpdate
+        """
+        self.moved(destination)
+        get_catalog().refresh(self.path, self.audio)
+        self._written()
+        return TagUpdate(str(self.path), planned, True, None)
+
+    def _written(self):
+        _count(self, 'written')
+        self.record = record_from_audio(self.audio)
+
+    def release(self):
+        """Отпускает объект mutagen (картинки и т.п.), запись каталога остается"""
+        self.audio = None
+
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Поиск аудиофайлов за один проход os.scandir
+Расширения сравниваются без учета регистра по множеству,
+тип записи берется из dirent (без лишних вызовов stat),
+результаты отдаются генератором по мере обхода
+"""
+
+import os
+from pathlib import Path
+
+# Все поддерживаемые форматы (в нижнем регистре)
+AUDIO_EXTENSIONS = frozenset({'.flac', '.mp3', '.m4a', '.mp4', '.ogg', '.opus', '.aiff', '.aif'})
+FLAC_EXTENSIONS = frozenset({'.flac'})
+
+# Политика символических ссылок:
+#   'skip'   - ссылки игнорируются
+#   'files'  - ссылки на файлы включаются, в ссылки на папки не заходим
+#   'follow' - заходим и в папки по ссылкам (с защитой от циклов)
+SYMLINK_POLICIES = ('skip', 'files', 'follow')
+
+
+def iter_audio_entries(root, extensions=AUDIO_EXTENSIONS, max_depth=None, symlinks='files'):
+    """
+    Обходит root и отдает os.DirEntry подходящих файлов
+    max_depth: 0 - только сам root, 1 - плюс подпапки первого уровня, None - без ограничений
+    Папки с ошибками доступа пропускаются
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"unknown symlink policy: {symlinks}")
+
+    extensions = frozenset(ext.lower() for ext in extensions)
+    stack = [(os.fspath(root), 0)]
+    visited = set()
+
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                is_link = entry.is_symlink()
+                if is_link and symlinks == 'skip':
+                    continue
+
+                if entry.is_dir(follow_symlinks=symlinks == 'follow'):
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    if symlinks == 'follow':
+                        # Защита от циклов через ссылки
+                        st = entry.stat()
+                        key = (st.st_dev, st.st_ino)
+                        if key in visited:
+                            continue
+                        visited.add(key)
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=is_link):
+                    if os.path.splitext(entry.name)[1].lower() in extensions:
+                        yield entry
+            except OSError:
+                continue
+
+        # Обратный порядок - чтобы папки обходились по алфавиту
+        for path in sorted(subdirs, reverse=True):
+            stack.append((path, depth + 1))
+
+
+def iter_audio_files(root, extensions=AUDIO_EXTENSIONS, max_depth=None, symlinks='files'):
+    """То же, что iter_audio_entries, но отдает pathlib.Path"""
+    for entry in iter_audio_entries(root, extensions, max_depth, symlinks):
+        yield Path(entry.path)
+
+
+def list_subdirectories(root):
+    """Подпапки первого уровня (по алфавиту) без отдельного stat на каждую"""
+    try:
+        with os.scandir(root) as it:
+            return sorted((Path(entry.path) for entry in it if entry.is_dir()), key=lambda p: p.name)
+    except OSError:
+        return []
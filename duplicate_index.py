@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Поиск точных дубликатов без декодирования
+
+Отпечаток файла - хэш самих аудиоданных, теги и обложки не учитываются:
+- FLAC: MD5 несжатого звука из STREAMINFO (уже лежит в каталоге тегов);
+- остальные (и FLAC без MD5): blake2b полезной нагрузки - кадры MP3 без
+  ID3v2/APE/ID3v1, содержимое mdat в MP4, страницы Ogg после заголовков,
+  чанк SSND в AIFF. Результат сохраняется в каталоге ('audio_hash'),
+  поэтому каждый файл хэшируется один раз, пока не изменится.
+
+Кандидаты сначала отбираются по формату и длительности из заголовков,
+хэш считается только для файлов с совпавшей длительностью - поиск идет
+со скоростью чтения метаданных.
+
+Использование при перемещении:
+    duplicates = DuplicateIndex()
+    existing = duplicates.find(file_path, genre_folder)   # путь дубликата или None
+    ...
+    duplicates.add(destination)                           # файл лег в папку
+"""
+
+import hashlib
+import os
+import struct
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from discovery import iter_audio_files, AUDIO_EXTENSIONS
+from fast_tags import _skip_id3_header, _mp4_atoms
+from flac_writer import metadata_end
+from tag_catalog import get_catalog
+
+HASH_CHUNK = 1024 * 1024
+
+# Длительность округляется до сотых: у одинаковых аудиоданных она совпадает точно
+LENGTH_PRECISION = 2
+
+
+def _hash_ranges(f, ranges):
+    """blake2b по списку диапазонов (начало, конец) файла"""
+    digest = hashlib.blake2b(digest_size=20)
+    for start, end in ranges:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _mp3_ranges(f, file_size):
+    """Кадры MP3: после ID3v2, до APEv2 и ID3v1 в конце"""
+    f.seek(0)
+    start = _skip_id3_header(f)
+    end = file_size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            size, flags = struct.unpack('<II', footer[12:20])
+            end -= size + (32 if flags & 0x80000000 else 0)
+    return [(start, max(start, end))]
+
+
+def _mp4_ranges(f, file_size):
+    """Содержимое всех атомов mdat верхнего уровня"""
+    return [(start, end) for name, start, end in _mp4_atoms(f, 0, file_size) if name == b'mdat']
+
+
+def _ogg_ranges(f, file_size):
+    """
+    Данные страниц Ogg со звуком: заголовки кодека лежат на страницах
+    с нулевой гранулой, звук всегда начинается с новой страницы
+    Заголовки страниц (номер, CRC) не хэшируются - они меняются вместе с тегами
+    """
+    ranges = []
+    pos = 0
+    while pos + 27 <= file_size:
+        f.seek(pos)
+        header = f.read(27)
+        if len(header) < 27 or header[:4] != b'OggS':
+            raise ValueError('invalid Ogg page')
+        granule = struct.unpack('<q', header[6:14])[0]
+        segments = f.read(header[26])
+        data_start = pos + 27 + header[26]
+        data_end = data_start + sum(segments)
+        if granule != 0:
+            ranges.append((data_start, data_end))
+        pos = data_end
+    return ranges
+
+
+def _aiff_ranges(f, file_size):
+    """Чанк SSND (звук) внутри FORM"""
+    pos = 12
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        name, size = struct.unpack('>4sI', f.read(8))
+        if name == b'SSND':
+            return [(pos + 8, min(pos + 8 + size, file_size))]
+        pos += 8 + size + (size & 1)
+    raise ValueError('no SSND chunk')
+
+
+_PAYLOAD_RANGES = {
+    'MP3': _mp3_ranges,
+    'MP4': _mp4_ranges,
+    'OggVorbis': _ogg_ranges,
+    'OggOpus': _ogg_ranges,
+    'AIFF': _aiff_ranges,
+}
+
+
+def payload_hash(path, fmt):
+    """
+    Хэш аудиоданных файла без тегов (None - формат не поддерживается)
+    fmt - формат из записи каталога ('FLAC', 'MP3', ...)
+    """
+    if fmt == 'FLAC':
+        _, audio_start, _ = metadata_end(path)
+        ranges = lambda f, size: [(audio_start, size)]
+    else:
+        ranges = _PAYLOAD_RANGES.get(fmt)
+        if ranges is None:
+            return None
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        return _hash_ranges(f, ranges(f, size))
+
+
+def fingerprint(path, record=None, catalog=None):
+    """
+    Отпечаток аудиоданных файла: 'flac-md5:...' или '<формат>:<blake2b>'
+    None - формат неизвестен или файл не разобрать
+    Вычисленный хэш сохраняется в каталоге тегов
+    """
+    catalog = catalog or get_catalog()
+    try:
+        if record is None:
+            record = catalog.read(path)
+        if not record:
+            return None
+        info = record['info']
+        if info.get('md5'):
+            return f"flac-md5:{info['md5']}"
+        if not info.get('audio_hash'):
+            digest = payload_hash(path, record['format'])
+            if digest is None:
+                return None
+            info['audio_hash'] = digest
+            catalog.store(path, record)
+        return f"{record['format']}:{info['audio_hash']}"
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def length_key(record):
+    """Ключ предварительного отбора: формат и длительность"""
+    length = record['info'].get('length')
+    return record['format'], round(length, LENGTH_PRECISION) if length is not None else None
+
+
+class DuplicateIndex:
+    """
+    Индекс аудиоданных по папкам назначения (потокобезопасно)
+    Папка читается при первом обращении: только заголовки из каталога,
+    хэши - лениво, для файлов с той же длительностью, что и проверяемый
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog or get_catalog()
+        self.hashed = 0
+        self.found = 0
+        self._lock = threading.Lock()
+        self._folders = {}    # папка → {(формат, длительность): [пути]}
+        self._building = {}   # папка, которая сейчас читается → пути, добавленные за это время
+
+    def _folder(self, folder):
+        """
+        Корзины папки; папка читается без блокировки (другие потоки не ждут
+        чужой диск), готовый индекс вставляется под блокировкой
+        """
+        key = os.path.abspath(folder)
+        with self._lock:
+            buckets = self._folders.get(key)
+            if buckets is not None:
+                return buckets
+            self._building.setdefault(key, [])
+        built = defaultdict(list)
+        for path in iter_audio_files(folder, AUDIO_EXTENSIONS, max_depth=0):
+            self._add(built, self._entry(path))
+        with self._lock:
+            buckets = self._folders.get(key)
+            if buckets is None:
+                # Файлы, перемещенные в папку, пока она читалась
+                known = {path for paths in built.values() for path in paths}
+                for entry in self._building.pop(key, ()):
+                    if entry is not None and entry[1] not in known:
+                        self._add(built, entry)
+                buckets = self._folders[key] = built
+            return buckets
+
+    def _entry(self, path):
+        """(ключ корзины, путь) или None - файл не разобрать"""
+        try:
+            record = self.catalog.read(path)
+        except Exception:
+            return None
+        if not record:
+            return None
+        return length_key(record), Path(path)
+
+    @staticmethod
+    def _add(buckets, entry):
+        if entry is not None:
+            buckets[entry[0]].append(entry[1])
+
+    def add(self, path):
+        """Файл появился в папке (после перемещения); непрочитанные папки не трогаем"""
+        path = Path(path)
+        key = os.path.abspath(path.parent)
+        with self._lock:
+            if key not in self._folders and key not in self._building:
+                return
+        entry = self._entry(path)
+        with self._lock:
+            buckets = self._folders.get(key)
+            if buckets is not None:
+                self._add(buckets, entry)
+            elif key in self._building:
+                self._building[key].append(entry)
+
+    def find(self, path, folder):
+        """Путь файла в папке с теми же аудиоданными или None"""
+        record = self.catalog.read(path)
+        if not record:
+            return None
+        buckets = self._folder(folder)
+        with self._lock:
+            candidates = list(buckets.get(length_key(record), ()))
+        if not candidates:
+            return None
+
+        own = fingerprint(path, record, self.catalog)
+        if own is None:
+            return None
+        own_path = os.path.abspath(path)
+        for candidate in candidates:
+            if not candidate.exists() or os.path.abspath(candidate) == own_path:
+                continue
+            self.hashed += 1
+            if fingerprint(candidate, catalog=self.catalog) == own:
+                self.found += 1
+                return candidate
+        return None
@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+"""
+Быстрое чтение тегов только из заголовков файла
+Для каждого формата проходим структуру метаданных и перепрыгиваем
+через обложки и аудиоданные, не загружая их в память:
+  FLAC - блоки метаданных, PICTURE пропускаются seek'ом
+  MP3/AIFF - кадры ID3v2, APIC пропускаются
+  MP4 - атомы moov/udta/meta/ilst, covr пропускается, '----' - только текст
+  OGG/OPUS - первый пакет комментариев
+Возвращает запись в формате каталога тегов (format, tags, info)
+или None, если файл лучше отдать mutagen
+"""
+
+import re
+import struct
+import zlib
+from itertools import zip_longest
+
+from mutagen._constants import GENRES
+from mutagen.id3 import TCON, ID3TimeStamp
+
+from format_sniff import detect_format
+
+# Биты флагов кадра ID3v2.4, при которых быстрый разбор невозможен
+ID3_V24_UNSUPPORTED = 0x0008 | 0x0004 | 0x0002  # сжатие, шифрование, unsync
+ID3_V23_UNSUPPORTED = 0x0080 | 0x0040  # сжатие, шифрование
+
+# Кадры ID3 с картинками и бинарными данными - не читаем вообще
+ID3_SKIP_FRAMES = {b'APIC', b'GEOB', b'PRIV', b'MCDI', b'SYLT', b'USLT', b'POPM', b'PCNT', b'UFID'}
+
+# Кадры ID3v2.3, которые mutagen при чтении переводит в v2.4 (update_to_v24):
+# TYER/TDAT/TIME собираются в TDRC, TORY становится TDOR, TRDA и TSIZ отбрасываются
+ID3_V23_RENAMED = {'TYER': 'TDRC', 'TDAT': 'TDRC', 'TIME': 'TDRC', 'TORY': 'TDOR'}
+ID3_V23_DROPPED = {'TRDA', 'TSIZ'}
+# Кадры с датой: mutagen приводит их к виду 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'
+ID3_TIMESTAMP_FRAMES = {'TDRC', 'TDOR', 'TDRL', 'TDEN', 'TDTG'}
+
+# Биты байта флагов страницы Ogg и ее заголовок до таблицы сегментов
+OGG_LAST_PAGE = 0x04
+OGG_PAGE_HEADER = struct.Struct('<4sBBqIIIB')
+# CRC страницы Ogg - CRC-32 без отражения битов; zlib считает отраженный,
+# поэтому байты переворачиваются до и после (как в mutagen)
+OGG_BITSWAP = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+# Таблица битрейтов MPEG (кбит/с) для Layer III: [MPEG1, MPEG2/2.5]
+MP3_BITRATES = [
+    [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+]
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class FastTagError(Exception):
+    """Файл не удалось разобрать быстрым способом"""
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise FastTagError('unexpected end of file')
+    return data
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _wanted(key, fields):
+    return fields is None or key in fields
+
+
+def _add(tags, key, value):
+    tags.setdefault(key, []).append(value)
+
+
+def _parse_vorbis_comments(reader, tags, fields):
+    """
+    Разбирает блок Vorbis-комментариев
+    reader - объект с методами read(n) и skip(n)
+    METADATA_BLOCK_PICTURE пропускается без чтения
+    """
+    vendor_length = struct.unpack('<I', reader.read(4))[0]
+    reader.skip(vendor_length)
+    count = struct.unpack('<I', reader.read(4))[0]
+
+    for _ in range(count):
+        length = struct.unpack('<I', reader.read(4))[0]
+        # Имя поля короткое - читаем начало и смотрим, нужно ли значение
+        head = reader.read(min(length, 64))
+        eq = head.find(b'=')
+        if eq < 0:
+            reader.skip(length - len(head))
+            continue
+        key = head[:eq].decode('ascii', 'replace').upper()
+        if key == 'METADATA_BLOCK_PICTURE' or not _wanted(key, fields):
+            reader.skip(length - len(head))
+            continue
+        value = head[eq + 1:] + reader.read(length - len(head))
+        _add(tags, key, value.decode('utf-8', 'replace'))
+
+
+class _FileReader:
+    """Последовательное чтение из файла с пропуском через seek"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size):
+        return _read_exact(self.f, size)
+
+    def skip(self, size):
+        self.f.seek(size, 1)
+
+
+def _skip_id3_header(f):
+    """Если файл начинается с ID3v2, возвращает смещение после тега"""
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b'ID3':
+        size = _syncsafe(header[6:10]) + 10
+        if header[5] & 0x10:
+            size += 10  # footer
+        return size
+    return 0
+
+
+def read_flac(f, fields=None):
+    """FLAC: проходим блоки метаданных, PICTURE пропускаем"""
+    offset = _skip_id3_header(f)
+    f.seek(offset)
+    if f.read(4) != b'fLaC':
+        raise FastTagError('not a FLAC file')
+
+    tags = {}
+    info = {}
+    pictures = 0
+    reader = _FileReader(f)
+
+    while True:
+        header = _read_exact(f, 4)
+        is_last = header[0] & 0x80
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        block_end = f.tell() + length
+
+        if block_type == 0:
+            data = _read_exact(f, length)
+            packed = int.from_bytes(data[10:18], 'big')
+            sample_rate = packed >> 44
+            channels = ((packed >> 41) & 0x07) + 1
+            bits = ((packed >> 36) & 0x1F) + 1
+            total_samples = packed & 0xFFFFFFFFF
+            info['sample_rate'] = sample_rate
+            info['channels'] = channels
+            info['bits_per_sample'] = bits
+            info['length'] = total_samples / sample_rate if sample_rate else 0.0
+            md5 = data[18:34].hex()
+            if int(md5, 16):
+                info['md5'] = md5
+        elif block_type == 4:
+            _parse_vorbis_comments(reader, tags, fields)
+        elif block_type == 6:
+            pictures += 1
+        elif block_type == 127:
+            raise FastTagError('invalid FLAC block')
+
+        f.seek(block_end)
+        if is_last:
+            break
+
+    # Битрейт считаем по размеру аудиоданных, как mutagen
+    audio_start = f.tell()
+    size = f.seek(0, 2)
+    if info.get('length'):
+        info['bitrate'] = int((size - audio_start) * 8 / info['length'])
+    info['pictures'] = pictures
+    return 'FLAC', tags, info
+
+
+def _decode_id3_text(data):
+    """Декодирует текстовый кадр ID3 (байт кодировки + строки через NUL)"""
+    encoding = data[0]
+    body = data[1:]
+    if encoding == 0:
+        parts = body.split(b'\x00')
+        text = [p.decode('latin-1') for p in parts]
+    elif encoding == 3:
+        parts = body.split(b'\x00')
+        text = [p.decode('utf-8', 'replace') for p in parts]
+    else:
+        codec = 'utf-16' if encoding == 1 else 'utf-16-be'
+        # Разделитель в UTF-16 - два нулевых байта на границе символа
+        parts = []
+        start = 0
+        for i in range(0, len(body) - 1, 2):
+            if body[i:i + 2] == b'\x00\x00':
+                parts.append(body[start:i])
+                start = i + 2
+        parts.append(body[start:])
+        text = [p.decode(codec, 'replace') for p in parts]
+    while text and text[-1] == '':
+        text.pop()
+    return text
+
+
+def _split_id3_string(encoding, data):
+    """Отделяет первую строку (до терминатора) от остатка данных"""
+    if encoding in (1, 2):
+        for i in range(0, len(data) - 1, 2):
+            if data[i:i + 2] == b'\x00\x00':
+                return data[:i], data[i + 2:]
+        return data, b''
+    head, _, rest = data.partition(b'\x00')
+    return head, rest
+
+
+def _read_id3_frames(f, tag_start, tags, fields):
+    """
+    Читает кадры тега ID3v2 по смещению tag_start
+    Нужные текстовые кадры декодируются, остальные пропускаются seek'ом
+    """
+    f.seek(tag_start)
+    header = f.read(10)
+    if len(header) != 10 or header[:3] != b'ID3':
+        return False
+
+    version = header[3]
+    flags = header[5]
+    tag_end = tag_start + 10 + _syncsafe(header[6:10])
+    if version not in (3, 4) or flags & 0x80:
+        # ID3v2.2 и unsync на уровне тега отдаем mutagen
+        raise FastTagError('unsupported ID3 layout')
+
+    if flags & 0x40:
+        # Расширенный заголовок
+        ext = _read_exact(f, 4)
+        ext_size = _syncsafe(ext) if version == 4 else struct.unpack('>I', ext)[0] + 4
+        f.seek(ext_size - 4, 1)
+
+    # v2.3: кадры, которые mutagen переименует, копятся отдельно
+    old_frames = {} if version == 3 else None
+
+    while f.tell() + 10 <= tag_end:
+        frame_header = f.read(10)
+        frame_id = frame_header[:4]
+        if frame_id[:1] == b'\x00':
+            break  # началась область заполнения
+        size = _syncsafe(frame_header[4:8]) if version == 4 else struct.unpack('>I', frame_header[4:8])[0]
+        frame_flags = struct.unpack('>H', frame_header[8:10])[0]
+        frame_end = f.tell() + size
+
+        key = frame_id.decode('latin-1')
+        text_frame = frame_id[:1] == b'T' or frame_id == b'COMM'
+        if frame_id in ID3_SKIP_FRAMES or not text_frame or size == 0 or \
+                (old_frames is not None and key in ID3_V23_DROPPED):
+            f.seek(frame_end)
+            continue
+
+        unsupported = ID3_V24_UNSUPPORTED if version == 4 else ID3_V23_UNSUPPORTED
+        if frame_flags & unsupported:
+            raise FastTagError('compressed or encrypted ID3 frame')
+        if version == 4 and frame_flags & 0x0001:
+            f.seek(4, 1)  # индикатор длины данных
+            size -= 4
+
+        if frame_id == b'TXXX':
+            data = _read_exact(f, size)
+            desc, rest = _split_id3_string(data[0], data[1:])
+            key = 'TXXX:' + _decode_id3_text(bytes([data[0]]) + desc)[0] if desc else 'TXXX:'
+            if _wanted(key, fields):
+                for value in _decode_id3_text(bytes([data[0]]) + rest):
+                    _add(tags, key, value)
+        elif frame_id == b'COMM':
+            data = _read_exact(f, size)
+            encoding, lang = data[0], data[1:4].decode('latin-1', 'replace')
+            desc, rest = _split_id3_string(encoding, data[4:])
+            desc_text = _decode_id3_text(bytes([encoding]) + desc)
+            key = f"COMM:{desc_text[0] if desc_text else ''}:{lang}"
+            if _wanted(key, fields):
+                for value in _decode_id3_text(bytes([encoding]) + rest):
+                    _add(tags, key, value)
+        elif old_frames is not None and key in ID3_V23_RENAMED:
+            if _wanted(ID3_V23_RENAMED[key], fields):
+                old_frames[key] = _decode_id3_text(_read_exact(f, size))
+        elif _wanted(key, fields):
+            for value in _decode_id3_text(_read_exact(f, size)):
+                _add(tags, key, value)
+
+        f.seek(frame_end)
+
+    if old_frames:
+        _update_to_v24(tags, old_frames)
+    for key in ID3_TIMESTAMP_FRAMES & tags.keys():
+        tags[key] = [ID3TimeStamp(value).text for value in tags[key]]
+    if 'TCON' in tags:
+        # Как mutagen: '(17)' и '(17)Rock' - в названия жанров
+        frame = TCON(encoding=3, text=tags['TCON'])
+        tags['TCON'] = frame.genres
+    return True
+
+
+def _update_to_v24(tags, old_frames):
+    """Кадры ID3v2.3 → v2.4 так же, как mutagen (ID3Tags.update_to_v24)"""
+    timestamps = []
+    for tyer, tdat, time in zip_longest(*(old_frames.get(n, []) for n in ('TYER', 'TDAT', 'TIME')),
+                                        fillvalue=''):
+        ym = re.match(r'([0-9]{4})(-[0-9]{2}-[0-9]{2})?\Z', tyer)
+        dm = re.match(r'([0-9]{2})([0-9]{2})\Z', tdat)
+        tm = re.match(r'([0-9]{2})([0-9]{2})\Z', time)
+        timestamp = ''
+        if ym:
+            year, month_day = ym.groups()
+            timestamp += year
+            if dm:
+                month_day = '-%s-%s' % dm.groups()[::-1]
+            if month_day:
+                timestamp += month_day
+                if tm:
+                    timestamp += 'T%s:%s:00' % tm.groups()
+        if timestamp:
+            timestamps.append(timestamp)
+    if timestamps and 'TDRC' not in tags:
+        tags['TDRC'] = timestamps
+    if 'TORY' in old_frames and 'TDOR' not in tags:
+        tags['TDOR'] = ['\x00'.join(old_frames['TORY'])]
+
+
+def _mp3_stream_info(f, offset, file_size):
+    """Частота, каналы, битрейт и длительность по первому кадру MPEG"""
+    f.seek(offset)
+    data = f.read(4096)
+    pos = data.find(b'\xff')
+    while 0 <= pos < len(data) - 4:
+        b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+        if (b1 & 0xE0) == 0xE0 and (b1 >> 1) & 0x03 == 1:
+            version = (b1 >> 3) & 0x03
+            bitrate_index = b2 >> 4
+            rate_index = (b2 >> 2) & 0x03
+            if version != 1 and 0 < bitrate_index < 15 and rate_index < 3:
+                mono = (b3 >> 6) == 3
+                bitrate = MP3_BITRATES[0 if version == 3 else 1][bitrate_index] * 1000
+                sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+                info = {'sample_rate': sample_rate, 'channels': 1 if mono else 2, 'bitrate': bitrate}
+
+                # Xing/Info-заголовок VBR-файла хранит число кадров
+                if version == 3:
+                    side = 17 if mono else 32
+                    samples_per_frame = 1152
+                else:
+                    side = 9 if mono else 17
+                    samples_per_frame = 576
+                xing = data[pos + 4 + side:pos + 4 + side + 12]
+                if xing[:4] in (b'Xing', b'Info') and xing[7] & 0x01:
+                    frames = struct.unpack('>I', xing[8:12])[0]
+                    info['length'] = frames * samples_per_frame / sample_rate
+                    if info['length']:
+                        info['bitrate'] = int((file_size - offset - pos) * 8 / info['length'])
+                else:
+                    info['length'] = (file_size - offset - pos) * 8 / bitrate
+                return info
+        pos = data.find(b'\xff', pos + 1)
+    return {}
+
+
+def _has_id3v1(f, file_size):
+    """
+    Есть ли ID3v1 в конце файла - тем же поиском, что mutagen (find_id3v1):
+    'TAG' в последних 131 байтах, от него до конца 124-128 байт, не хвост APEv2
+    """
+    f.seek(max(0, file_size - 131))
+    data = f.read()
+    pos = data.find(b'TAG')
+    if pos < 0 or not 124 <= len(data) - pos <= 128:
+        return False
+    ape = data.find(b'APETAGEX')
+    return ape < 0 or pos != ape + 3
+
+
+def read_mp3(f, fields=None):
+    """MP3: кадры ID3v2 в начале файла и заголовок первого кадра MPEG"""
+    tags = {}
+    file_size = f.seek(0, 2)
+    if _has_id3v1(f, file_size):
+        # mutagen дополняет v2 кадрами из ID3v1 - такой файл отдаем ему
+        raise FastTagError('ID3v1 tag')
+    _read_id3_frames(f, 0, tags, fields)
+
+    f.seek(0)
+    offset = _skip_id3_header(f)
+    return 'MP3', tags, _mp3_stream_info(f, offset, file_size)
+
+
+def _ieee_extended(data):
+    """80-битное число с плавающей точкой из заголовка AIFF"""
+    exponent = ((data[0] & 0x7F) << 8) | data[1]
+    mantissa = int.from_bytes(data[2:10], 'big')
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    return mantissa * 2.0 ** (exponent - 16383 - 63)
+
+
+def read_aiff(f, fields=None):
+    """AIFF: проходим IFF-чанки, ID3 разбираем, SSND пропускаем"""
+    header = _read_exact(f, 12)
+    if header[:4] != b'FORM' or header[8:12] not in (b'AIFF', b'AIFC'):
+        raise FastTagError('not an AIFF file')
+    form_end = 8 + struct.unpack('>I', header[4:8])[0]
+
+    tags = {}
+    info = {}
+    while f.tell() + 8 <= form_end:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id = chunk[:4]
+        size = struct.unpack('>I', chunk[4:8])[0]
+        start = f.tell()
+        if chunk_id == b'COMM':
+            data = _read_exact(f, 18)
+            channels, frames, bits = struct.unpack('>hLh', data[:8])
+            sample_rate = _ieee_extended(data[8:18])
+            info = {'channels': channels, 'bits_per_sample': bits, 'sample_rate': int(sample_rate)}
+            info['length'] = frames / sample_rate if sample_rate else 0.0
+            info['bitrate'] = int(channels * bits * sample_rate)
+        elif chunk_id in (b'ID3 ', b'id3 '):
+            _read_id3_frames(f, start, tags, fields)
+        # Чанки выровнены по четной границе
+        f.seek(start + size + (size & 1))
+
+    return 'AIFF', tags, info
+
+
+def _mp4_atoms(f, start, end):
+    """Перечисляет атомы (имя, начало данных, конец) в диапазоне"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, name = struct.unpack('>I4s', header)
+        data_start = pos + 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(f, 8))[0]
+            data_start += 8
+        elif size == 0:
+            size = end - pos
+        if size < 8:
+            raise FastTagError('invalid MP4 atom')
+        yield name, data_start, pos + size
+        pos += size
+
+
+def _mp4_item_values(f, name, start, end):
+    """Значения одного элемента ilst (текст, номера трека/диска, gnre)"""
+    values = []
+    for atom_name, data_start, data_end in _mp4_atoms(f, start, end):
+        if atom_name != b'data':
+            continue
+        f.seek(data_start)
+        header = _read_exact(f, 8)
+        data_type = int.from_bytes(header[1:4], 'big')
+        payload = _read_exact(f, data_end - data_start - 8)
+        if data_type == 1:
+            values.append(payload.decode('utf-8', 'replace'))
+        elif name in (b'trkn', b'disk') and len(payload) >= 6:
+            number, total = struct.unpack('>HH', payload[2:6])
+            values.append(f'{number}/{total}')
+        elif name == b'gnre' and len(payload) >= 2:
+            index = struct.unpack('>H', payload[:2])[0] - 1
+            if 0 <= index < len(GENRES):
+                values.append(GENRES[index])
+        elif data_type == 21 and payload:
+            values.append(str(int.from_bytes(payload, 'big', signed=True)))
+    return values
+
+
+def _mp4_freeform(f, start, end, fields):
+    """
+    Элемент '----' (mean, name, data): ключ как у mutagen '----:mean:name'
+    и текстовые значения (UTF-8/UTF-16); бинарные mutagen тоже не отдает
+    """
+    mean = name = None
+    values = []
+    for atom_name, data_start, data_end in _mp4_atoms(f, start, end):
+        f.seek(data_start)
+        if atom_name in (b'mean', b'name'):
+            # Полный атом: 4 байта версии и флагов, дальше строка
+            text = _read_exact(f, data_end - data_start)[4:].decode('utf-8', 'replace')
+            if atom_name == b'mean':
+                mean = text
+            else:
+                name = text
+        elif atom_name == b'data':
+            header = _read_exact(f, 8)
+            data_type = int.from_bytes(header[1:4], 'big')
+            if data_type in (1, 2):
+                payload = _read_exact(f, data_end - data_start - 8)
+                values.append(payload.decode('utf-8' if data_type == 1 else 'utf-16-be', 'replace'))
+    if mean is None or name is None:
+        raise FastTagError('invalid MP4 freeform atom')
+    key = f'----:{mean}:{name}'
+    return key, values if _wanted(key, fields) else []
+
+
+def read_mp4(f, fields=None):
+    """MP4: moov -> udta -> meta -> ilst, covr и mdat не читаем"""
+    file_size = f.seek(0, 2)
+    tags = {}
+    info = {}
+
+    for name, start, end in _mp4_atoms(f, 0, file_size):
+        if name != b'moov':
+            continue
+        for child, child_start, child_end in _mp4_atoms(f, start, end):
+            if child == b'mvhd':
+                f.seek(child_start)
+                version = _read_exact(f, 4)[0]
+                if version == 1:
+                    f.seek(16, 1)
+                    timescale, duration = struct.unpack('>IQ', _read_exact(f, 12))
+                else:
+                    f.seek(8, 1)
+                    timescale, duration = struct.unpack('>II', _read_exact(f, 8))
+                if timescale:
+                    info['length'] = duration / timescale
+            elif child == b'udta':
+                for meta, meta_start, meta_end in _mp4_atoms(f, child_start, child_end):
+                    if meta != b'meta':
+                        continue
+                    # meta - "полный" атом: 4 байта версии и флагов
+                    for ilst, ilst_start, ilst_end in _mp4_atoms(f, meta_start + 4, meta_end):
+                        if ilst != b'ilst':
+                            continue
+                        for item, item_start, item_end in _mp4_atoms(f, ilst_start, ilst_end):
+                            if item == b'covr':
+                                continue
+                            if item == b'----':
+                                key, values = _mp4_freeform(f, item_start, item_end, fields)
+                                for value in values:
+                                    _add(tags, key, value)
+                                continue
+                            key = '©gen' if item == b'gnre' else item.decode('latin-1')
+                            if not _wanted(key, fields):
+                                continue
+                            for value in _mp4_item_values(f, item, item_start, item_end):
+                                _add(tags, key, value)
+        break
+    else:
+        raise FastTagError('moov atom not found')
+
+    return 'MP4', tags, info
+
+
+class _OggReader:
+    """
+    Читает полезную нагрузку страниц Ogg как непрерывный поток,
+    прозрачно переходя через границы страниц
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.remaining = 0
+        self.granule = 0
+        self.serial = None
+
+    def next_page(self):
+        header = _read_exact(self.f, 27)
+        if header[:4] != b'OggS':
+            raise FastTagError('lost Ogg sync')
+        self.granule = struct.unpack('<q', header[6:14])[0]
+        self.serial = struct.unpack('<I', header[14:18])[0]
+        segments = _read_exact(self.f, header[26])
+        self.remaining = sum(segments)
+        return segments
+
+    def read(self, size):
+        chunks = []
+        while size > 0:
+            if self.remaining == 0:
+                self.next_page()
+                continue
+            chunk = _read_exact(self.f, min(size, self.remaining))
+            self.remaining -= len(chunk)
+            size -= len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def skip(self, size):
+        while size > 0:
+            if self.remaining == 0:
+                self.next_page()
+                continue
+            step = min(size, self.remaining)
+            self.f.seek(step, 1)
+            self.remaining -= step
+            size -= step
+
+
+def _ogg_page_valid(page):
+    """Версия 0 и CRC страницы совпадает (поле CRC при подсчете - нули)"""
+    if page[4] != 0:
+        return False
+    crc = (~zlib.crc32((page[:22] + b'\x00' * 4 + page[26:]).translate(OGG_BITSWAP), -1)) & 0xFFFFFFFF
+    return crc.to_bytes(4, 'big').translate(OGG_BITSWAP) == page[22:26]
+
+
+def _ogg_last_granule(f, serial):
+    """
+    Позиция последней страницы - по ней считается длительность
+    'OggS' может встретиться и внутри аудиоданных, поэтому страница
+    проверяется по версии и CRC. Как и mutagen, берем ее, только если это
+    последняя страница нашего потока; иначе (мультиплекс, обрезанный
+    файл) - FastTagError, длительность посчитает mutagen
+    """
+    size = f.seek(0, 2)
+    f.seek(max(0, size - 65536))
+    tail = f.read()
+    pos = tail.rfind(b'OggS')
+    while pos >= 0:
+        if pos + OGG_PAGE_HEADER.size <= len(tail):
+            _, _, flags, granule, page_serial, _, _, count = OGG_PAGE_HEADER.unpack_from(tail, pos)
+            body = pos + OGG_PAGE_HEADER.size + count
+            end = body + sum(tail[pos + OGG_PAGE_HEADER.size:body])
+            if end <= len(tail) and _ogg_page_valid(tail[pos:end]):
+                if page_serial == serial and flags & OGG_LAST_PAGE and granule != -1:
+                    return granule
+                break
+        pos = tail.rfind(b'OggS', 0, pos)
+    raise FastTagError('last Ogg page not found')
+
+
+def read_ogg(f, fields=None):
+    """OGG/OPUS: пакет идентификации и первый пакет комментариев"""
+    # Пакет идентификации всегда занимает первую страницу целиком
+    reader = _OggReader(f)
+    reader.next_page()
+    serial = reader.serial
+    ident = reader.read(reader.remaining)
+
+    tags = {}
+    if ident.startswith(b'\x01vorbis'):
+        channels, sample_rate, _, nominal, _ = struct.unpack('<BI3i', ident[11:28])
+        info = {'channels': channels, 'sample_rate': sample_rate, 'bitrate': max(0, nominal)}
+        reader.next_page()
+        if reader.read(7) != b'\x03vorbis':
+            raise FastTagError('comment packet not found')
+        _parse_vorbis_comments(reader, tags, fields)
+        granule = _ogg_last_granule(f, serial)
+        info['length'] = granule / sample_rate if sample_rate else 0.0
+        return 'OggVorbis', tags, info
+
+    if ident.startswith(b'OpusHead'):
+        channels = ident[9]
+        pre_skip = struct.unpack('<H', ident[10:12])[0]
+        info = {'channels': channels, 'sample_rate': 48000}
+        reader.next_page()
+        if reader.read(8) != b'OpusTags':
+            raise FastTagError('comment packet not found')
+        _parse_vorbis_comments(reader, tags, fields)
+        granule = _ogg_last_granule(f, serial)
+        info['length'] = max(0, granule - pre_skip) / 48000.0
+        return 'OggOpus', tags, info
+
+    raise FastTagError('unsupported Ogg codec')
+
+
+# Чтение по формату, определенному по содержимому (format_sniff)
+FORMAT_READERS = {
+    'FLAC': read_flac,
+    'MP3': read_mp3,
+    'MP4': read_mp4,
+    'OggVorbis': read_ogg,
+    'OggOpus': read_ogg,
+    'AIFF': read_aiff,
+}
+# Расширения, которые умеем читать (для поиска файлов)
+READERS = {
+    '.flac': read_flac,
+    '.mp3': read_mp3,
+    '.m4a': read_mp4,
+    '.mp4': read_mp4,
+    '.ogg': read_ogg,
+    '.opus': read_ogg,
+    '.aiff': read_aiff,
+    '.aif': read_aiff,
+}
+
+
+def read_tags(path, fields=None):
+    """
+    Быстро читает теги файла (формат - по первым байтам, а не по расширению)
+    fields - набор нужных ключей (например {'GENRE', 'TCON', '©gen'}),
+    None - все текстовые теги
+    Возвращает запись {'format', 'tags', 'info'} или None,
+    если формат не поддерживается или структура нестандартная
+    """
+    try:
+        reader = FORMAT_READERS.get(detect_format(path))
+    except OSError:
+        return None
+    if reader is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            fmt, tags, info = reader(f, fields)
+    except (FastTagError, struct.error, IndexError, ValueError):
+        return None
+    return {'format': fmt, 'tags': tags, 'info': info}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Запись метаданных FLAC на месте, за счет блока PADDING
+Если новые блоки (VORBIS_COMMENT, PICTURE, ...) помещаются в старую
+область метаданных вместе с PADDING - переписывается только она,
+аудиоданные не трогаются. Иначе файл переписывается целиком, но с
+запасом padding_budget байт, чтобы следующие правки снова шли на месте.
+
+Запас по умолчанию - 64 КБ, меняется переменной MUSIC_TOOLS_FLAC_PADDING
+
+Для копии на другой диск новые метаданные можно собрать без записи
+(plan_metadata) и вписать прямо в копию (move_engine.copy_data с header)
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+DEFAULT_PADDING_BUDGET = int(os.environ.get('MUSIC_TOOLS_FLAC_PADDING', 64 * 1024))
+
+# Итог записи одного файла
+WriteReport = namedtuple('WriteReport', ['path', 'in_place', 'bytes_written', 'padding'])
+
+# Новая область метаданных без записи: байты (ID3v2, если был, 'fLaC' и блоки), где в исходнике
+# лежат аудиоданные, поместятся ли блоки на место старых
+MetadataPlan = namedtuple('MetadataPlan', ['data', 'audio_offset', 'audio_end', 'in_place'])
+
+# Коды блоков и предел длины (24 бита) из спецификации FLAC
+PADDING_CODE = 1
+MAX_BLOCK_SIZE = 0xFFFFFF
+
+# Заголовок блока PICTURE без самого изображения; offset/length - где лежат данные картинки
+PictureHeader = namedtuple('PictureHeader', ['type', 'mime', 'desc', 'width', 'height', 'offset', 'length'])
+
+
+def metadata_end(path):
+    """
+    Возвращает (начало 'fLaC', смещение аудиоданных, длина PADDING)
+    Читаются только заголовки блоков
+    """
+    with open(path, 'rb') as f:
+        start = 0
+        header = f.read(10)
+        if header[:3] == b'ID3':
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            start = 10 + size + (10 if header[5] & 0x10 else 0)
+        f.seek(start + 4)
+
+        padding = 0
+        while True:
+            block = f.read(4)
+            if len(block) < 4:
+                raise ValueError(f"truncated FLAC metadata: {path}")
+            length = int.from_bytes(block[1:4], 'big')
+            if block[0] & 0x7F == 1:
+                padding += length
+            f.seek(length, 1)
+            if block[0] & 0x80:
+                return start, f.tell(), padding
+
+
+def picture_headers(path):
+    """
+    Описания всех блоков PICTURE файла (PictureHeader)
+    Данные изображений не читаются - только их смещение и длина
+    """
+    pictures = []
+    with open(path, 'rb') as f:
+        start = 0
+        header = f.read(10)
+        if header[:3] == b'ID3':
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            start = 10 + size + (10 if header[5] & 0x10 else 0)
+        f.seek(start)
+        if f.read(4) != b'fLaC':
+            raise ValueError(f"not a FLAC file: {path}")
+
+        while True:
+            block = f.read(4)
+            if len(block) < 4:
+                raise ValueError(f"truncated FLAC metadata: {path}")
+            length = int.from_bytes(block[1:4], 'big')
+            block_end = f.tell() + length
+            if block[0] & 0x7F == 6:
+                pic_type, mime_length = struct.unpack('>II', f.read(8))
+                mime = f.read(mime_length).decode('ascii', 'replace')
+                desc = f.read(struct.unpack('>I', f.read(4))[0]).decode('utf-8', 'replace')
+                width, height, _, _, data_length = struct.unpack('>IIIII', f.read(20))
+                pictures.append(PictureHeader(pic_type, mime, desc, width, height, f.tell(), data_length))
+            f.seek(block_end)
+            if block[0] & 0x80:
+                return pictures
+
+
+def save_flac(audio, padding_budget=None, max_padding=None):
+    """
+    Сохраняет объект mutagen FLAC, по возможности не сдвигая аудиоданные
+    max_padding - если на месте останется больше PADDING (например, удалили
+    обложку), файл переписывается с запасом padding_budget, чтобы он уменьшился
+    Возвращает WriteReport: in_place, сколько байт записано и итоговый PADDING
+    """
+    budget = DEFAULT_PADDING_BUDGET if padding_budget is None else padding_budget
+    state = {}
+
+    def choose_padding(info):
+        # info.padding - сколько места останется после новых блоков,
+        # info.size - объем аудиоданных за метаданными
+        state['audio_size'] = info.size
+        if info.padding >= 0 and (max_padding is None or info.padding <= max_padding):
+            state['in_place'] = True
+            return info.padding
+        state['in_place'] = False
+        return budget
+
+    audio.save(padding=choose_padding)
+
+    start, audio_offset, padding = metadata_end(audio.filename)
+    written = audio_offset - start
+    if not state.get('in_place', True):
+        # При перезаписи сдвигаются и все аудиоданные
+        written += state.get('audio_size', 0)
+    return WriteReport(audio.filename, state.get('in_place', True), written, padding)
+
+
+def _block(code, data, last=False):
+    """Блок метаданных с заголовком: код (старший бит - последний блок) и длина"""
+    return bytes([code | 0x80 if last else code]) + len(data).to_bytes(3, 'big') + data
+
+
+def plan_metadata(audio, padding_budget=None):
+    """
+    Собирает новую область метаданных из объекта mutagen FLAC, ничего не записывая
+    Как и FLAC.save(), оставляет ID3v2 в начале и ID3v1 в конце файла
+    in_place=True - блоки помещаются в старую область, файл выгоднее править на месте
+    Возвращает MetadataPlan или None, если блок не укладывается в формат
+    (такой файл пусть пишет сам mutagen)
+    """
+    budget = DEFAULT_PADDING_BUDGET if padding_budget is None else padding_budget
+    start, audio_offset, _ = metadata_end(audio.filename)
+    audio_end = os.path.getsize(audio.filename)
+    with open(audio.filename, 'rb') as f:
+        prefix = f.read(start)
+
+    # Блоки собираем сами через публичный block.write(): PADDING - один, в конце
+    blocks = []
+    for block in audio.metadata_blocks:
+        if block.code == PADDING_CODE:
+            continue
+        data = block.write()
+        if len(data) > MAX_BLOCK_SIZE:
+            return None
+        blocks.append(_block(block.code, data))
+
+    # Место под блоки - от 'fLaC' до аудиоданных, как в FLAC.save
+    available = audio_offset - start - 4
+    in_place = sum(len(block) for block in blocks) + 4 <= available
+    blocks.append(_block(PADDING_CODE, bytes(min(budget, MAX_BLOCK_SIZE)), last=True))
+    return MetadataPlan(prefix + b'fLaC' + b''.join(blocks), audio_offset, audio_end, in_place)
+
+
+def format_report(report):
+    """Короткая строка для вывода: сколько записано и каким способом"""
+    how = "на месте" if report.in_place else "файл переписан"
+    return f"{report.bytes_written / 1024:.1f} КБ, {how}, запас {report.padding / 1024:.0f} КБ"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Индекс папок вывода в памяти для быстрого поиска похожих папок
+Строится один раз за сессию (один scandir) и пополняется при создании
+новых папок, поэтому запрос не трогает диск (важно на NFS).
+
+Имена нормализуются: регистр, пунктуация, лишние пробелы и ведущие '_'
+не учитываются. Похожесть - коэффициент Дайса по триграммам плюс бонус,
+если одно имя целиком входит в другое (прежнее поведение поиска).
+"""
+
+import re
+import threading
+from collections import defaultdict
+
+from discovery import list_subdirectories
+
+# Ниже этого порога папка не считается похожей
+DEFAULT_MIN_SCORE = 0.35
+
+# Бонус за вхождение одного нормализованного имени в другое
+CONTAINS_BONUS = 0.5
+
+_PUNCTUATION = re.compile(r'[\W_]+')
+
+
+def normalize(name):
+    """'_Drum-n-Bass ' → 'drum n bass'"""
+    return _PUNCTUATION.sub(' ', name.lstrip('_').casefold()).strip()
+
+
+def trigrams(normalized):
+    """Множество триграмм с отступами по краям (короткие имена тоже дают триграммы)"""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FolderIndex:
+    """
+    Имена подпапок одной папки вывода с триграммным индексом
+    Потокобезопасен: запросы идут из потоков предзагрузки,
+    добавление - из основного потока
+    """
+
+    def __init__(self, base_path=None, names=()):
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        self._names = {}                     # имя → нормализованное имя
+        self._grams = {}                     # имя → множество триграмм
+        self._postings = defaultdict(set)    # триграмма → имена
+        if base_path is not None:
+            names = [folder.name for folder in list_subdirectories(base_path)]
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def names(self):
+        with self._lock:
+            return set(self._names)
+
+    def add(self, name):
+        """Добавляет папку (после создания); повторное добавление ничего не делает"""
+        with self._lock:
+            if name in self._names:
+                return
+            normalized = normalize(name)
+            grams = trigrams(normalized)
+            self._names[name] = normalized
+            self._grams[name] = grams
+            for gram in grams:
+                self._postings[gram].add(name)
+
+    def similar(self, genre, limit=5, min_score=DEFAULT_MIN_SCORE):
+        """
+        Папки, похожие на жанр, по убыванию похожести
+        Возвращает список имен (не больше limit)
+        """
+        query = normalize(genre)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+
+        with self._lock:
+            shared = defaultdict(int)
+            for gram in query_grams:
+                for name in self._postings.get(gram, ()):
+                    shared[name] += 1
+
+            scored = []
+            for name, common in shared.items():
+                normalized = self._names[name]
+                score = 2.0 * common / (len(query_grams) + len(self._grams[name]))
+                if query in normalized or normalized in query:
+                    score += CONTAINS_BONUS
+                if score >= min_score:
+                    scored.append((-score, name))
+
+        scored.sort()
+        return [name for _, name in scored[:limit]]
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Наблюдение за входящей папкой: новые аудиофайлы отдаются пачками,
+когда они перестали расти
+
+На Linux - inotify (через ctypes, без зависимостей): между событиями процесс
+спит в select и не тратит CPU. Если inotify недоступен (другая ОС, кончились
+watch-и, сетевая ФС) - опрос папки одним scandir раз в poll_interval секунд.
+
+Файл считается дописанным, когда по нему settle секунд не было событий
+и размер с mtime не изменились между двумя stat. Готовые файлы копятся,
+пока приходят новые (пачка), и отдаются, когда поток затих, пачка
+набрала max_batch файлов или самый старый готовый ждет max_wait секунд.
+
+Смотрим только сам корень папки (как find_audio_files), вложенные папки - нет.
+
+Использование:
+    with FolderWatcher(search_dir) as watcher:
+        while True:
+            files = watcher.next_batch()      # блокируется до готовой пачки
+            ...
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from discovery import iter_audio_entries, AUDIO_EXTENSIONS
+
+# Сколько секунд файл должен не меняться, чтобы считаться дописанным
+DEFAULT_SETTLE = 2.0
+# Период опроса, если inotify недоступен
+DEFAULT_POLL_INTERVAL = 5.0
+# Предел пачки: столько файлов или столько секунд ожидания самого старого
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_WAIT = 30.0
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+GONE_MASK = IN_MOVED_FROM | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class WatchError(Exception):
+    """Папку нельзя наблюдать (удалена, нет доступа)"""
+
+
+class _Inotify:
+    """Минимальная обертка над inotify: fileno() для select и read() → [(маска, имя)]"""
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, os.strerror(err), str(path))
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """Все накопившиеся события (не блокируется)"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((mask, os.fsdecode(name)))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FolderWatcher:
+    """
+    Дописанные аудиофайлы в корне папки, пачками
+
+    initial - сразу отдать файлы, которые уже лежат в папке (тоже после settle)
+    use_inotify=False - только опрос (для сетевых ФС, где inotify молчит)
+    """
+
+    def __init__(self, path, extensions=AUDIO_EXTENSIONS, settle=DEFAULT_SETTLE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, max_batch=DEFAULT_MAX_BATCH,
+                 max_wait=DEFAULT_MAX_WAIT, initial=True, use_inotify=True):
+        self.path = Path(path)
+        if not self.path.is_dir():
+            raise WatchError(f"not a directory: {self.path}")
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = {}    # путь → (размер, mtime_ns, время последнего изменения)
+        self.ready = {}      # путь → когда стал готов
+        self.known = {}      # путь → (размер, mtime_ns) при последнем проходе (опрос)
+        self.inotify = None
+        self.backend = 'polling'
+        if use_inotify:
+            try:
+                self.inotify = _Inotify(self.path)
+                self.backend = 'inotify'
+            except (OSError, AttributeError):
+                self.inotify = None
+        self._next_poll = 0.0
+        self._scan(initial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _wanted(self, name):
+        return not name.startswith('.') and os.path.splitext(name)[1].lower() in self.extensions
+
+    def _scan(self, report=True):
+        """
+        Один scandir корня: новые и изменившиеся файлы - в ожидание
+        report=False - только запомнить, что уже лежит (без initial)
+        """
+        seen = {}
+        for entry in iter_audio_entries(self.path, self.extensions, max_depth=0):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            path = Path(entry.path)
+            seen[path] = (st.st_size, st.st_mtime_ns)
+            if report and self.known.get(path) != seen[path]:
+                self._touch(path)
+        for path in set(self.known) - set(seen):
+            self._forget(path)
+        self.known = seen
+
+    def _touch(self, path):
+        """Файл появился или изменился - ждем settle секунд тишины"""
+        self.ready.pop(path, None)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._forget(path)
+            return
+        self.pending[path] = (st.st_size, st.st_mtime_ns, time.monotonic())
+
+    def _forget(self, path):
+        self.pending.pop(path, None)
+        self.ready.pop(path, None)
+
+    def _handle_events(self):
+        for mask, name in self.inotify.read():
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                raise WatchError(f"watched directory is gone: {self.path}")
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнилась - события потеряны, сверяемся с диском
+                self.known = {}
+                self._scan()
+                continue
+            if not name or not self._wanted(name):
+                continue
+            path = self.path / name
+            if mask & GONE_MASK:
+                self._forget(path)
+            else:
+                self._touch(path)
+
+    def _check_settled(self, now):
+        """Файлы без изменений settle секунд: stat еще раз, не вырос - готов"""
+        for path, (size, mtime_ns, changed) in list(self.pending.items()):
+            if now - changed < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._forget(path)
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                # Растет без событий (сетевая ФС) - ждем еще
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            del self.pending[path]
+            self.ready[path] = now
+
+    def _batch_due(self, now):
+        if not self.ready:
+            return False
+        if not self.pending or len(self.ready) >= self.max_batch:
+            return True
+        return now - min(self.ready.values()) >= self.max_wait
+
+    def _timeout(self, now):
+        """Сколько можно спать до следующей проверки (None - до события)"""
+        deadlines = [changed + self.settle for _, _, changed in self.pending.values()]
+        if self.ready:
+            deadlines.append(min(self.ready.values()) + self.max_wait)
+        if self.inotify is None:
+            deadlines.append(self._next_poll)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def next_batch(self, timeout=None):
+        """
+        Блокируется до готовой пачки; возвращает отсортированный список путей
+        timeout - не ждать дольше (секунд), тогда может вернуть пустой список
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if self.inotify is None and now >= self._next_poll:
+                self._scan()
+                self._next_poll = now + self.poll_interval
+            self._check_settled(now)
+            if self._batch_due(now):
+                batch = sorted(self.ready)[:self.max_batch]
+                for path in batch:
+                    del self.ready[path]
+                return batch
+
+            wait = self._timeout(now)
+            if deadline is not None:
+                left = max(0.0, deadline - now)
+                if left == 0:
+                    return []
+                wait = left if wait is None else min(wait, left)
+            if self.inotify is None:
+                time.sleep(wait)
+                continue
+            readable, _, _ = select.select([self.inotify], [], [], wait)
+            if readable:
+                self._handle_events()
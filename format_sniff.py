@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Определение формата аудиофайла по первым байтам, а не по расширению
+
+fLaC                          → FLAC (в том числе после тега ID3v2)
+ID3 / синхрослово кадра MPEG  → MP3
+....ftyp                      → MP4
+OggS + заголовок кодека       → OggVorbis / OggOpus / OggFLAC
+FORM....AIFF / AIFC           → AIFF
+
+Результат запоминается в памяти (путь, размер, mtime), поэтому каждый файл
+читается для определения один раз. Файлы, у которых расширение не совпадает
+с содержимым, печатаются в stderr один раз и собираются в mismatches.
+"""
+
+import os
+import sys
+import threading
+
+from mutagen import File as MutagenFile
+from mutagen.aiff import AIFF
+from mutagen.flac import FLAC
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+from mutagen.oggflac import OggFLAC
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
+
+# Сколько байт читать с начала файла
+SNIFF_BYTES = 64
+
+# Формат (имя класса mutagen, как в каталоге тегов) → класс
+MUTAGEN_CLASSES = {
+    'FLAC': FLAC,
+    'MP3': MP3,
+    'MP4': MP4,
+    'OggVorbis': OggVorbis,
+    'OggOpus': OggOpus,
+    'OggFLAC': OggFLAC,
+    'AIFF': AIFF,
+}
+
+# Какие форматы ожидаются для расширения
+EXTENSION_FORMATS = {
+    '.flac': {'FLAC'},
+    '.mp3': {'MP3'},
+    '.m4a': {'MP4'},
+    '.mp4': {'MP4'},
+    '.ogg': {'OggVorbis', 'OggOpus', 'OggFLAC'},
+    '.opus': {'OggOpus'},
+    '.aiff': {'AIFF'},
+    '.aif': {'AIFF'},
+}
+
+_cache = {}
+_lock = threading.Lock()
+mismatches = {}    # путь → (расширение, формат)
+stats = {'sniffed': 0, 'cached': 0}
+
+
+def _id3_size(header):
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _ogg_codec(header):
+    """Кодек по первому пакету первой страницы Ogg"""
+    if len(header) < 27:
+        return None
+    packet = header[27 + header[26]:]
+    if packet.startswith(b'\x01vorbis'):
+        return 'OggVorbis'
+    if packet.startswith(b'OpusHead'):
+        return 'OggOpus'
+    if packet.startswith(b'\x7fFLAC'):
+        return 'OggFLAC'
+    return None
+
+
+def _is_mpeg_frame(header):
+    # Синхрослово 11 бит, версия и слой не зарезервированы
+    return len(header) >= 2 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0 \
+        and (header[1] & 0x18) != 0x08 and (header[1] & 0x06) != 0
+
+
+def sniff_header(f):
+    """Формат по первым байтам открытого файла или None"""
+    f.seek(0)
+    header = f.read(SNIFF_BYTES)
+    if header[:3] == b'ID3' and len(header) >= 10:
+        # За ID3v2 может оказаться FLAC
+        f.seek(_id3_size(header))
+        return 'FLAC' if f.read(4) == b'fLaC' else 'MP3'
+    if header[:4] == b'fLaC':
+        return 'FLAC'
+    if header[4:8] == b'ftyp':
+        return 'MP4'
+    if header[:4] == b'OggS':
+        return _ogg_codec(header)
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'AIFF'
+    if _is_mpeg_frame(header):
+        return 'MP3'
+    return None
+
+
+def detect_format(path):
+    """
+    Формат файла ('FLAC', 'MP3', ...) или None, если не распознан
+    Повторные вызовы для неизмененного файла не читают диск
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    signature = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == signature:
+            stats['cached'] += 1
+            return cached[1]
+
+    with open(key, 'rb') as f:
+        fmt = sniff_header(f)
+
+    ext = os.path.splitext(key)[1].lower()
+    expected = EXTENSION_FORMATS.get(ext)
+    with _lock:
+        stats['sniffed'] += 1
+        _cache[key] = (signature, fmt)
+        if fmt and expected and fmt not in expected and key not in mismatches:
+            mismatches[key] = (ext, fmt)
+            print(f"⚠️  Расширение не совпадает с содержимым: {key} ({ext}, на деле {fmt})", file=sys.stderr)
+    return fmt
+
+
+def open_audio(path):
+    """
+    Открывает файл нужным классом mutagen с первой попытки
+    Нераспознанные файлы - через mutagen.File (перебор форматов)
+    """
+    try:
+        fmt = detect_format(path)
+    except OSError:
+        fmt = None
+    audio_class = MUTAGEN_CLASSES.get(fmt)
+    if audio_class is None:
+        return MutagenFile(str(path))
+    return audio_class(str(path))
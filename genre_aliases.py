@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Канонизация жанров и постоянная таблица псевдонимов жанр → папка
+
+Очистка сырого жанра ('House/Deep' → 'House', запрещенные символы, пробелы)
+и ключ сравнения ('Drum & Bass', 'drum n bass', '_Drum-and-Bass' → 'drum bass')
+запоминаются, поэтому каждая уникальная строка обрабатывается один раз.
+
+Решения оператора (какой папке соответствует жанр) сохраняются в JSON
+и при следующих запусках применяются без вопроса:
+{
+    "version": 1,
+    "aliases": {
+        "drum bass": {"folder": "DnB", "genres": ["Drum & Bass", "drum n bass"],
+                      "source": "operator", "time": "2024-05-01T12:00:00"}
+    }
+}
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from folder_index import normalize
+
+ALIASES_VERSION = 1
+
+# Слова-связки, которые не различают жанры: 'drum & bass' = 'drum n bass' = 'drum and bass'
+_CONNECTORS = frozenset({'n', 'and', 'y', 'et', 'und'})
+
+
+@lru_cache(maxsize=None)
+def clean_genre(raw):
+    """
+    Очищает сырой жанр из тега для использования как имя папки
+    Возвращает None для пустого жанра
+    """
+    if not raw:
+        return None
+    # Берем только первую часть до '/'
+    genre = raw.split('/')[0].strip()
+    # Убираем недопустимые символы для имен папок и лишние пробелы
+    genre = re.sub(r'[<>:"\\|?*]', '_', genre)
+    genre = re.sub(r'\s+', ' ', genre)
+    return genre or None
+
+
+@lru_cache(maxsize=None)
+def genre_key(genre):
+    """Ключ сравнения жанров: регистр, пунктуация, '_' в начале и связки не важны"""
+    words = normalize(genre).split()
+    return ' '.join(word for word in words if word not in _CONNECTORS) or ' '.join(words)
+
+
+class AliasTable:
+    """
+    Таблица ключ жанра → папка, хранится в JSON-файле
+    save=False - только в памяти (dry-run)
+    """
+
+    def __init__(self, path, save=True):
+        self.path = Path(path)
+        self.autosave = save
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._aliases = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Не удалось прочитать таблицу псевдонимов {self.path}: {e}")
+            return
+        if data.get('version') != ALIASES_VERSION:
+            print(f"⚠️  Неизвестная версия таблицы псевдонимов {self.path}, начинаю заново")
+            return
+        self._aliases = data.get('aliases', {})
+
+    def __len__(self):
+        return len(self._aliases)
+
+    def __contains__(self, genre):
+        """Есть ли решение для жанра (без учета в статистике)"""
+        return bool(genre) and genre_key(genre) in self._aliases
+
+    def lookup(self, genre):
+        """Папка, ранее выбранная для этого жанра (или похожего написания), либо None"""
+        if not genre:
+            return None
+        entry = self._aliases.get(genre_key(genre))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['folder']
+
+    def record(self, genre, folder, source='operator'):
+        """Запоминает решение жанр → папка и сразу сохраняет таблицу"""
+        if not genre or not folder:
+            return
+        with self._lock:
+            key = genre_key(genre)
+            entry = self._aliases.get(key)
+            if entry is None or entry['folder'] != folder:
+                entry = self._aliases[key] = {'folder': folder, 'genres': [], 'source': source}
+            if genre not in entry['genres']:
+                entry['genres'].append(genre)
+            entry['time'] = datetime.now().isoformat(timespec='seconds')
+            if self.autosave:
+                self.save()
+
+    def save(self):
+        """Атомарная запись: во временный файл и переименование"""
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': ALIASES_VERSION, 'aliases': self._aliases}, f,
+                      ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
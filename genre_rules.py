@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Правила сопоставления жанр → папка для пакетного (неинтерактивного) режима
+
+Файл правил - JSON:
+{
+    "exact": {"Drum & Bass": "DnB"},
+    "case_insensitive": {"deep house": "House"},
+    "regex": [
+        {"pattern": "^tech", "folder": "Techno"},
+        {"pattern": "d(rum)?\\\\s*(n|&|and)\\\\s*b(ass)?", "folder": "DnB"}
+    ],
+    "default": "_Unsorted",
+    "no_genre": "Unknown"
+}
+
+Порядок проверки: exact → case_insensitive → regex (первое совпадение,
+регистр не важен) → существующая папка с именем жанра → default.
+Если ничего не подошло - None (файл уходит в очередь на разбор).
+"""
+
+import json
+import re
+
+
+class RulesError(Exception):
+    """Ошибка в файле правил"""
+
+
+class GenreRules:
+    """
+    Скомпилированный набор правил жанр → папка
+    """
+
+    def __init__(self, exact=None, case_insensitive=None, regex=None, default=None, no_genre=None):
+        self.exact = dict(exact or {})
+        self.case_insensitive = {k.casefold(): v for k, v in (case_insensitive or {}).items()}
+        self.regex = []
+        for rule in regex or []:
+            if isinstance(rule, dict):
+                pattern, folder = rule.get('pattern'), rule.get('folder')
+            else:
+                pattern, folder = rule
+            if not pattern or not folder:
+                raise RulesError(f"regex rule needs 'pattern' and 'folder': {rule!r}")
+            try:
+                self.regex.append((re.compile(pattern, re.IGNORECASE), folder))
+            except re.error as e:
+                raise RulesError(f"bad regex {pattern!r}: {e}")
+        self.default = default
+        self.no_genre = no_genre
+
+    @classmethod
+    def load(cls, path):
+        """Загружает правила из JSON-файла"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RulesError(f"cannot read rules file {path}: {e}")
+        if not isinstance(data, dict):
+            raise RulesError("rules file must contain a JSON object")
+        unknown = set(data) - {'exact', 'case_insensitive', 'regex', 'default', 'no_genre'}
+        if unknown:
+            raise RulesError(f"unknown keys in rules file: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def resolve(self, genre, existing_folders=()):
+        """
+        Возвращает (папка, правило) для жанра или (None, None)
+        existing_folders - имена уже существующих папок вывода
+        """
+        if not genre:
+            return (self.no_genre, 'no_genre') if self.no_genre else (None, None)
+
+        if genre in self.exact:
+            return self.exact[genre], 'exact'
+
+        folder = self.case_insensitive.get(genre.casefold())
+        if folder:
+            return folder, 'case_insensitive'
+
+        for pattern, folder in self.regex:
+            if pattern.search(genre):
+                return folder, 'regex'
+
+        if genre in existing_folders:
+            return genre, 'existing'
+
+        if self.default:
+            return self.default, 'default'
+
+        return None, None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Общая инструментовка скриптов: таймеры и счетчики по стадиям, гистограммы
+задержек, строка прогресса, метрики в JSON при выходе и cProfile
+
+Стадии - произвольные строки; общие слои уже размечены:
+    discover        поиск файлов
+    parse           разбор тегов (промах каталога)
+    decide          выбор папки / правила
+    wait-for-human  ожидание ответа оператора
+    move            перемещение файла
+    save            запись тегов
+
+Использование:
+    import instrumentation as inst
+    inst.add_arguments(parser)          # --verbose, --metrics FILE, --profile FILE
+    inst.configure_from_args(args)
+    with inst.stage('parse'):
+        ...
+    inst.count('moved')
+    inst.progress(done, total)          # одна строка в stderr, если это терминал
+    inst.vprint("🎵 ...")               # построчный вывод только с --verbose
+
+Без аргументов командной строки: MUSIC_TOOLS_VERBOSE=1,
+MUSIC_TOOLS_METRICS=файл.json, MUSIC_TOOLS_PROFILE=файл.prof
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Верхние границы корзин гистограммы, мс (последняя - все, что дольше)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Не чаще, чем раз в столько секунд, перерисовываем строку прогресса
+PROGRESS_INTERVAL = 0.1
+
+_lock = threading.Lock()
+_started = time.perf_counter()
+_stages = {}      # стадия → Histogram
+_counters = {}    # имя → число
+_state = {'verbose': os.environ.get('MUSIC_TOOLS_VERBOSE') == '1', 'metrics_path': None,
+          'profiler': None, 'profile_path': None, 'progress_shown': 0.0, 'progress_line': False}
+
+
+class Histogram:
+    """Число замеров, сумма, максимум и корзины по BUCKETS_MS"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def merge(self, data):
+        self.count += data['count']
+        self.total += data['total_s']
+        self.max = max(self.max, data['max_ms'] / 1000)
+        for i, n in enumerate(data['buckets'].values()):
+            self.buckets[i] += n
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает процентиль (мс)"""
+        if not self.count:
+            return None
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= fraction * self.count:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(self.max * 1000, 3)
+        return round(self.max * 1000, 3)
+
+    def to_dict(self):
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 6),
+            'mean_ms': round(self.total * 1000 / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+def is_verbose():
+    return _state['verbose']
+
+
+def vprint(*args, **kwargs):
+    """print только в подробном режиме"""
+    if _state['verbose']:
+        _clear_progress()
+        print(*args, **kwargs)
+
+
+def observe(name, seconds):
+    """Добавляет замер длительности стадии"""
+    with _lock:
+        histogram = _stages.get(name)
+        if histogram is None:
+            histogram = _stages[name] = Histogram()
+        histogram.add(seconds)
+
+
+@contextmanager
+def stage(name):
+    """Замер блока кода как стадии name (и при исключении тоже)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    """Текущие метрики (словарь, годится для JSON и для merge в другом процессе)"""
+    with _lock:
+        return {
+            'elapsed_s': round(time.perf_counter() - _started, 3),
+            'counters': dict(_counters),
+            'stages': {name: histogram.to_dict() for name, histogram in _stages.items()},
+        }
+
+
+def merge(data):
+    """Добавляет метрики, собранные в другом процессе (snapshot() воркера)"""
+    with _lock:
+        for name, n in data['counters'].items():
+            _counters[name] = _counters.get(name, 0) + n
+        for name, stage_data in data['stages'].items():
+            histogram = _stages.get(name)
+            if histogram is None:
+                histogram = _stages[name] = Histogram()
+            histogram.merge(stage_data)
+
+
+def reset():
+    """Обнуляет метрики (воркер пула перед очередной порцией файлов)"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def progress(done, total, label=''):
+    """
+    Строка прогресса в stderr: [done/total] файлов/с, самые долгие стадии
+    Рисуется только в терминале, не в подробном режиме и не чаще PROGRESS_INTERVAL
+    """
+    if _state['verbose'] or not sys.stderr.isatty():
+        return
+    now = time.perf_counter()
+    if done < total and now - _state['progress_shown'] < PROGRESS_INTERVAL:
+        return
+    _state['progress_shown'] = now
+    elapsed = now - _started
+    rate = done / elapsed if elapsed > 0 else 0
+    with _lock:
+        busiest = sorted(_stages.items(), key=lambda item: -item[1].total)[:3]
+    stages = ', '.join(f"{name} {h.total:.1f}s" for name, h in busiest)
+    line = f"\r⏳ {label}[{done}/{total}] {rate:.0f} files/s  {stages}"
+    sys.stderr.write(line[:200].ljust(80))
+    sys.stderr.flush()
+    _state['progress_line'] = True
+    if done >= total:
+        _clear_progress()
+
+
+def _clear_progress():
+    if _state['progress_line']:
+        sys.stderr.write("\r" + " " * 80 + "\r")
+        sys.stderr.flush()
+        _state['progress_line'] = False
+
+
+def format_summary():
+    """Короткая таблица стадий для вывода в конце работы"""
+    data = snapshot()
+    lines = [f"{'stage':<16}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+    for name, s in sorted(data['stages'].items(), key=lambda item: -item[1]['total_s']):
+        lines.append(f"{name[:15]:<16}{s['count']:>8}{s['total_s']:>10.3f}{s['mean_ms'] or 0:>10.3f}"
+                     f"{s['p95_ms'] or 0:>10}{s['max_ms']:>10.3f}")
+    return '\n'.join(lines)
+
+
+def _finish():
+    _clear_progress()
+    profiler = _state['profiler']
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(_state['profile_path'])
+        print(f"📈 Профиль: {_state['profile_path']}", file=sys.stderr)
+    if _state['metrics_path']:
+        with open(_state['metrics_path'], 'w', encoding='utf-8') as f:
+            json.dump(dict(snapshot(), script=os.path.basename(sys.argv[0])), f, ensure_ascii=False, indent=2)
+        print(f"📊 Метрики: {_state['metrics_path']}", file=sys.stderr)
+    elif _state['verbose'] and _stages:
+        print(format_summary(), file=sys.stderr)
+
+
+def configure(verbose=None, metrics_path=None, profile_path=None):
+    """
+    verbose - построчный вывод по каждому файлу
+    metrics_path - куда записать JSON с метриками при выходе
+    profile_path - включить cProfile (основной поток) и сохранить статистику при выходе
+    """
+    if verbose is not None:
+        _state['verbose'] = verbose
+    _state['metrics_path'] = metrics_path or os.environ.get('MUSIC_TOOLS_METRICS') or None
+    profile_path = profile_path or os.environ.get('MUSIC_TOOLS_PROFILE') or None
+    if profile_path and _state['profiler'] is None:
+        _state['profile_path'] = profile_path
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+    atexit.unregister(_finish)
+    atexit.register(_finish)
+
+
+def add_arguments(parser):
+    """Общие ключи для argparse"""
+    parser.add_argument('-v', '--verbose', action='store_true', help='печатать строку для каждого файла')
+    parser.add_argument('--metrics', metavar='FILE', help='записать при выходе время по стадиям и счетчики в JSON')
+    parser.add_argument('--profile', metavar='FILE', help='запустить под cProfile и сохранить статистику в FILE')
+
+
+def configure_from_args(args):
+    configure(verbose=args.verbose or None, metrics_path=args.metrics, profile_path=args.profile)
+
+
+def pop_arguments(argv):
+    """
+    Для скриптов без argparse: убирает общие ключи из списка аргументов
+    (на месте) и настраивает инструментовку
+    """
+    verbose = None
+    paths = {'--metrics': None, '--profile': None}
+    for flag in ('-v', '--verbose'):
+        while flag in argv:
+            argv.remove(flag)
+            verbose = True
+    for flag in paths:
+        if flag in argv:
+            i = argv.index(flag)
+            if i + 1 < len(argv):
+                paths[flag] = argv[i + 1]
+                del argv[i:i + 2]
+            else:
+                del argv[i]
+    configure(verbose=verbose, metrics_path=paths['--metrics'], profile_path=paths['--profile'])
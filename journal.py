@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Журнал операций (write-ahead) для перемещений и смены тегов
+Каждый запуск пишет свой JSONL-файл: сначала заголовок со списком файлов,
+затем для каждой операции запись 'planned' до выполнения и 'done' после.
+Строки сбрасываются в ОС сразу (переживают падение процесса),
+fsync - пачками (каждые FSYNC_EVERY записей или FSYNC_INTERVAL секунд).
+
+Продолжение (resume): файлы из заголовка минус уже перемещенные.
+Незавершенные операции сверяются с диском: если файл уже лежит в
+destination, а source пуст (или копия совпадает с source по хэшу) -
+перемещение считается выполненным; недописанные копии удаляются.
+
+Отмена (undo): операции запуска в обратном порядке - вернуть жанр,
+вернуть файл на место, удалить созданные пустые папки.
+
+Папка журналов: MUSIC_TOOLS_JOURNAL_DIR, иначе ~/.cache/music-tools/journal
+"""
+
+import atexit
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from move_engine import file_digest, partial_path
+from tag_catalog import cache_dir
+
+FSYNC_EVERY = 64
+FSYNC_INTERVAL = 1.0
+
+
+class JournalError(Exception):
+    """Журнал не найден или поврежден"""
+
+
+def journal_dir():
+    path = Path(os.environ.get('MUSIC_TOOLS_JOURNAL_DIR') or cache_dir() / 'journal')
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def list_runs(directory=None):
+    """Идентификаторы запусков, от старых к новым"""
+    directory = Path(directory) if directory else journal_dir()
+    return sorted(p.stem for p in directory.glob('*.jsonl'))
+
+
+class Journal:
+    """
+    Журнал одного запуска
+
+    Использование:
+        journal = Journal.create(meta={'search': ..., 'output': ...}, files=audio_files)
+        seq = journal.plan('move', src=..., dst=...)
+        shutil.move(...)
+        journal.done(seq)
+    """
+
+    def __init__(self, path, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = Path(path)
+        self.run_id = self.path.stem
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.header = None
+        self.operations = {}     # seq → объединенная запись операции
+        self.undone = False
+        self._seq = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+        if self.path.exists():
+            self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        atexit.register(self.close)
+
+    @classmethod
+    def create(cls, meta, files, directory=None):
+        """Новый журнал; files - список файлов запуска (для resume без сканирования)"""
+        directory = Path(directory) if directory else journal_dir()
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        # Несколько запусков за секунду в одном процессе (режим наблюдения)
+        path, n = directory / f"{run_id}.jsonl", 1
+        while path.exists():
+            n += 1
+            path = directory / f"{run_id}-{n}.jsonl"
+        journal = cls(path)
+        journal._write({'op': 'begin', 'time': datetime.now().isoformat(timespec='seconds'),
+                        'meta': meta, 'files': [str(f) for f in files]})
+        journal.sync()
+        return journal
+
+    @classmethod
+    def open(cls, run_id='last', directory=None):
+        """Существующий журнал по идентификатору ('last' - последний)"""
+        directory = Path(directory) if directory else journal_dir()
+        if run_id == 'last':
+            runs = list_runs(directory)
+            if not runs:
+                raise JournalError(f"no journals in {directory}")
+            run_id = runs[-1]
+        path = directory / f"{run_id}.jsonl"
+        if not path.exists():
+            raise JournalError(f"journal not found: {path}")
+        return cls(path)
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после сбоя
+                    continue
+                op = entry.get('op')
+                if op == 'begin':
+                    self.header = entry
+                elif op == 'undo':
+                    self.undone = True
+                elif 'seq' in entry:
+                    seq = entry['seq']
+                    self._seq = max(self._seq, seq)
+                    self.operations.setdefault(seq, {}).update(entry)
+        if self.header is None:
+            raise JournalError(f"journal has no header: {self.path}")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        # В ОС сразу - запись переживет падение процесса
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Сбрасывает журнал на диск (fsync)"""
+        if self._file is None or self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def plan(self, op, **fields):
+        """Записывает намерение до выполнения операции; возвращает ее номер"""
+        self._seq += 1
+        entry = {'seq': self._seq, 'op': op, 'state': 'planned', **fields}
+        self.operations[self._seq] = dict(entry)
+        self._write(entry)
+        return self._seq
+
+    def done(self, seq, **fields):
+        """Операция выполнена (fields - уточнения, например итоговый путь)"""
+        entry = {'seq': seq, 'state': 'done', **fields}
+        self.operations[seq].update(entry)
+        self._write(entry)
+
+    def fail(self, seq, error):
+        entry = {'seq': seq, 'state': 'failed', 'error': str(error)}
+        self.operations[seq].update(entry)
+        self._write(entry)
+
+    def record(self, op, **fields):
+        """Уже выполненная операция (создание папки)"""
+        seq = self.plan(op, **fields)
+        self.done(seq)
+        return seq
+
+    def reconcile(self):
+        """
+        Сверяет незавершенные перемещения с диском после сбоя
+        Возвращает записи перемещений, признанных выполненными
+        """
+        recovered = []
+        for seq, entry in sorted(self.operations.items()):
+            if entry['op'] != 'move' or entry['state'] != 'planned':
+                continue
+            src, dst = Path(entry['src']), Path(entry['dst'])
+            # Недописанная копия между дисками
+            try:
+                os.unlink(partial_path(dst))
+            except OSError:
+                pass
+            if dst.exists() and not src.exists():
+                self.done(seq, recovered=True)
+                recovered.append(entry)
+            elif dst.exists() and os.path.samefile(src, dst):
+                # Сбой между созданием ссылки и удалением старого имени
+                os.unlink(src)
+                self.done(seq, recovered=True)
+                recovered.append(entry)
+            elif dst.exists() and self._same_copy(src, dst):
+                # Копия между дисками готова, но исходник не успели удалить (ждал fsync папки)
+                os.unlink(src)
+                self.done(seq, recovered=True)
+                recovered.append(entry)
+            else:
+                if dst.exists() and self._our_copy(src, dst):
+                    # Копия с другим содержимым (например, с новыми метаданными) - переделаем заново
+                    os.unlink(dst)
+                self.fail(seq, 'not completed')
+        self.sync()
+        return recovered
+
+    @staticmethod
+    def _same_copy(src, dst):
+        """dst - полная копия src (размер и хэш)"""
+        try:
+            if os.path.getsize(src) != os.path.getsize(dst):
+                return False
+            return file_digest(src) == file_digest(dst)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _our_copy(src, dst):
+        """
+        dst сделан движком из src: копия получает mtime исходника (copystat),
+        чужой файл с тем же именем не трогаем
+        """
+        try:
+            return os.stat(src).st_mtime_ns == os.stat(dst).st_mtime_ns
+        except OSError:
+            return False
+
+    def pending_files(self):
+        """Файлы запуска, которые еще не перемещены и лежат на месте"""
+        moved = {entry['src'] for entry in self.operations.values()
+                 if entry['op'] == 'move' and entry['state'] == 'done'}
+        return [Path(f) for f in self.header['files'] if f not in moved and os.path.exists(f)]
+
+    def mark_undone(self):
+        self._write({'op': 'undo', 'time': datetime.now().isoformat(timespec='seconds')})
+        self.undone = True
+        self.sync()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self.sync()
+            self._file.close()
+        atexit.unregister(self.close)
+
+
+def undo_run(journal, retag, move_back, quiet=False):
+    """
+    Отменяет выполненные операции запуска в обратном порядке
+    retag(path, field, old) и move_back(dst, src) делают саму работу
+    (скрипт передает свои функции, чтобы обновлялся каталог тегов)
+    Возвращает словарь счетчиков
+    """
+    if journal.undone:
+        raise JournalError(f"run {journal.run_id} is already undone")
+
+    stats = {'moved_back': 0, 'retagged': 0, 'folders_removed': 0, 'skipped': 0, 'errors': 0}
+    for seq, entry in sorted(journal.operations.items(), reverse=True):
+        if entry['state'] != 'done':
+            continue
+        op = entry['op']
+        try:
+            if op == 'retag':
+                for change in entry['changes']:
+                    retag(entry['path'], change['field'], change['old'])
+                stats['retagged'] += 1
+            elif op == 'move':
+                src, dst = Path(entry['src']), Path(entry['dst'])
+                if not dst.exists() or src.exists():
+                    if not quiet:
+                        print(f"⚠️  Пропуск: {dst} → {src}")
+                    stats['skipped'] += 1
+                    continue
+                src.parent.mkdir(parents=True, exist_ok=True)
+                move_back(dst, src)
+                stats['moved_back'] += 1
+            elif op == 'mkdir':
+                try:
+                    os.rmdir(entry['path'])
+                    stats['folders_removed'] += 1
+                except OSError:
+                    # Папка не пуста - в ней есть чужие файлы
+                    stats['skipped'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            print(f"❌ Операция {seq} ({op}): {str(e)}")
+    journal.mark_undone()
+    return stats
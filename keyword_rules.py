@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Правила ключевое слово / регулярное выражение → папка для z_move_by_keyword
+
+Файл правил - JSON:
+{
+    "fields": ["comment", "genre", "title"],
+    "rules": [
+        {"keyword": "vinyl rip", "folder": "Vinyl"},
+        {"regex": "\\\\bpromo(tional)?\\\\b", "folder": "Promo"}
+    ],
+    "default": null
+}
+
+fields - логические поля (см. tag_writer.FIELD_KEYS) или ключи тегов как есть,
+по умолчанию только comment. Регистр не важен.
+Все правила компилируются в одно регулярное выражение: файл без совпадений
+проверяется одним поиском. Правила со ссылками на группы по номеру (\\1)
+ищутся отдельно - в общем выражении номера групп другие. Если совпало несколько правил - побеждает
+первое в списке. Относительные папки считаются от папки вывода.
+"""
+
+import json
+import re
+
+from tag_writer import tag_key
+
+DEFAULT_FIELDS = ('comment',)
+
+# \1..\99 и (?(1)...) - ссылки на группы по номеру: в общем выражении номера
+# сдвигаются, поэтому такие правила проверяются отдельно
+NUMERIC_GROUP_REF = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(\d')
+
+
+class KeywordRulesError(Exception):
+    """Ошибка в файле правил"""
+
+
+def field_values(record, fields):
+    """Значения нужных полей записи каталога (все форматы тегов)"""
+    tags = record['tags']
+    values = []
+    for field in fields:
+        key = tag_key(record['format'], field)
+        values.extend(tags.get(key, []))
+        # ID3: COMM::eng, COMM:desc:eng и т.п. - ищем во всех вариантах кадра
+        frame, sep, _ = key.partition(':')
+        if sep:
+            for other, other_values in tags.items():
+                if other != key and other.partition(':')[0] == frame:
+                    values.extend(other_values)
+    return values
+
+
+class KeywordRules:
+    """
+    Скомпилированный набор правил: match(text) → (индекс правила, папка) или (None, None)
+    """
+
+    def __init__(self, rules, fields=DEFAULT_FIELDS, default=None):
+        if not rules:
+            raise KeywordRulesError("at least one rule is required")
+        self.fields = tuple(fields or DEFAULT_FIELDS)
+        self.default = default
+        self.folders = []
+        self.names = []
+        self.patterns = []
+        self.separate = []   # индексы правил, которые нельзя объединить
+        for rule in rules:
+            if not isinstance(rule, dict) or not rule.get('folder') or \
+                    (bool(rule.get('keyword')) == bool(rule.get('regex'))):
+                raise KeywordRulesError(f"rule needs 'folder' and one of 'keyword' or 'regex': {rule!r}")
+            source = re.escape(rule['keyword']) if rule.get('keyword') else rule['regex']
+            try:
+                self.patterns.append(re.compile(source, re.IGNORECASE))
+            except re.error as e:
+                raise KeywordRulesError(f"bad regex {source!r}: {e}")
+            if NUMERIC_GROUP_REF.search(source):
+                self.separate.append(len(self.patterns) - 1)
+            self.folders.append(rule['folder'])
+            self.names.append(rule.get('keyword') or rule['regex'])
+
+        # Одно выражение на остальные правила; группа _kw<N> показывает, какое сработало
+        combined = '|'.join(f'(?P<_kw{i}>{p.pattern})' for i, p in enumerate(self.patterns)
+                            if i not in self.separate)
+        self.combined = None
+        if combined:
+            try:
+                self.combined = re.compile(combined, re.IGNORECASE)
+            except re.error as e:
+                # Например, одинаковые именованные группы в разных правилах
+                raise KeywordRulesError(f"rules cannot be combined: {e}")
+
+    @classmethod
+    def load(cls, path):
+        """Загружает правила из JSON-файла"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise KeywordRulesError(f"cannot read rules file {path}: {e}")
+        if not isinstance(data, dict):
+            raise KeywordRulesError("rules file must contain a JSON object")
+        unknown = set(data) - {'fields', 'rules', 'default'}
+        if unknown:
+            raise KeywordRulesError(f"unknown keys in rules file: {', '.join(sorted(unknown))}")
+        return cls(data.get('rules'), data.get('fields'), data.get('default'))
+
+    def match(self, text):
+        """Первое по порядку правило, совпавшее с текстом"""
+        best = None
+        if self.combined is not None:
+            for m in self.combined.finditer(text):
+                index = int(m.lastgroup[3:])
+                if best is None or index < best:
+                    best = index
+        for index in self.separate:
+            if best is not None and index > best:
+                break
+            if self.patterns[index].search(text):
+                best = index
+                break
+        if best is None:
+            return None, None
+        # Совпадения не перекрываются - более раннее правило могло спрятаться внутри найденного
+        for index in range(best):
+            if self.patterns[index].search(text):
+                best = index
+                break
+        return best, self.folders[best]
+
+    def resolve(self, record):
+        """(индекс правила, папка) для записи каталога; без совпадений - default"""
+        if record:
+            index, folder = self.match('\n'.join(field_values(record, self.fields)))
+            if folder:
+                return index, folder
+        return None, self.default
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Перемещение файлов между папками и файловыми системами
+
+На одном устройстве - переименование без перезаписи (мгновенно).
+Между устройствами - копирование средствами ядра (copy_file_range,
+затем sendfile, затем обычное чтение/запись) во временный файл рядом
+с целевым, fsync файла, проверка копии, переименование в итоговое имя.
+Исходник удаляется только после fsync папки назначения; fsync папок
+делается пачками - один на папку для нескольких файлов.
+
+Существующий файл назначения никогда не перезаписывается (place):
+жесткая ссылка + удаление старого имени, при гонке - FileExistsError.
+
+Пакетный режим копирует в пуле потоков:
+    with MoveEngine(workers=4) as engine:
+        for src, dst in pairs:
+            for done in engine.submit(src, dst):
+                ...              # done.src, done.dst, done.error
+        for done in engine.finish():
+            ...
+
+Копия может идти с заменой начала файла (header=(байты, начало, конец)):
+в назначение пишутся новые байты, за ними - исходник с позиции начало
+до конец. Так новые метаданные FLAC попадают в копию без второй записи
+файла (см. flac_writer.plan_metadata).
+
+Проверка копии: MUSIC_TOOLS_VERIFY=hash (по умолчанию, blake2b обеих копий)
+или size (только размер)
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from instrumentation import stage, count
+
+DEFAULT_MOVE_WORKERS = 4
+DEFAULT_VERIFY = os.environ.get('MUSIC_TOOLS_VERIFY', 'hash')
+
+# Сколько скопированных файлов копить в папке до fsync папки и удаления исходников
+DIR_SYNC_BATCH = 32
+
+COPY_CHUNK = 8 * 1024 * 1024
+HASH_CHUNK = 1024 * 1024
+
+# Итог перемещения одного файла; error - исключение или None
+MoveResult = namedtuple('MoveResult', ['src', 'dst', 'bytes', 'renamed', 'error', 'token'])
+
+# Ошибки, после которых пробуем следующий способ копирования
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+
+
+class VerifyError(Exception):
+    """Копия не совпала с исходником"""
+
+
+def _copy_range(src_fd, dst_fd, start, size):
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied), start + copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_sendfile(src_fd, dst_fd, start, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, start + copied, min(COPY_CHUNK, size - copied))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_plain(fsrc, fdst, start, size):
+    fsrc.seek(start)
+    copied = 0
+    while copied < size:
+        chunk = fsrc.read(min(COPY_CHUNK, size - copied))
+        if not chunk:
+            break
+        fdst.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def copy_data(src, dst, header=None):
+    """
+    Копирует содержимое файла средствами ядра, если получается
+    header=(байты, начало, конец) - вместо исходника до позиции начало
+    пишутся байты, затем копируется исходник от начало до конец
+    Возвращает число записанных байт
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if header is None:
+            prefix, start, end = b'', 0, os.fstat(fsrc.fileno()).st_size
+        else:
+            prefix, start, end = header
+        size = end - start
+        for method in (getattr(os, 'copy_file_range', None) and _copy_range,
+                       getattr(os, 'sendfile', None) and _copy_sendfile):
+            if method is None:
+                continue
+            try:
+                fdst.write(prefix)
+                fdst.flush()
+                copied = method(fsrc.fileno(), fdst.fileno(), start, size)
+                if copied == size:
+                    return len(prefix) + copied
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+            # Начинаем заново следующим способом
+            fdst.seek(0)
+            fdst.truncate()
+        fdst.write(prefix)
+        return len(prefix) + _copy_plain(fsrc, fdst, start, size)
+
+
+def file_digest(path, start=0, end=None):
+    """blake2b файла или его части [start, end)"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start if end is not None else None
+        while remaining is None or remaining > 0:
+            chunk = f.read(HASH_CHUNK if remaining is None else min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.digest()
+
+
+def partial_path(dst):
+    """Временный файл копии рядом с dst (после сбоя его убирает Journal.reconcile)"""
+    dst = Path(dst)
+    return dst.with_name(f".{dst.name}.partial")
+
+
+def fsync_path(path):
+    """fsync файла или папки по пути"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def same_device(src, dst_dir):
+    return os.stat(src).st_dev == os.stat(dst_dir).st_dev
+
+
+# ФС без жестких ссылок (FAT, часть SMB/NFS)
+_NO_LINK_ERRNOS = {errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.ENOSYS}
+
+
+def place(src, dst):
+    """
+    Переименование в пределах устройства без перезаписи
+    FileExistsError, если dst уже существует (например, его создал другой процесс)
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in _NO_LINK_ERRNOS:
+            raise
+        # Жестких ссылок нет - проверка и rename (остается узкое окно гонки)
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dst))
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+class MoveEngine:
+    """
+    Перемещает файлы: rename на одном устройстве, проверенное копирование между устройствами
+    Счетчики: files, bytes, renamed, copied, errors; report() - МБ/с и файлов/с
+    """
+
+    def __init__(self, workers=DEFAULT_MOVE_WORKERS, verify=DEFAULT_VERIFY, dir_sync_batch=DIR_SYNC_BATCH):
+        if verify not in ('hash', 'size'):
+            raise ValueError(f"unknown verify mode: {verify}")
+        self.verify = verify
+        self.dir_sync_batch = max(1, dir_sync_batch)
+        self.workers = max(1, workers)
+        self.files = 0
+        self.bytes = 0
+        self.renamed = 0
+        self.copied = 0
+        self.errors = 0
+        # Время работы: для пула - от первой постановки, для синхронных - сумма перемещений
+        self.started = None
+        self.busy = 0.0
+        self._executor = None
+        self._inflight = deque()               # Future в порядке постановки
+        self._unsynced = defaultdict(list)     # папка → скопированные, но исходник еще не удален
+        self._lock = threading.Lock()
+
+    # --- одно перемещение ---
+
+    def _copy_verified(self, src, dst, header=None):
+        """
+        Копия во временный файл, fsync, проверка, переименование; возвращает размер
+        С header сверяются новые байты и скопированная часть исходника
+        """
+        src, dst = Path(src), Path(dst)
+        tmp = partial_path(dst)
+        prefix, start, end = header if header is not None else (b'', 0, os.path.getsize(src))
+        try:
+            size = copy_data(src, tmp, header)
+            shutil.copystat(src, tmp)
+            fsync_path(tmp)
+            if os.path.getsize(tmp) != len(prefix) + end - start:
+                raise VerifyError(f"size mismatch: {src} → {dst}")
+            if self.verify == 'hash':
+                with open(tmp, 'rb') as f:
+                    same_prefix = f.read(len(prefix)) == prefix
+                if not same_prefix or file_digest(tmp, len(prefix)) != file_digest(src, start, end):
+                    raise VerifyError(f"checksum mismatch: {src} → {dst}")
+            place(tmp, dst)
+            return size
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _account(self, result):
+        with self._lock:
+            if result.error is not None:
+                self.errors += 1
+                return
+            self.files += 1
+            self.bytes += result.bytes
+            count('files_moved')
+            count('bytes_moved', result.bytes)
+            if result.renamed:
+                self.renamed += 1
+            else:
+                self.copied += 1
+
+    def move(self, src, dst, header=None):
+        """
+        Синхронное перемещение (интерактивный режим)
+        Между устройствами исходник удаляется после fsync папки назначения
+        header - копия с заменой начала файла (тогда копируем и на одном устройстве)
+        """
+        src, dst = Path(src), Path(dst)
+        started = time.perf_counter()
+        try:
+            with stage('move'):
+                return self._move(src, dst, header)
+        finally:
+            self.busy += time.perf_counter() - started
+
+    def _move(self, src, dst, header):
+        if header is None and same_device(src, dst.parent):
+            size = os.path.getsize(src)
+            place(src, dst)
+            self._account(MoveResult(src, dst, size, True, None, None))
+            return dst
+        size = self._copy_verified(src, dst, header)
+        fsync_path(dst.parent)
+        os.unlink(src)
+        self._account(MoveResult(src, dst, size, False, None, None))
+        return dst
+
+    # --- пакетный режим ---
+
+    def _run(self, src, dst, token, header):
+        with stage('move'):
+            return self._run_one(src, dst, token, header)
+
+    def _run_one(self, src, dst, token, header):
+        try:
+            if header is None and same_device(src, dst.parent):
+                size = os.path.getsize(src)
+                place(src, dst)
+                return MoveResult(src, dst, size, True, None, token)
+            return MoveResult(src, dst, self._copy_verified(src, dst, header), False, None, token)
+        except Exception as e:
+            return MoveResult(src, dst, 0, False, e, token)
+
+    def _settle(self, result):
+        """Готовый результат: rename/ошибка отдаются сразу, копии ждут fsync папки"""
+        if result.error is not None or result.renamed:
+            self._account(result)
+            return [result]
+        folder = result.dst.parent
+        self._unsynced[folder].append(result)
+        if len(self._unsynced[folder]) >= self.dir_sync_batch:
+            return self._sync_dir(folder)
+        return []
+
+    def _sync_dir(self, folder):
+        """Один fsync папки, затем удаление исходников всех скопированных в нее файлов"""
+        results = self._unsynced.pop(folder, [])
+        if not results:
+            return []
+        finished = []
+        try:
+            fsync_path(folder)
+        except OSError as e:
+            failed = [result._replace(error=e) for result in results]
+            for result in failed:
+                self._account(result)
+            return failed
+        for result in results:
+            try:
+                os.unlink(result.src)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                result = result._replace(error=e)
+            self._account(result)
+            finished.append(result)
+        return finished
+
+    def submit(self, src, dst, token=None, header=None):
+        """
+        Ставит перемещение в очередь; возвращает список уже завершенных
+        (MoveResult), если пришлось ждать освобождения пула
+        token - любое значение, возвращается в результате
+        header - см. copy_data
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='move')
+            self.started = time.perf_counter()
+        finished = []
+        # Ограничиваем число файлов в работе
+        while len(self._inflight) >= self.workers * 2:
+            finished.extend(self._settle(self._inflight.popleft().result()))
+        self._inflight.append(self._executor.submit(self._run, Path(src), Path(dst), token, header))
+        # Забираем то, что уже готово, не дожидаясь остального
+        while self._inflight and self._inflight[0].done():
+            finished.extend(self._settle(self._inflight.popleft().result()))
+        return finished
+
+    def finish(self):
+        """Дожидается всех копий, делает fsync папок и удаляет исходники"""
+        finished = []
+        while self._inflight:
+            finished.extend(self._settle(self._inflight.popleft().result()))
+        for folder in list(self._unsynced):
+            finished.extend(self._sync_dir(folder))
+        return finished
+
+    def close(self):
+        finished = self.finish()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return finished
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def report(self):
+        """Сводка: файлы, МБ, МБ/с, файлов/с"""
+        elapsed = self.busy
+        if self.started is not None:
+            elapsed += time.perf_counter() - self.started
+        mb = self.bytes / (1024 * 1024)
+        return {
+            'files': self.files,
+            'renamed': self.renamed,
+            'copied': self.copied,
+            'errors': self.errors,
+            'mb': round(mb, 1),
+            'elapsed_s': round(elapsed, 3),
+            'mb_per_s': round(mb / elapsed, 1) if elapsed > 0 else None,
+            'files_per_s': round(self.files / elapsed, 1) if elapsed > 0 else None,
+        }
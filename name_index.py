@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Индекс имен файлов в папках назначения
+Каждая папка читается одним scandir при первом обращении, дальше
+свободное имя (name, name_1, name_2, ...) выдается из памяти:
+для каждого имени помнится следующий номер, поэтому даже сотни
+"01 Intro.flac" не требуют ни одного stat.
+
+Индекс - только подсказка: чужой процесс может создать файл в любой
+момент, поэтому само перемещение делается без перезаписи
+(move_engine.place), а при FileExistsError имя отмечается занятым
+и выдается следующее.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+
+class FolderNames:
+    """Занятые имена одной папки и следующий номер для каждого имени"""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.names = set()
+        self._next = {}   # (stem, suffix) → следующий номер
+        try:
+            with os.scandir(self.folder) as it:
+                self.names.update(entry.name for entry in it)
+        except FileNotFoundError:
+            # Папку еще не создали (dry-run или создадут перед перемещением)
+            pass
+
+    def reserve(self, file_name):
+        """Свободное имя для файла; сразу считается занятым"""
+        if file_name not in self.names:
+            self.names.add(file_name)
+            return file_name
+        stem, suffix = os.path.splitext(file_name)
+        counter = self._next.get((stem, suffix), 1)
+        while f"{stem}_{counter}{suffix}" in self.names:
+            counter += 1
+        name = f"{stem}_{counter}{suffix}"
+        self._next[(stem, suffix)] = counter + 1
+        self.names.add(name)
+        return name
+
+
+class NameIndex:
+    """
+    Индексы имен по папкам (потокобезопасно)
+
+    Использование:
+        destination = names.reserve(genre_folder, file_path.name)
+        ...
+        names.release(destination)   # если перемещение не состоялось
+        names.taken(destination)     # если имя занял кто-то другой
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = {}
+        self.loaded = 0
+
+    def _folder(self, folder):
+        """
+        Имена папки; scandir идет без блокировки (медленная сетевая папка
+        не держит остальные), готовый индекс вставляется под блокировкой
+        """
+        key = os.path.abspath(folder)
+        with self._lock:
+            names = self._folders.get(key)
+        if names is not None:
+            return names
+        built = FolderNames(folder)
+        with self._lock:
+            names = self._folders.get(key)
+            if names is None:
+                names = self._folders[key] = built
+                self.loaded += 1
+        return names
+
+    def warm(self, folder):
+        """Загружает папку заранее (из потока предзагрузки)"""
+        self._folder(folder)
+
+    def reserve(self, folder, file_name):
+        names = self._folder(folder)
+        with self._lock:
+            return Path(folder) / names.reserve(file_name)
+
+    def release(self, path):
+        """Имя снова свободно (перемещение не удалось или файл увезли)"""
+        path = Path(path)
+        names = self._folder(path.parent)
+        with self._lock:
+            names.names.discard(path.name)
+
+    def taken(self, path):
+        """Имя занято снаружи (файл появился или перемещен в папку)"""
+        path = Path(path)
+        names = self._folder(path.parent)
+        with self._lock:
+            names.names.add(path.name)
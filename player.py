@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Плеер для прослушивания треков при ручной сортировке
+
+MpvPlayer держит один процесс mpv на всю сессию (--idle) и управляет им
+командами JSON IPC через unix-сокет: загрузить, перемотать, остановить.
+Запуск и остановка трека - одна команда в сокет, без старта процесса.
+
+Если mpv нет - FfplayPlayer (один ffplay на трек). Конец воспроизведения
+он узнает по закрытию канала, унаследованного дочерним процессом.
+
+Ожидание клавиши и конца трека - через selectors, без опроса с sleep.
+Оба плеера останавливают только свой дочерний процесс.
+"""
+
+import atexit
+import json
+import os
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+class PlayerError(Exception):
+    """Плеер не запустился или перестал отвечать"""
+
+
+def _stop_child(process, timeout=1.0):
+    """Завершает свой дочерний процесс: terminate, затем kill"""
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class MpvPlayer:
+    """
+    Долгоживущий mpv без окна, команды через --input-ipc-server
+    События: 'started' (трек пошел), 'ended' (трек закончился или mpv завершился)
+    """
+
+    STARTUP_TIMEOUT = 5.0
+
+    def __init__(self, binary='mpv'):
+        self.binary = binary
+        self._process = None
+        self._sock = None
+        self._tmpdir = None
+        self._buffer = b''
+        self._loading = False
+
+    def start(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._cleanup()
+        self._tmpdir = tempfile.mkdtemp(prefix='music-tools-mpv-')
+        path = os.path.join(self._tmpdir, 'ipc.sock')
+        self._process = subprocess.Popen(
+            [self.binary, '--idle=yes', '--no-video', '--no-terminal', '--really-quiet',
+             f'--input-ipc-server={path}'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Ждем, пока mpv создаст сокет (только при первом запуске)
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(path)
+                break
+            except OSError:
+                sock.close()
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise PlayerError("mpv did not start")
+                time.sleep(0.01)
+        sock.setblocking(False)
+        self._sock = sock
+
+    def _send(self, *command):
+        self.start()
+        data = json.dumps({'command': list(command)}).encode('utf-8') + b'\n'
+        try:
+            self._sock.setblocking(True)
+            self._sock.sendall(data)
+        except OSError as e:
+            self.close()
+            raise PlayerError(f"mpv connection lost: {e}")
+        finally:
+            if self._sock is not None:
+                self._sock.setblocking(False)
+
+    def load(self, path, start=0):
+        """Загружает трек вместо текущего и начинает воспроизведение с start секунд"""
+        self._loading = True
+        self._send('set_property', 'start', str(start))
+        self._send('set_property', 'pause', False)
+        self._send('loadfile', str(path), 'replace')
+
+    def seek(self, seconds):
+        self._send('seek', seconds, 'absolute')
+
+    def stop(self):
+        """Останавливает воспроизведение, процесс mpv остается"""
+        self._loading = False
+        if self._sock is not None:
+            try:
+                self._send('stop')
+            except PlayerError:
+                pass
+
+    def fileno(self):
+        self.start()
+        return self._sock.fileno()
+
+    def read_events(self):
+        """Разбирает пришедшие события mpv; вызывать, когда сокет готов к чтению"""
+        events = []
+        try:
+            chunk = self._sock.recv(65536)
+        except BlockingIOError:
+            return events
+        except OSError:
+            chunk = b''
+        if not chunk:
+            # mpv завершился - следующий load запустит новый
+            self.close()
+            return ['ended']
+
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            event = message.get('event')
+            if event == 'start-file':
+                self._loading = False
+            elif event == 'playback-restart':
+                events.append('started')
+            elif event == 'end-file' and not self._loading:
+                # end-file предыдущего трека приходит до start-file нового
+                events.append('ended')
+        return events
+
+    def _cleanup(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+        self._buffer = b''
+
+    def close(self):
+        """Завершает свой процесс mpv"""
+        if self._sock is not None and self._process is not None and self._process.poll() is None:
+            try:
+                self._sock.setblocking(True)
+                self._sock.sendall(b'{"command": ["quit"]}\n')
+                self._process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        _stop_child(self._process)
+        self._process = None
+        self._cleanup()
+
+
+class FfplayPlayer:
+    """
+    Запасной вариант: отдельный ffplay на каждый трек
+    Конец трека виден по EOF канала, который держит открытым только ffplay
+    """
+
+    def __init__(self, binary='ffplay'):
+        self.binary = binary
+        self._process = None
+        self._exit_pipe = None
+        self._path = None
+
+    def load(self, path, start=0):
+        self.stop()
+        cmd = [self.binary, '-ss', str(start), '-nodisp', '-autoexit', '-loglevel', 'quiet', str(path)]
+        self._path = path
+        if os.name != 'posix':
+            # Windows: канал не наследуется, конец трека - через finished()
+            try:
+                self._process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                raise PlayerError(f"cannot start ffplay: {e}")
+            return
+
+        read_end, write_end = os.pipe()
+        try:
+            self._process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL, pass_fds=(write_end,))
+        except OSError as e:
+            os.close(read_end)
+            raise PlayerError(f"cannot start ffplay: {e}")
+        finally:
+            os.close(write_end)
+        self._exit_pipe = read_end
+
+    def seek(self, seconds):
+        # ffplay не принимает команды - перезапускаем с новой позиции
+        if self._path is not None:
+            self.load(self._path, seconds)
+
+    def stop(self):
+        _stop_child(self._process)
+        self._process = None
+        if self._exit_pipe is not None:
+            os.close(self._exit_pipe)
+            self._exit_pipe = None
+
+    def fileno(self):
+        if self._exit_pipe is None:
+            raise PlayerError("nothing is playing")
+        return self._exit_pipe
+
+    def read_events(self):
+        if self._exit_pipe is not None and os.read(self._exit_pipe, 1):
+            return []
+        return ['ended']
+
+    def finished(self):
+        return self._process is None or self._process.poll() is not None
+
+    def close(self):
+        self.stop()
+
+
+def make_player():
+    """mpv (постоянный процесс), если есть, иначе ffplay; None - если нет ни того, ни другого"""
+    candidates = [('mpv', MpvPlayer), ('ffplay', FfplayPlayer)]
+    if os.name != 'posix':
+        # IPC mpv через unix-сокет доступен только на POSIX
+        candidates = candidates[1:]
+    for binary, player_class in candidates:
+        path = shutil.which(binary)
+        if path:
+            player = player_class(path)
+            atexit.register(player.close)
+            return player
+    return None
+
+
+def play_until_keypress(player, path, start=0, stdin=None):
+    """
+    Играет трек до нажатия Enter или до конца трека
+    Возвращает 'key' или 'ended'
+    """
+    stdin = stdin or sys.stdin
+    player.load(path, start)
+    if os.name != 'posix':
+        return _wait_windows_key(player)
+
+    selector = selectors.DefaultSelector()
+    try:
+        try:
+            selector.register(stdin, selectors.EVENT_READ, 'key')
+        except (ValueError, PermissionError):
+            # stdin - обычный файл или /dev/null: ждем только конца трека
+            pass
+        selector.register(player.fileno(), selectors.EVENT_READ, 'player')
+
+        while True:
+            for key, _ in selector.select():
+                if key.data == 'key':
+                    stdin.readline()
+                    player.stop()
+                    return 'key'
+                if 'ended' in player.read_events():
+                    return 'ended'
+    finally:
+        selector.close()
+
+
+def _wait_windows_key(player):
+    # На Windows select не работает с консолью и каналами - остается опрос
+    import msvcrt
+    while not player.finished():
+        if msvcrt.kbhit():
+            msvcrt.getch()
+            player.stop()
+            return 'key'
+        time.sleep(0.05)
+    return 'ended'
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Фоновая предзагрузка данных для следующих файлов
+Пока оператор отвечает на вопрос по текущему файлу, пул потоков
+заранее готовит результат для следующих depth файлов
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class PrefetchCancelled(Exception):
+    """Предзагрузка остановлена до начала обработки элемента"""
+
+
+class Prefetcher:
+    """
+    Упорядоченная предзагрузка: get(i) возвращает resolve(items[i])
+    и сразу ставит в очередь элементы до i + depth
+
+    Использование:
+        with Prefetcher(files, resolve, depth=8, workers=4) as prefetcher:
+            for i in range(len(files)):
+                result = prefetcher.get(i)
+    """
+
+    def __init__(self, items, resolve, depth=8, workers=4):
+        self.items = items
+        self.resolve = resolve
+        self.depth = max(0, depth)
+        self._cancelled = threading.Event()
+        self._futures = {}
+        self._next = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers),
+                                            thread_name_prefix='prefetch') if self.depth else None
+
+    def _run(self, item):
+        # Отмененные задачи, которые уже взял поток, не трогают диск
+        if self._cancelled.is_set():
+            raise PrefetchCancelled()
+        return self.resolve(item)
+
+    def _schedule(self, upto):
+        upto = min(upto, len(self.items))
+        while self._next < upto and not self._cancelled.is_set():
+            self._futures[self._next] = self._executor.submit(self._run, self.items[self._next])
+            self._next += 1
+
+    def get(self, index):
+        """
+        Результат для items[index]; если он еще не готов - ждем,
+        если предзагрузка выключена - считаем в текущем потоке
+        """
+        if self._executor is None or self._cancelled.is_set():
+            return self.resolve(self.items[index])
+
+        self._schedule(index + 1 + self.depth)
+        future = self._futures.pop(index, None)
+        if future is None:
+            return self.resolve(self.items[index])
+        try:
+            return future.result()
+        except (CancelledError, PrefetchCancelled):
+            return self.resolve(self.items[index])
+
+    def cancel(self):
+        """Останавливает предзагрузку: ожидающие задачи отменяются"""
+        self._cancelled.set()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancel()
+        return False
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Кэш коротких фрагментов треков для мгновенного прослушивания
+Пока оператор отвечает на вопрос, фоновые потоки заранее декодируют
+фрагмент (offset секунд от начала, length секунд) следующих треков
+в локальную папку. Воспроизведение идет из кэша, а не с NAS.
+
+Размер кэша ограничен, старые фрагменты удаляются (LRU по времени
+последнего использования, поэтому порядок сохраняется между запусками).
+
+Переменные окружения:
+  MUSIC_TOOLS_PREVIEW_CACHE_MB  - размер кэша (по умолчанию 512)
+  MUSIC_TOOLS_PREVIEW_DECODER   - 'ffmpeg' (по умолчанию) или 'stub'
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tag_catalog import cache_dir, get_catalog
+
+DEFAULT_PREVIEW_OFFSET = 60
+DEFAULT_PREVIEW_LENGTH = 30
+DEFAULT_CACHE_MB = int(os.environ.get('MUSIC_TOOLS_PREVIEW_CACHE_MB', 512))
+DEFAULT_DECODE_WORKERS = 2
+
+
+class PreviewError(Exception):
+    """Не удалось подготовить фрагмент"""
+
+
+class FfmpegDecoder:
+    """Вырезает фрагмент через ffmpeg в FLAC (быстрое сжатие, без потерь)"""
+
+    extension = '.flac'
+
+    def __init__(self, binary='ffmpeg'):
+        self.binary = binary
+
+    def __call__(self, src, dst, offset, length):
+        cmd = [self.binary, '-nostdin', '-loglevel', 'error', '-y',
+               '-ss', str(offset), '-t', str(length), '-i', str(src),
+               '-vn', '-map_metadata', '-1', '-c:a', 'flac', '-compression_level', '0',
+               '-f', 'flac', str(dst)]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise PreviewError(result.stderr.decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+
+
+class StubDecoder:
+    """
+    Декодер без ffmpeg: пишет тишину нужной длины в WAV
+    delay - искусственная задержка декодирования (для проверки предзагрузки)
+    """
+
+    extension = '.wav'
+
+    def __init__(self, delay=0.0, sample_rate=8000):
+        self.delay = delay
+        self.sample_rate = sample_rate
+        self.calls = 0
+
+    def __call__(self, src, dst, offset, length):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        with wave.open(str(dst), 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.sample_rate)
+            out.writeframes(b'\x00\x00' * int(self.sample_rate * length))
+
+
+def make_decoder(name=None):
+    """
+    Декодер по имени ('ffmpeg', 'stub'); None - если ffmpeg не найден
+    По умолчанию имя берется из MUSIC_TOOLS_PREVIEW_DECODER
+    """
+    name = name or os.environ.get('MUSIC_TOOLS_PREVIEW_DECODER', 'ffmpeg')
+    if name == 'stub':
+        return StubDecoder()
+    binary = shutil.which(name)
+    return FfmpegDecoder(binary) if binary else None
+
+
+class PreviewCache:
+    """
+    Фрагменты треков в локальной папке с ограничением по размеру
+
+    Использование:
+        cache = PreviewCache(decoder=make_decoder())
+        cache.schedule(next_file)        # в фоне, заранее
+        clip = cache.prepare(file)       # путь к фрагменту (ждет, если еще декодируется)
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024, decoder=None,
+                 offset=DEFAULT_PREVIEW_OFFSET, length=DEFAULT_PREVIEW_LENGTH,
+                 workers=DEFAULT_DECODE_WORKERS):
+        self.directory = Path(directory) if directory else cache_dir() / 'previews'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.decoder = decoder
+        self.offset = offset
+        self.length = length
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.decode_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._clips = OrderedDict()   # ключ → размер, от старых к новым
+        self._pending = {}            # ключ → Future декодирования
+        self._total = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='preview')
+        self._load()
+
+    def _load(self):
+        """Восстанавливает порядок LRU по времени изменения файлов"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                # Недописанный фрагмент от прерванного запуска
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+                continue
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._clips[name] = size
+            self._total += size
+
+    def clip_offset(self, path):
+        """Смещение фрагмента: для коротких треков сдвигается ближе к началу"""
+        record = get_catalog().lookup(Path(path))
+        track_length = record['info'].get('length') if record else None
+        if track_length and track_length < self.offset + self.length:
+            return max(0, int(track_length - self.length))
+        return self.offset
+
+    def _key(self, path):
+        st = os.stat(path)
+        offset = self.clip_offset(path)
+        ident = f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\0{offset}\0{self.length}"
+        return hashlib.sha1(ident.encode('utf-8', 'surrogateescape')).hexdigest()[:24] + self.decoder.extension, offset
+
+    def _decode(self, path, key, offset):
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        started = time.perf_counter()
+        try:
+            self.decoder(path, tmp, offset, self.length)
+            size = os.path.getsize(tmp)
+            if size == 0:
+                raise PreviewError(f"empty preview for {path}")
+            os.replace(tmp, self.directory / key)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+
+        with self._lock:
+            self.decode_seconds += time.perf_counter() - started
+            self._pending.pop(key, None)
+            self._clips[key] = size
+            self._total += size
+            self._evict(keep=key)
+        return self.directory / key
+
+    def _evict(self, keep):
+        # Вызывается под self._lock
+        while self._total > self.max_bytes and len(self._clips) > 1:
+            key, size = next(iter(self._clips.items()))
+            if key == keep:
+                self._clips.move_to_end(key)
+                continue
+            del self._clips[key]
+            self._total -= size
+            self.evicted += 1
+            try:
+                os.unlink(self.directory / key)
+            except OSError:
+                pass
+
+    def _submit(self, path):
+        """Future с путем к фрагменту; повторные вызовы не декодируют заново"""
+        key, offset = self._key(path)
+        with self._lock:
+            if key in self._clips:
+                self._clips.move_to_end(key)
+                return None, key
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._executor.submit(self._decode, path, key, offset)
+            return future, key
+
+    def schedule(self, path):
+        """Ставит декодирование фрагмента в фон (если его еще нет в кэше)"""
+        if self.decoder is None:
+            return
+        try:
+            self._submit(path)
+        except (OSError, RuntimeError):
+            pass
+
+    def prepare(self, path):
+        """
+        Путь к фрагменту трека; декодирует, если его еще нет
+        Возвращает None, если фрагмент подготовить не удалось
+        """
+        if self.decoder is None:
+            return None
+        try:
+            future, key = self._submit(path)
+            if future is None:
+                self.hits += 1
+                clip = self.directory / key
+                os.utime(clip)   # для LRU между запусками
+                return clip
+            self.misses += 1
+            return future.result()
+        except (OSError, PreviewError, RuntimeError):
+            return None
+
+    def size(self):
+        return self._total
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
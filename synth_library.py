@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетической библиотеки для бенчмарков
+Маленькие, но корректные для mutagen файлы FLAC / MP3 / M4A / Ogg Vorbis /
+Opus / AIFF с жанром, комментарием и обложкой. Содержимое определяется
+seed, поэтому одна и та же конфигурация дает одну и ту же библиотеку
+на любом коммите.
+
+Запуск:
+  python synth_library.py папка --count 1000 --mix flac=4,mp3=2,m4a=1,ogg=1,opus=1,aiff=1
+  python synth_library.py папка --count 200 --albums 10 --cover-kb 300
+"""
+
+import argparse
+import random
+import struct
+import sys
+from pathlib import Path
+
+from mutagen.aiff import AIFF
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import ID3, TCON, COMM, APIC
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.ogg import OggPage
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
+
+DEFAULT_MIX = 'flac=4,mp3=2,m4a=1,ogg=1,opus=1,aiff=1'
+FORMATS = ('flac', 'mp3', 'm4a', 'ogg', 'opus', 'aiff')
+
+# Жанры с теми же особенностями, что в настоящих библиотеках: '/', '&', пустой
+GENRES = ['House', 'Deep House', 'Techno/Minimal', 'Drum & Bass', 'Ambient', 'Electro', '']
+COMMENTS = ['color=red nice', 'vinyl rip', 'promo', 'plain', '']
+
+
+def parse_mix(spec):
+    """'flac=4,mp3=2' → [('flac', 4), ('mp3', 2)]"""
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition('=')
+        name = name.strip().lower()
+        if name not in FORMATS:
+            raise ValueError(f"unknown format in mix: {name!r} (known: {', '.join(FORMATS)})")
+        mix.append((name, int(weight or 1)))
+    if not mix or sum(weight for _, weight in mix) <= 0:
+        raise ValueError("empty format mix")
+    return mix
+
+
+def _write_flac(path, rng, audio_bytes):
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | 441000
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6 + packed.to_bytes(8, 'big') + rng.randbytes(16)
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+        f.write(b'\xff\xf8' + rng.randbytes(audio_bytes))
+
+
+def _write_mp3(path, rng, audio_bytes):
+    # MPEG1 Layer III 128 кбит/с 44.1 кГц - кадр 417 байт
+    frames = max(1, audio_bytes // 417)
+    with open(path, 'wb') as f:
+        for _ in range(frames):
+            f.write(b'\xff\xfb\x90\x64' + rng.randbytes(413))
+
+
+def _atom(name, data):
+    return struct.pack('>I', 8 + len(data)) + name + data
+
+
+def _write_m4a(path, rng, audio_bytes):
+    mvhd = _atom(b'mvhd', b'\x00' * 4 + struct.pack('>IIII', 0, 0, 1000, 10000) + b'\x00' * 80)
+    with open(path, 'wb') as f:
+        f.write(_atom(b'ftyp', b'M4A \x00\x00\x00\x00M4A mp42isom'))
+        f.write(_atom(b'moov', mvhd))
+        f.write(_atom(b'mdat', rng.randbytes(audio_bytes)))
+
+
+def _write_ogg(path, rng, audio_bytes, opus):
+    if opus:
+        ident = b'OpusHead' + struct.pack('<BBHIhB', 1, 2, 312, 48000, 0, 0)
+        comment = b'OpusTags' + struct.pack('<I', 5) + b'synth' + struct.pack('<I', 0)
+        headers = [[ident], [comment]]
+    else:
+        ident = b'\x01vorbis' + struct.pack('<IBIiiiBB', 0, 2, 44100, 0, 128000, 0, 0xb8, 1)
+        comment = b'\x03vorbis' + struct.pack('<I', 5) + b'synth' + struct.pack('<I', 0) + b'\x01'
+        headers = [[ident], [comment, b'\x05vorbis' + b'\x00' * 30]]
+    pages = []
+    for packets in headers:
+        page = OggPage()
+        page.serial, page.sequence, page.packets, page.position = 1, len(pages), packets, 0
+        page.first = not pages
+        pages.append(page)
+    count = max(1, audio_bytes // 4000)
+    for i in range(count):
+        page = OggPage()
+        page.serial, page.sequence, page.packets = 1, len(pages), [rng.randbytes(4000)]
+        page.position = (i + 1) * 48000
+        page.last = i == count - 1
+        pages.append(page)
+    with open(path, 'wb') as f:
+        for page in pages:
+            f.write(page.write())
+
+
+def _write_aiff(path, rng, audio_bytes):
+    frames = max(1, audio_bytes // 4)
+    comm = struct.pack('>hLh', 2, frames, 16) + b'\x40\x0e\xac\x44' + b'\x00' * 6
+    ssnd = struct.pack('>LL', 0, 0) + rng.randbytes(frames * 4)
+    body = b'AIFF' + b'COMM' + struct.pack('>L', len(comm)) + comm + b'SSND' + struct.pack('>L', len(ssnd)) + ssnd
+    with open(path, 'wb') as f:
+        f.write(b'FORM' + struct.pack('>L', len(body)) + body)
+
+
+def _id3_frames(tags, genre, comment, cover):
+    if genre:
+        tags.add(TCON(encoding=3, text=genre))
+    if comment:
+        tags.add(COMM(encoding=3, lang='eng', desc='', text=comment))
+    if cover:
+        tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='', data=cover))
+
+
+def make_file(path, fmt, rng, genre='', comment='', cover=None, audio_bytes=64 * 1024):
+    """Один файл формата fmt с тегами; cover - байты JPEG или None"""
+    path = str(path)
+    if fmt == 'flac':
+        _write_flac(path, rng, audio_bytes)
+        audio = FLAC(path)
+        if genre:
+            audio['GENRE'] = genre
+        if comment:
+            audio['COMMENT'] = comment
+        if cover:
+            picture = Picture()
+            picture.type, picture.mime, picture.data = 3, 'image/jpeg', cover
+            audio.add_picture(picture)
+        audio.save()
+    elif fmt == 'mp3':
+        _write_mp3(path, rng, audio_bytes)
+        tags = ID3()
+        _id3_frames(tags, genre, comment, cover)
+        tags.save(path)
+    elif fmt == 'm4a':
+        _write_m4a(path, rng, audio_bytes)
+        audio = MP4(path)
+        audio.add_tags()
+        if genre:
+            audio['\xa9gen'] = genre
+        if comment:
+            audio['\xa9cmt'] = comment
+        if cover:
+            audio['covr'] = [MP4Cover(cover)]
+        audio.save()
+    elif fmt in ('ogg', 'opus'):
+        _write_ogg(path, rng, audio_bytes, opus=fmt == 'opus')
+        audio = OggOpus(path) if fmt == 'opus' else OggVorbis(path)
+        if genre:
+            audio['GENRE'] = genre
+        if comment:
+            audio['COMMENT'] = comment
+        audio.save()
+    elif fmt == 'aiff':
+        _write_aiff(path, rng, audio_bytes)
+        audio = AIFF(path)
+        audio.add_tags()
+        _id3_frames(audio.tags, genre, comment, cover)
+        audio.save()
+    else:
+        raise ValueError(f"unknown format: {fmt}")
+
+
+def make_library(directory, count, mix=DEFAULT_MIX, cover_kb=64, audio_kb=64, albums=0, seed=1):
+    """
+    Создает count файлов в directory, форматы - по весам mix
+    albums=0 - все файлы в корне (как входящая папка), иначе - по папкам
+    Artist/Album; у треков одного альбома одна и та же обложка
+    Возвращает список путей
+    """
+    rng = random.Random(seed)
+    mix = parse_mix(mix) if isinstance(mix, str) else mix
+    formats = [name for name, weight in mix for _ in range(weight)]
+    album_count = albums or max(1, count // 10)
+    covers = [b'\xff\xd8\xff\xe0' + rng.randbytes(cover_kb * 1024) if cover_kb else None
+              for _ in range(album_count)]
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+
+    files = []
+    for i in range(count):
+        fmt = formats[i % len(formats)]
+        album = i % album_count
+        folder = root / f"Artist {album % 7:02d}" / f"Album {album:03d}" if albums else root
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"track{i:05d}.{fmt}"
+        # Каждый третий трек - без обложки, как скачанные по одному
+        cover = covers[album] if i % 3 else None
+        make_file(path, fmt, rng, GENRES[i % len(GENRES)], COMMENTS[i % len(COMMENTS)],
+                  cover, audio_kb * 1024)
+        files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетическая библиотека для бенчмарков')
+    parser.add_argument('directory', help='куда создать файлы')
+    parser.add_argument('--count', type=int, default=100, help='сколько файлов (по умолчанию 100)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'веса форматов (по умолчанию {DEFAULT_MIX})')
+    parser.add_argument('--cover-kb', type=int, default=64, help='размер обложки, КБ (0 - без обложек)')
+    parser.add_argument('--audio-kb', type=int, default=64, help='объем аудиоданных файла, КБ')
+    parser.add_argument('--albums', type=int, default=0, help='разложить по N альбомам (по умолчанию - в корень)')
+    parser.add_argument('--seed', type=int, default=1, help='seed содержимого (по умолчанию 1)')
+    args = parser.parse_args()
+    try:
+        files = make_library(args.directory, args.count, args.mix, args.cover_kb, args.audio_kb,
+                             args.albums, args.seed)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    print(f"🛠  Создано {len(files)} файлов в {args.directory}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Общий каталог тегов на диске (SQLite)
+Хранит извлеченные теги, формат и параметры потока для каждого файла,
+чтобы скрипты не разбирали mutagen'ом неизмененные файлы при каждом запуске.
+Запись считается актуальной, пока совпадают (inode, размер, mtime) файла.
+
+Путь к базе: переменная окружения MUSIC_TOOLS_CATALOG
+(значение 'off' отключает хранение на диске), иначе ~/.cache/music-tools/catalog.sqlite3
+
+Процессы пула открывают базу только на чтение (detach_catalog), а новые
+записи возвращают родителю вместе с результатом - пишет базу только он:
+    results = pool.map(pool_task(task), items)       # задача идет в воркере
+    for result in merge_catalog_updates(results):    # в родителе
+        ...
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from mutagen._vorbis import VCommentDict
+from mutagen.mp4 import MP4FreeForm, AtomDataType
+
+import fast_tags
+from format_sniff import open_audio
+from instrumentation import stage, count
+
+SCHEMA_VERSION = 2
+
+# Сколько изменений копить до COMMIT
+COMMIT_EVERY = 200
+
+# Ключи, под которыми разные форматы хранят жанр
+GENRE_KEYS = ['GENRE', 'TCON', '©gen', 'Genre', 'genre']
+
+# Бинарные теги, которые не имеет смысла хранить в каталоге
+BINARY_TAG_PREFIXES = ('APIC', 'covr', 'METADATA_BLOCK_PICTURE', 'GEOB', 'PRIV', 'MCDI')
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def cache_dir():
+    """
+    Возвращает (и создает) каталог для служебных файлов music-tools
+    """
+    base = os.environ.get('MUSIC_TOOLS_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'music-tools')
+    path = Path(base)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def catalog_key(path):
+    """Ключ файла в каталоге - абсолютный путь без разрешения ссылок"""
+    return os.path.abspath(str(path))
+
+
+def _is_binary_key(key):
+    return any(key.startswith(prefix) for prefix in BINARY_TAG_PREFIXES)
+
+
+def _value_to_str(value):
+    if isinstance(value, MP4FreeForm):
+        # '----:com.apple.iTunes:...' - текст, если он текстовый
+        if value.dataformat == AtomDataType.UTF8:
+            return value.decode('utf-8', 'replace')
+        if value.dataformat == AtomDataType.UTF16:
+            return value.decode('utf-16-be', 'replace')
+        return None
+    if isinstance(value, bytes):
+        return None
+    if isinstance(value, tuple):
+        return '/'.join(str(v) for v in value)
+    return str(value)
+
+
+def tags_to_dict(audio):
+    """
+    Преобразует теги mutagen в словарь {ключ: [строки]}
+    Vorbis-комментарии приводятся к верхнему регистру (GENRE),
+    ID3-фреймы и MP4-атомы сохраняют свои имена (TCON, ©gen)
+    """
+    tags = {}
+    if audio is None or audio.tags is None:
+        return tags
+
+    for key, value in audio.tags.items():
+        if _is_binary_key(key):
+            continue
+
+        if hasattr(value, 'text'):
+            # ID3-фрейм
+            values = [str(v) for v in value.text]
+        elif isinstance(value, list):
+            values = [_value_to_str(v) for v in value]
+        else:
+            values = [_value_to_str(value)]
+
+        values = [v for v in values if v is not None]
+        if not values:
+            continue
+
+        # У Vorbis-комментариев ключи регистронезависимы
+        if isinstance(audio.tags, VCommentDict):
+            key = key.upper()
+
+        tags.setdefault(key, []).extend(values)
+
+    return tags
+
+
+def info_to_dict(audio):
+    """
+    Извлекает параметры потока (длительность, частота, каналы, битрейт)
+    """
+    info = {}
+    stream = getattr(audio, 'info', None)
+    if stream is not None:
+        for name in ['length', 'sample_rate', 'channels', 'bitrate', 'bits_per_sample']:
+            value = getattr(stream, name, None)
+            if isinstance(value, (int, float)):
+                info[name] = value
+        md5 = getattr(stream, 'md5_signature', None)
+        if md5:
+            info['md5'] = '%032x' % md5
+
+    pictures = getattr(audio, 'pictures', None)
+    if pictures is not None:
+        info['pictures'] = len(pictures)
+    return info
+
+
+def record_from_audio(audio):
+    """Строит запись каталога из уже открытого объекта mutagen"""
+    return {
+        'format': type(audio).__name__,
+        'tags': tags_to_dict(audio),
+        'info': info_to_dict(audio),
+    }
+
+
+def first_tag(tags, keys):
+    """Возвращает первое непустое значение из списка ключей"""
+    for key in keys:
+        values = tags.get(key)
+        if values:
+            return values[0]
+    return None
+
+
+def genre_from_record(record):
+    """Жанр из записи каталога (или None)"""
+    if not record:
+        return None
+    return first_tag(record['tags'], GENRE_KEYS)
+
+
+class TagCatalog:
+    """
+    Каталог тегов поверх SQLite
+    Один объект можно использовать из нескольких потоков
+    """
+
+    def __init__(self, db_path, readonly=False):
+        self.db_path = str(db_path)
+        self.readonly = readonly
+        self._lock = threading.RLock()
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+        # Только для readonly: записи этого процесса (ключ → строка или None - удалить)
+        self._overlay = {}
+        self._updates = []
+
+        if readonly:
+            self._conn = self._connect_readonly()
+            return
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self.db_path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    def _connect_readonly(self):
+        """База на чтение (WAL позволяет читать, пока родитель пишет); нет базы - пустая в памяти"""
+        if self.db_path != ':memory:' and os.path.exists(self.db_path):
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+            try:
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+                    conn.execute('SELECT 1 FROM files LIMIT 1')
+                    return conn
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self.db_path = ':memory:'
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._conn = conn
+        self._create_schema()
+        return conn
+
+    def _create_schema(self):
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # Формат каталога поменялся - проще собрать его заново
+            self._conn.execute('DROP TABLE IF EXISTS files')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                format TEXT,
+                tags TEXT NOT NULL,
+                info TEXT NOT NULL,
+                scanned_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._conn.commit()
+
+    def _maybe_commit(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._conn.commit()
+            self._pending = 0
+
+    def _get_row(self, key):
+        """(inode, size, mtime_ns, format, tags, info) или None"""
+        with self._lock:
+            if key in self._overlay:
+                return self._overlay[key]
+            return self._conn.execute(
+                'SELECT inode, size, mtime_ns, format, tags, info FROM files WHERE path = ?',
+                (key,)).fetchone()
+
+    def _put_row(self, key, row):
+        """row=None - удалить запись; в readonly - запомнить для родителя"""
+        with self._lock:
+            if self.readonly:
+                self._overlay[key] = row
+                self._updates.append((key, row))
+                return
+            if row is None:
+                self._conn.execute('DELETE FROM files WHERE path = ?', (key,))
+            else:
+                self._conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (key, *row, time.time()))
+            self._maybe_commit()
+
+    def take_updates(self):
+        """Записи, накопленные процессом пула (readonly) с прошлого вызова"""
+        with self._lock:
+            updates, self._updates = self._updates, []
+            return updates
+
+    def apply_updates(self, updates):
+        """Сохраняет записи, которые вернул процесс пула"""
+        for key, row in updates:
+            self._put_row(key, tuple(row) if row is not None else None)
+
+    def lookup(self, path, st=None):
+        """
+        Возвращает запись для файла, если он не менялся с момента сканирования
+        """
+        key = catalog_key(path)
+        if st is None:
+            try:
+                st = os.stat(key)
+            except OSError:
+                return None
+
+        row = self._get_row(key)
+        if row is None:
+            return None
+        inode, size, mtime_ns, fmt, tags, info = row
+        if (inode, size, mtime_ns) != (st.st_ino, st.st_size, st.st_mtime_ns):
+            return None
+        return {'format': fmt, 'tags': json.loads(tags), 'info': json.loads(info)}
+
+    def store(self, path, record, st=None):
+        """Сохраняет запись для файла с текущими (inode, размер, mtime)"""
+        key = catalog_key(path)
+        if st is None:
+            st = os.stat(key)
+
+        self._put_row(key, (st.st_ino, st.st_size, st.st_mtime_ns, record.get('format'),
+                            json.dumps(record.get('tags', {}), ensure_ascii=False),
+                            json.dumps(record.get('info', {}))))
+
+    def read(self, path, opener=open_audio, fast=True):
+        """
+        Возвращает запись из каталога, а при промахе разбирает файл
+        быстрым чтением заголовков (fast_tags), если оно справилось,
+        иначе функцией opener (по умолчанию format_sniff.open_audio), и сохраняет результат
+        """
+        return self.read_source(path, opener, fast)[0]
+
+    def read_source(self, path, opener=open_audio, fast=True):
+        """
+        Как read, но возвращает (запись, откуда): 'cached' - из каталога,
+        'fast' - быстрое чтение, 'parsed' - через opener; (None, None) -
+        формат не поддерживается. Объект mutagen, если он понадобится
+        дальше, может сохранить сам opener (см. audio_handle)
+        """
+        key = catalog_key(path)
+        st = os.stat(key)
+        record = self.lookup(key, st)
+        if record is not None:
+            self.hits += 1
+            count('catalog_hits')
+            return record, 'cached'
+
+        self.misses += 1
+        count('catalog_misses')
+        source = 'fast'
+        with stage('parse'):
+            if fast:
+                record = fast_tags.read_tags(key)
+            if record is None:
+                source = 'parsed'
+                audio = opener(key)
+                if audio is None:
+                    return None, None
+                record = record_from_audio(audio)
+        self.store(key, record, st)
+        return record, source
+
+    def refresh(self, path, audio):
+        """
+        Обновляет запись после того, как скрипт сам сохранил файл через mutagen
+        Повторного разбора не требуется - берем теги из объекта в памяти
+        """
+        try:
+            self.store(path, record_from_audio(audio))
+        except OSError:
+            self.forget(path)
+
+    def move(self, src, dst):
+        """
+        Переносит запись на новый путь после перемещения файла
+        Только если dst - тот же файл (rename или жесткая ссылка: тот же inode
+        и размер); иначе запись src просто удаляется. Возвращает True, если перенесена
+        """
+        src_key, dst_key = catalog_key(src), catalog_key(dst)
+        with self._lock:
+            row = self._get_row(src_key)
+            self._put_row(src_key, None)
+            if row is None:
+                return False
+            inode, size, _, fmt, tags, info = row
+            try:
+                st = os.stat(dst_key)
+            except OSError:
+                return False
+            if (st.st_ino, st.st_size) != (inode, size):
+                return False
+            self._put_row(dst_key, (st.st_ino, st.st_size, st.st_mtime_ns, fmt, tags, info))
+            return True
+
+    def forget(self, path):
+        """Удаляет запись о файле"""
+        self._put_row(catalog_key(path), None)
+
+    def close(self):
+        """Сохраняет накопленные изменения и закрывает базу"""
+        with self._lock:
+            if self._conn is not None:
+                if not self.readonly:
+                    self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+
+def get_catalog():
+    """
+    Возвращает общий для процесса каталог (создается при первом вызове)
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = TagCatalog(catalog_path())
+            atexit.register(_catalog.close)
+        return _catalog
+
+
+def catalog_path():
+    db_path = os.environ.get('MUSIC_TOOLS_CATALOG')
+    if db_path == 'off':
+        return ':memory:'
+    return db_path or cache_dir() / 'catalog.sqlite3'
+
+
+def detach_catalog():
+    """
+    Для дочерних процессов пула: забыть унаследованное соединение и открыть
+    базу только на чтение. Новые записи копятся в процессе и уходят
+    родителю (catalog_task → merge_catalog_updates) - общий файл базы
+    пишет только он
+    """
+    global _catalog
+    with _catalog_lock:
+        _catalog = TagCatalog(catalog_path(), readonly=True)
+        atexit.register(_catalog.close)
+
+
+def catalog_updates():
+    """Записи каталога, созданные в этом процессе пула с прошлого вызова"""
+    return get_catalog().take_updates()
+
+
+def catalog_task(task, item):
+    """Обертка задачи пула: (результат, новые записи каталога)"""
+    return task(item), catalog_updates()
+
+
+def merge_catalog_updates(results):
+    """Родитель: сохраняет записи из результатов catalog_task и отдает сами результаты"""
+    catalog = get_catalog()
+    for result, updates in results:
+        catalog.apply_updates(updates)
+        yield result
+
+
+def pool_task(task):
+    """partial(catalog_task, task) - задачу можно передать в pool.map"""
+    return partial(catalog_task, task)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Декларативная правка тегов: упорядоченный список правил замены по регулярным выражениям
+
+Файл правил - JSON:
+{
+    "rules": [
+        {"name": "strip-color", "field": "comment", "regex": "\\\\bcolor=", "replace": ""},
+        {"name": "feat", "field": "artist", "regex": "\\\\s+ft\\\\.?\\\\s+", "replace": " feat. ",
+         "ignore_case": true, "when": {"genre": "house"}, "unless": {"comment": "^keep$"},
+         "formats": ["FLAC", "MP3"]},
+        {"name": "drop-empty-comments", "field": "comment", "regex": "^\\\\s+$", "replace": "",
+         "drop_empty": true}
+    ]
+}
+
+field - логическое поле (см. tag_writer.FIELD_KEYS) или ключ тега как есть
+when / unless - поле → regex: правило работает, только если у каждого поля из
+when есть совпавшее значение и ни у одного из unless нет (регистр не важен)
+formats - форматы из каталога ('FLAC', 'MP3', 'MP4', 'OggVorbis', ...)
+drop_empty - выбросить значения, ставшие пустыми
+
+Правила применяются по порядку к текущим (уже исправленным) значениям,
+все изменения файла пишутся одной записью через тот же объект, по которому
+они спланированы (audio_handle.AudioHandle).
+
+rewrite_files прогоняет правила по списку файлов - в текущем процессе
+или, если файлов много, в пуле процессов кусками по CHUNK_SIZE.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation as inst
+from audio_handle import AudioHandle
+from flac_writer import format_report
+from format_sniff import open_audio
+from tag_catalog import get_catalog, detach_catalog, catalog_updates
+from tag_writer import tag_key, set_dry_run, is_dry_run
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+# Сколько файлов отдавать процессу за раз
+CHUNK_SIZE = 64
+
+RULE_KEYS = {'name', 'field', 'regex', 'replace', 'ignore_case', 'count',
+             'when', 'unless', 'formats', 'drop_empty'}
+
+
+class RewriteError(Exception):
+    """Ошибка в файле правил"""
+
+
+def _compile(pattern, flags=0):
+    try:
+        return re.compile(pattern, flags)
+    except re.error as e:
+        raise RewriteError(f"bad regex {pattern!r}: {e}")
+
+
+def load_rules(path):
+    """
+    Список правил (словари) из JSON-файла - в таком виде они передаются
+    в процессы пула, где компилируются заново
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RewriteError(f"cannot read rules file {path}: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get('rules'), list):
+        raise RewriteError("rules file must contain {\"rules\": [...]}")
+    return data['rules']
+
+
+class RewriteRule:
+    """Одно правило замены; apply() возвращает новые значения или None, если ничего не поменялось"""
+
+    def __init__(self, field, regex, replace='', name=None, ignore_case=False, count=0,
+                 when=None, unless=None, formats=None, drop_empty=False):
+        if not field or regex is None:
+            raise RewriteError(f"rule needs 'field' and 'regex': {name or regex!r}")
+        self.name = name or f"{field}:{regex}"
+        self.field = field
+        self.pattern = _compile(regex, re.IGNORECASE if ignore_case else 0)
+        self.replace = replace
+        self.count = count
+        self.when = {f: _compile(p, re.IGNORECASE) for f, p in (when or {}).items()}
+        self.unless = {f: _compile(p, re.IGNORECASE) for f, p in (unless or {}).items()}
+        self.formats = frozenset(formats) if formats else None
+        self.drop_empty = drop_empty
+
+    @staticmethod
+    def _any_match(pattern, values):
+        return any(pattern.search(value) for value in values)
+
+    def applies(self, fmt, fields):
+        """fields(field) → текущие значения поля"""
+        if self.formats is not None and fmt not in self.formats:
+            return False
+        if not all(self._any_match(p, fields(f)) for f, p in self.when.items()):
+            return False
+        return not any(self._any_match(p, fields(f)) for f, p in self.unless.items())
+
+    def apply(self, values):
+        new = [self.pattern.sub(self.replace, value, count=self.count) for value in values]
+        if self.drop_empty:
+            new = [value for value in new if value.strip()]
+        return new if new != values else None
+
+
+class TagRewriter:
+    """
+    Скомпилированный список правил и статистика по ним (срабатывания, время)
+
+    Использование:
+        rewriter = TagRewriter.load('rules.json')
+        changes = rewriter.plan(record)          # {ключ тега: новые значения}
+        update = rewriter.rewrite(path)          # одно чтение, не больше одной записи
+    """
+
+    def __init__(self, rules):
+        if not rules:
+            raise RewriteError("at least one rule is required")
+        self.rules = rules
+        self.hits = [0] * len(rules)
+        self.seconds = [0.0] * len(rules)
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise RewriteError("rule names must be unique")
+
+    @classmethod
+    def from_dicts(cls, rules):
+        parsed = []
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise RewriteError(f"rule must be a JSON object: {rule!r}")
+            unknown = set(rule) - RULE_KEYS
+            if unknown:
+                raise RewriteError(f"unknown keys in rule {rule.get('name', '')!r}: {', '.join(sorted(unknown))}")
+            try:
+                parsed.append(RewriteRule(**rule))
+            except TypeError as e:
+                raise RewriteError(f"bad rule {rule!r}: {e}")
+        return cls(parsed)
+
+    @classmethod
+    def load(cls, path):
+        """Загружает правила из JSON-файла"""
+        return cls.from_dicts(load_rules(path))
+
+    def plan(self, record):
+        """
+        Применяет все правила к записи каталога
+        Возвращает {ключ тега: новые значения} только для изменившихся полей
+        """
+        fmt = record['format']
+        current = {}
+
+        def fields(field):
+            key = tag_key(fmt, field)
+            if key not in current:
+                current[key] = list(record['tags'].get(key, []))
+            return current[key]
+
+        changed = set()
+        for index, rule in enumerate(self.rules):
+            started = time.perf_counter()
+            if rule.applies(fmt, fields):
+                key = tag_key(fmt, rule.field)
+                new = rule.apply(fields(rule.field))
+                if new is not None:
+                    current[key] = new
+                    changed.add(key)
+                    self.hits[index] += 1
+            self.seconds[index] += time.perf_counter() - started
+        return {key: current[key] for key in changed if current[key] != record['tags'].get(key, [])}
+
+    def rewrite(self, path, opener=None):
+        """
+        Правит один файл: план по записи каталога, затем одна запись
+        через тот же разобранный объект (файл разбирается не больше одного раза)
+        Возвращает TagUpdate
+        """
+        handle = AudioHandle(path, opener or open_audio)
+        try:
+            record = handle.load()
+            if record is None:
+                raise ValueError(f"unsupported audio file: {path}")
+            return handle.update_tags(self.plan(record))
+        finally:
+            handle.release()
+
+    def merge_stats(self, hits, seconds):
+        """Добавляет статистику, посчитанную в другом процессе"""
+        for index in range(len(self.rules)):
+            self.hits[index] += hits[index]
+            self.seconds[index] += seconds[index]
+
+    def report(self):
+        """[(имя правила, срабатываний, мс)] в порядке правил"""
+        return [(rule.name, self.hits[i], round(self.seconds[i] * 1000, 3)) for i, rule in enumerate(self.rules)]
+
+
+def rewrite_one(rewriter, path, opener=None):
+    """Возвращает (путь, статус, сообщение): 'updated', 'planned', 'unchanged' или 'error'"""
+    try:
+        update = rewriter.rewrite(path, opener=opener)
+    except Exception as e:
+        return path, 'error', str(e)
+    if update.written:
+        return path, 'updated', format_report(update.report) if update.report else ''
+    return path, 'planned' if update.changes else 'unchanged', ''
+
+
+# Правила и opener воркера (правила компилируются один раз на процесс)
+_worker_rewriter = None
+_worker_opener = None
+
+
+def _init_worker(rules, opener, dry_run, verbose):
+    global _worker_rewriter, _worker_opener
+    detach_catalog()
+    set_dry_run(dry_run)
+    inst.configure(verbose=verbose)
+    _worker_rewriter = TagRewriter.from_dicts(rules)
+    _worker_opener = opener
+
+
+def _rewrite_chunk(paths):
+    # Статистика правил, метрики и новые записи каталога - только за этот кусок, родитель их суммирует
+    rewriter = _worker_rewriter
+    rewriter.hits = [0] * len(rewriter.rules)
+    rewriter.seconds = [0.0] * len(rewriter.rules)
+    inst.reset()
+    results = [rewrite_one(rewriter, path, _worker_opener) for path in paths]
+    return results, rewriter.hits, rewriter.seconds, inst.snapshot(), catalog_updates()
+
+
+def rewrite_files(files, rules, workers=DEFAULT_WORKERS, opener=None, on_result=None):
+    """
+    Применяет правила (список словарей) ко всем файлам
+    workers=1 или файлов не больше CHUNK_SIZE - в текущем процессе
+    opener - класс mutagen или функция открытия (по умолчанию format_sniff.open_audio)
+    on_result(путь, статус, сообщение) вызывается для каждого файла
+    Возвращает (TagRewriter со статистикой, сводка)
+    """
+    started = time.perf_counter()
+    rewriter = TagRewriter.from_dicts(rules)
+    summary = {'files': len(files), 'updated': 0, 'planned': 0, 'unchanged': 0, 'error': 0}
+
+    def account(results):
+        for path, status, message in results:
+            summary[status] += 1
+            inst.progress(sum(summary[key] for key in ('updated', 'planned', 'unchanged', 'error')), len(files))
+            if on_result:
+                on_result(path, status, message)
+
+    if workers <= 1 or len(files) <= CHUNK_SIZE:
+        account(rewrite_one(rewriter, path, opener) for path in files)
+    else:
+        chunks = [files[i:i + CHUNK_SIZE] for i in range(0, len(files), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(rules, opener, is_dry_run(), inst.is_verbose())) as pool:
+            for results, hits, seconds, metrics, updates in pool.map(_rewrite_chunk, chunks):
+                get_catalog().apply_updates(updates)
+                account(results)
+                rewriter.merge_stats(hits, seconds)
+                inst.merge(metrics)
+
+    elapsed = time.perf_counter() - started
+    summary['elapsed_s'] = round(elapsed, 3)
+    summary['files_per_s'] = round(len(files) / elapsed, 1) if elapsed > 0 else None
+    return rewriter, summary
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Общий слой изменения тегов для всех скриптов
+Сравнивает старые и новые значения и пишет только файлы, в которых
+что-то действительно меняется. В режиме dry-run печатает план изменений
+(файл, поле, было → стало) и ничего не трогает на диске.
+
+Режим dry-run включается set_dry_run(True) или MUSIC_TOOLS_DRY_RUN=1
+"""
+
+import os
+from collections import namedtuple
+
+from mutagen.flac import FLAC
+from mutagen.id3 import Frames, COMM, TXXX
+
+from tag_catalog import get_catalog, tags_to_dict
+from flac_writer import save_flac
+from format_sniff import open_audio
+from instrumentation import stage, count
+
+# Одно изменение: поле (ключ тега в файле), старые и новые значения
+TagChange = namedtuple('TagChange', ['path', 'field', 'old', 'new'])
+
+# Итог обновления файла: список изменений, был ли файл записан, отчет записи FLAC
+TagUpdate = namedtuple('TagUpdate', ['path', 'changes', 'written', 'report'])
+
+# Логические поля и их ключи в разных семействах тегов
+FIELD_KEYS = {
+    'genre': {'vorbis': 'GENRE', 'id3': 'TCON', 'mp4': '©gen'},
+    'comment': {'vorbis': 'COMMENT', 'id3': 'COMM::eng', 'mp4': '©cmt'},
+    'artist': {'vorbis': 'ARTIST', 'id3': 'TPE1', 'mp4': '©ART'},
+    'album': {'vorbis': 'ALBUM', 'id3': 'TALB', 'mp4': '©alb'},
+    'title': {'vorbis': 'TITLE', 'id3': 'TIT2', 'mp4': '©nam'},
+}
+
+TAG_FAMILIES = {
+    'FLAC': 'vorbis',
+    'OggVorbis': 'vorbis',
+    'OggOpus': 'vorbis',
+    'MP3': 'id3',
+    'AIFF': 'id3',
+    'MP4': 'mp4',
+}
+
+DRY_RUN = os.environ.get('MUSIC_TOOLS_DRY_RUN', '') not in ('', '0')
+
+
+def set_dry_run(enabled):
+    """Включает или выключает режим предпросмотра для всего процесса"""
+    global DRY_RUN
+    DRY_RUN = bool(enabled)
+
+
+def is_dry_run():
+    return DRY_RUN
+
+
+def tag_key(format_name, field):
+    """
+    Ключ тега в файле для логического поля ('genre' → GENRE/TCON/©gen)
+    Неизвестные поля возвращаются как есть (для Vorbis - в верхнем регистре)
+    """
+    family = TAG_FAMILIES.get(format_name, 'vorbis')
+    keys = FIELD_KEYS.get(field.lower())
+    if keys:
+        return keys[family]
+    return field.upper() if family == 'vorbis' else field
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _set_id3(audio, key, values):
+    """Записывает значения в ID3-кадр (TCON, COMM:desc:lang, TXXX:desc, T***)"""
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags.delall(key)
+    if not values:
+        return
+    frame_id, _, rest = key.partition(':')
+    if frame_id == 'COMM':
+        desc, _, lang = rest.partition(':')
+        audio.tags.add(COMM(encoding=3, lang=lang or 'eng', desc=desc, text=values))
+    elif frame_id == 'TXXX':
+        audio.tags.add(TXXX(encoding=3, desc=rest, text=values))
+    else:
+        audio.tags.add(Frames[frame_id](encoding=3, text=values))
+
+
+def set_tag(audio, key, values):
+    """Записывает значения тега в открытый объект mutagen (без сохранения)"""
+    family = TAG_FAMILIES.get(type(audio).__name__, 'vorbis')
+    if family == 'id3':
+        _set_id3(audio, key, values)
+        return
+    if audio.tags is None:
+        audio.add_tags()
+    if values:
+        audio[key] = values
+    elif key in audio:
+        del audio[key]
+
+
+def plan_changes(path, record, changes):
+    """
+    Сравнивает запись каталога с желаемыми значениями
+    changes - {поле: значение или список}, None удаляет поле
+    Возвращает список TagChange только для реально меняющихся полей
+    """
+    planned = []
+    for field, value in changes.items():
+        key = tag_key(record['format'], field)
+        old = record['tags'].get(key, [])
+        new = _as_list(value)
+        if old != new:
+            planned.append(TagChange(str(path), key, old, new))
+    return planned
+
+
+def print_plan(changes):
+    """Печатает план изменений: файл, поле, было → стало"""
+    for change in changes:
+        old = '; '.join(change.old) if change.old else '—'
+        new = '; '.join(change.new) if change.new else '—'
+        print(f"🧪 {change.path}: {change.field}: '{old}' → '{new}'")
+
+
+def commit(audio, changes, dry_run=None, max_padding=None):
+    """
+    Сохраняет уже измененный объект mutagen, если список изменений не пуст
+    В dry-run только печатает план
+    max_padding - см. flac_writer.save_flac
+    Возвращает TagUpdate
+    """
+    path = audio.filename
+    if dry_run is None:
+        dry_run = DRY_RUN
+    if not changes:
+        return TagUpdate(path, [], False, None)
+    if dry_run:
+        print_plan(changes)
+        return TagUpdate(path, changes, False, None)
+
+    with stage('save'):
+        report = save_flac(audio, max_padding=max_padding) if isinstance(audio, FLAC) else None
+        if report is None:
+            audio.save()
+    get_catalog().refresh(path, audio)
+    count('files_written')
+    if report is not None:
+        count('bytes_written', report.bytes_written)
+    return TagUpdate(path, changes, True, report)
+
+
+def update_tags(path, changes, opener=open_audio, dry_run=None):
+    """
+    Меняет теги файла только если значения отличаются
+    Сравнение идет по каталогу тегов - неизмененный файл даже не разбирается
+    changes - {поле: значение}; поля - логические ('genre', 'comment')
+    или ключи тегов как есть
+    """
+    record = get_catalog().read(path, opener)
+    if record is None:
+        raise ValueError(f"unsupported audio file: {path}")
+
+    planned = plan_changes(path, record, changes)
+    if not planned:
+        return TagUpdate(str(path), [], False, None)
+    if dry_run is None:
+        dry_run = DRY_RUN
+    if dry_run:
+        print_plan(planned)
+        return TagUpdate(str(path), planned, False, None)
+
+    audio = opener(str(path))
+    # Сверяемся с тем, что реально лежит в файле
+    planned = plan_changes(path, {'format': type(audio).__name__, 'tags': tags_to_dict(audio)}, changes)
+    if not planned:
+        get_catalog().refresh(path, audio)
+        return TagUpdate(str(path), [], False, None)
+    for change in planned:
+        set_tag(audio, change.field, change.new)
+    return commit(audio, planned, dry_run=False)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: быстрое чтение тегов из заголовков (fast_tags) против mutagen
+Запуск:
+  python z_bench_fast_tags.py                 - синтетические файлы с большими обложками
+  python z_bench_fast_tags.py папка файл ...  - свои файлы
+Параметры синтетики: --count N --cover-mb M --rounds R
+"""
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from mutagen import File as MutagenFile
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import ID3, TCON, APIC
+from mutagen.mp4 import MP4, MP4Cover
+
+import fast_tags
+from tag_catalog import record_from_audio, genre_from_record
+from discovery import iter_audio_files
+
+
+def make_flac(path, genre, cover):
+    """Минимальный FLAC: STREAMINFO + немного данных, теги через mutagen"""
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | 441000
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6 + packed.to_bytes(8, 'big') + os.urandom(16)
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+        f.write(b'\xff\xf8' + os.urandom(64 * 1024))
+    audio = FLAC(path)
+    audio['GENRE'] = genre
+    picture = Picture()
+    picture.type = 3
+    picture.mime = 'image/jpeg'
+    picture.data = cover
+    audio.add_picture(picture)
+    audio.save()
+
+
+def make_mp3(path, genre, cover):
+    """Минимальный MP3: кадры MPEG1 Layer III 128 кбит/с, ID3v2 с APIC"""
+    frame = b'\xff\xfb\x90\x64' + b'\x00' * 413
+    with open(path, 'wb') as f:
+        f.write(frame * 150)
+    tags = ID3()
+    tags.add(TCON(encoding=3, text=genre))
+    tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='', data=cover))
+    tags.save(path)
+
+
+def make_m4a(path, genre, cover):
+    """Минимальный M4A: ftyp + moov/mvhd + mdat, теги через mutagen"""
+    def atom(name, data):
+        return struct.pack('>I', 8 + len(data)) + name + data
+    mvhd = atom(b'mvhd', b'\x00' * 4 + struct.pack('>IIII', 0, 0, 1000, 10000) + b'\x00' * 80)
+    with open(path, 'wb') as f:
+        f.write(atom(b'ftyp', b'M4A \x00\x00\x00\x00M4A mp42isom'))
+        f.write(atom(b'moov', mvhd))
+        f.write(atom(b'mdat', os.urandom(64 * 1024)))
+    audio = MP4(path)
+    audio.add_tags()
+    audio['\xa9gen'] = genre
+    audio['covr'] = [MP4Cover(cover)]
+    audio.save()
+
+
+def make_synthetic_files(directory, count, cover_mb):
+    """Создает count файлов каждого формата с обложкой cover_mb МБ"""
+    cover = b'\xff\xd8\xff\xe0' + os.urandom(int(cover_mb * 1024 * 1024))
+    files = []
+    for i in range(count):
+        for ext, maker in [('.flac', make_flac), ('.mp3', make_mp3), ('.m4a', make_m4a)]:
+            path = Path(directory) / f'bench_{i:03d}{ext}'
+            maker(str(path), 'Deep House', cover)
+            files.append(path)
+    return files
+
+
+def collect_files(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(iter_audio_files(path, fast_tags.READERS.keys())))
+        elif path.is_file():
+            files.append(path)
+    return files
+
+
+def measure(reader, path):
+    """Время и пиковое выделение памяти одного чтения"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    record = reader(path)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return record, elapsed, peak
+
+
+def read_with_mutagen(path):
+    return record_from_audio(MutagenFile(str(path)))
+
+
+def run_benchmark(files, rounds):
+    """Возвращает статистику по форматам: {ext: {...}}"""
+    stats = {}
+    mismatches = 0
+    for path in files:
+        ext = path.suffix.lower()
+        row = stats.setdefault(ext, {'files': 0, 'mutagen_s': 0.0, 'fast_s': 0.0,
+                                     'mutagen_peak': 0, 'fast_peak': 0, 'fallbacks': 0})
+        row['files'] += 1
+        for _ in range(rounds):
+            slow, slow_time, slow_peak = measure(read_with_mutagen, path)
+            fast, fast_time, fast_peak = measure(fast_tags.read_tags, path)
+            row['mutagen_s'] += slow_time
+            row['fast_s'] += fast_time
+            row['mutagen_peak'] = max(row['mutagen_peak'], slow_peak)
+            row['fast_peak'] = max(row['fast_peak'], fast_peak)
+        if fast is None:
+            row['fallbacks'] += 1
+        elif genre_from_record(fast) != genre_from_record(slow):
+            mismatches += 1
+            print(f"⚠️  Жанр не совпал: {path}")
+    return stats, mismatches
+
+
+def print_report(stats, rounds):
+    print(f"\n{'формат':<8}{'файлов':>8}{'mutagen мс':>13}{'fast мс':>10}{'ускорение':>11}"
+          f"{'mutagen КБ':>13}{'fast КБ':>10}{'fallback':>10}")
+    for ext, row in sorted(stats.items()):
+        reads = row['files'] * rounds
+        slow_ms = row['mutagen_s'] / reads * 1000
+        fast_ms = row['fast_s'] / reads * 1000
+        speedup = slow_ms / fast_ms if fast_ms else 0
+        print(f"{ext:<8}{row['files']:>8}{slow_ms:>13.3f}{fast_ms:>10.3f}{speedup:>10.1f}x"
+              f"{row['mutagen_peak'] / 1024:>13.0f}{row['fast_peak'] / 1024:>10.0f}{row['fallbacks']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение fast_tags и mutagen')
+    parser.add_argument('paths', nargs='*', help='файлы или папки (по умолчанию - синтетика)')
+    parser.add_argument('--count', type=int, default=20, help='синтетических файлов каждого формата')
+    parser.add_argument('--cover-mb', type=float, default=3.0, help='размер обложки в МБ')
+    parser.add_argument('--rounds', type=int, default=3, help='повторов чтения каждого файла')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_fast_tags_') as tmp:
+        if args.paths:
+            files = collect_files(args.paths)
+        else:
+            print(f"🛠  Создаю {args.count * 3} файлов с обложкой {args.cover_mb} МБ...")
+            files = make_synthetic_files(tmp, args.count, args.cover_mb)
+
+        if not files:
+            print("❌ Файлы не найдены")
+            return 1
+
+        print(f"⏱  Замеряю {len(files)} файлов, {args.rounds} повтор(а) (кэш ОС прогрет)")
+        stats, mismatches = run_benchmark(files, args.rounds)
+        print_report(stats, args.rounds)
+        if mismatches:
+            print(f"\n❌ Расхождений по жанру: {mismatches}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
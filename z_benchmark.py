@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк основных сценариев на синтетической библиотеке (synth_library.py)
+
+Сценарии:
+    scan                поиск файлов (discovery)
+    genre               get_genre_from_file по каждому файлу
+    batch               process_files_batch (раскладка по правилам, с записью жанра)
+    update_genre_tags   update_genre_tags (жанр = имя папки, только FLAC)
+    strip_color_prefix  process_directory (только FLAC)
+    artwork             extract_and_reembed_artwork по каждому FLAC
+
+Каждый сценарий идет в отдельном процессе на свежей копии библиотеки
+с пустым каталогом тегов и журналом, поэтому замеры не влияют друг на друга.
+Для каждого пишется: файлов, секунд, файлов/с, байт прочитано и записано
+(/proc/self/io, вместе с воркерами) и пиковый RSS.
+
+Запуск:
+  python z_benchmark.py                                   - все сценарии, 500 файлов
+  python z_benchmark.py --count 2000 --mix flac=1 --only batch,artwork
+  python z_benchmark.py --output before.json
+  python z_benchmark.py --output after.json --compare before.json
+
+Результаты сравнимы между коммитами: библиотека задается --count/--mix/
+--cover-kb/--audio-kb/--seed, эти параметры и коммит пишутся в JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from synth_library import make_library, parse_mix, DEFAULT_MIX
+
+WORKLOADS = ('scan', 'genre', 'batch', 'update_genre_tags', 'strip_color_prefix', 'artwork')
+
+# Правила для batch: часть файлов переименовывает жанр (запись тегов), часть - нет
+BATCH_RULES = {'exact': {'Deep House': 'House', 'Techno/Minimal': 'Techno'}, 'default': '_Unsorted'}
+
+
+def read_io():
+    """(прочитано, записано) байт процессом и его завершенными детьми или (None, None)"""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_kb():
+    """Пиковый RSS процесса и его детей, КБ (на macOS ru_maxrss - в байтах)"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_scan(library):
+    from discovery import iter_audio_files
+    return sum(1 for _ in iter_audio_files(library))
+
+
+def run_genre(library):
+    from discovery import iter_audio_files
+    from z_move_files_by_genre import get_genre_from_file
+    files = list(iter_audio_files(library))
+    for path in files:
+        get_genre_from_file(path, quiet=True)
+    return len(files)
+
+
+def run_batch(library):
+    from discovery import iter_audio_files
+    from genre_rules import GenreRules
+    from z_move_files_by_genre import process_files_batch
+    files = sum(1 for _ in iter_audio_files(library, max_depth=0))
+    output = Path(library) / '_sorted'
+    output.mkdir()
+    process_files_batch(library, output, GenreRules(**BATCH_RULES))
+    return files
+
+
+def run_update_genre_tags(library):
+    from discovery import iter_audio_files, FLAC_EXTENSIONS
+    from z_update_genre_tags import update_genre_tags
+    files = sum(1 for _ in iter_audio_files(library, FLAC_EXTENSIONS))
+    update_genre_tags(library)
+    return files
+
+
+def run_strip_color_prefix(library):
+    from discovery import iter_audio_files, FLAC_EXTENSIONS
+    from z_strip_color_prefix import process_directory
+    files = sum(1 for _ in iter_audio_files(library, FLAC_EXTENSIONS))
+    process_directory(library)
+    return files
+
+
+def run_artwork(library):
+    from discovery import iter_audio_files, FLAC_EXTENSIONS
+    from z_fix_artwork import extract_and_reembed_artwork
+    files = [str(path) for path in iter_audio_files(library, FLAC_EXTENSIONS)]
+    for path in files:
+        extract_and_reembed_artwork(path, quiet=True)
+    return len(files)
+
+
+RUNNERS = {
+    'scan': run_scan,
+    'genre': run_genre,
+    'batch': run_batch,
+    'update_genre_tags': run_update_genre_tags,
+    'strip_color_prefix': run_strip_color_prefix,
+    'artwork': run_artwork,
+}
+
+
+def run_one(name, library):
+    """
+    Режим дочернего процесса: один сценарий, результат - JSON в последней строке stdout
+    Вывод самого сценария отбрасывается
+    """
+    import instrumentation as inst
+    runner = RUNNERS[name]
+    read_before, written_before = read_io()
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        files = runner(library)
+    seconds = time.perf_counter() - started
+    read_after, written_after = read_io()
+    metrics = inst.snapshot()
+    result = {
+        'workload': name,
+        'files': files,
+        'seconds': round(seconds, 4),
+        'files_per_s': round(files / seconds, 1) if seconds > 0 else None,
+        'bytes_read': read_after - read_before if read_before is not None else None,
+        'bytes_written': written_after - written_before if written_before is not None else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'stages_s': {stage: data['total_s'] for stage, data in metrics['stages'].items()},
+        'counters': metrics['counters'],
+    }
+    print(json.dumps(result))
+
+
+def spawn(name, master, scratch, run_index):
+    """Свежая копия библиотеки и пустой кэш, сценарий в дочернем процессе"""
+    work = Path(scratch) / f"{name}-{run_index}"
+    library = work / 'library'
+    shutil.copytree(master, library)
+    env = dict(os.environ,
+               MUSIC_TOOLS_CACHE=str(work / 'cache'),
+               MUSIC_TOOLS_JOURNAL_DIR=str(work / 'journal'))
+    for key in ('MUSIC_TOOLS_METRICS', 'MUSIC_TOOLS_PROFILE', 'MUSIC_TOOLS_VERBOSE'):
+        env.pop(key, None)
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', name, str(library)],
+                              env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{proc.stderr.strip()}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                           text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    return proc.stdout.strip() + ('-dirty' if dirty else '')
+
+
+def format_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def print_report(results, baseline=None):
+    """Таблица результатов; с baseline - изменение файлов/с в процентах"""
+    old = {r['workload']: r for r in (baseline or {}).get('results', [])}
+    header = f"{'workload':<20}{'files':>7}{'seconds':>10}{'files/s':>10}{'read':>10}{'written':>10}{'peak RSS':>10}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+    for r in results:
+        line = (f"{r['workload']:<20}{r['files']:>7}{r['seconds']:>10.3f}{r['files_per_s'] or 0:>10.1f}"
+                f"{format_bytes(r['bytes_read']):>10}{format_bytes(r['bytes_written']):>10}"
+                f"{format_bytes(r['peak_rss_kb'] * 1024):>10}")
+        before = old.get(r['workload'])
+        if before and before.get('files_per_s') and r['files_per_s']:
+            line += f"{(r['files_per_s'] / before['files_per_s'] - 1) * 100:>+9.1f}%"
+        elif baseline:
+            line += f"{'-':>10}"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк сценариев на синтетической библиотеке')
+    parser.add_argument('--count', type=int, default=500, help='файлов в библиотеке (по умолчанию 500)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'веса форматов (по умолчанию {DEFAULT_MIX})')
+    parser.add_argument('--cover-kb', type=int, default=64, help='размер обложки, КБ')
+    parser.add_argument('--audio-kb', type=int, default=64, help='объем аудиоданных файла, КБ')
+    parser.add_argument('--seed', type=int, default=1, help='seed библиотеки')
+    parser.add_argument('--only', help=f"сценарии через запятую ({', '.join(WORKLOADS)})")
+    parser.add_argument('--repeat', type=int, default=1, help='прогонов каждого сценария, берется лучший')
+    parser.add_argument('--scratch', help='где создавать библиотеку и копии (по умолчанию - временная папка)')
+    parser.add_argument('--output', metavar='FILE', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', metavar='FILE', help='сравнить с результатами из JSON')
+    parser.add_argument('--run-one', nargs=2, metavar=('WORKLOAD', 'LIBRARY'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.run_one:
+        run_one(*args.run_one)
+        return 0
+
+    workloads = args.only.split(',') if args.only else list(WORKLOADS)
+    unknown = [name for name in workloads if name not in RUNNERS]
+    if unknown:
+        print(f"❌ Неизвестные сценарии: {', '.join(unknown)}")
+        return 2
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Не удалось прочитать {args.compare}: {e}")
+            return 2
+
+    config = {'count': args.count, 'mix': args.mix, 'cover_kb': args.cover_kb,
+              'audio_kb': args.audio_kb, 'seed': args.seed}
+    if baseline and baseline.get('config') != config:
+        print(f"⚠️  Параметры библиотеки отличаются от {args.compare}: {baseline.get('config')}")
+
+    if args.scratch:
+        try:
+            Path(args.scratch).mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"❌ Не удалось создать {args.scratch}: {e}")
+            return 2
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='music_bench_', dir=args.scratch) as scratch:
+        master = Path(scratch) / 'master'
+        print(f"🛠  Создаю {args.count} файлов ({args.mix})...")
+        make_library(master, args.count, args.mix, args.cover_kb, args.audio_kb, seed=args.seed)
+        for name in workloads:
+            print(f"⏱  {name}...", flush=True)
+            try:
+                runs = [spawn(name, master, scratch, i) for i in range(args.repeat)]
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                return 1
+            results.append(min(runs, key=lambda r: r['seconds']))
+
+    print()
+    print_report(results, baseline)
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': config,
+            'repeat': args.repeat,
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Отчет о точных дубликатах в библиотеке (одинаковые аудиоданные, теги не важны)
+Запуск:
+  python z_find_duplicates.py папка ...           - группы дубликатов
+  python z_find_duplicates.py папка ... --json    - то же в JSON
+Без декодирования: сначала заголовки (каталог тегов), затем хэш аудиоданных
+только для файлов с совпавшими форматом и длительностью (см. duplicate_index.py)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import instrumentation as inst
+from discovery import iter_audio_files, AUDIO_EXTENSIONS
+from duplicate_index import fingerprint, length_key
+from tag_catalog import get_catalog
+
+DEFAULT_WORKERS = 4
+
+
+def collect_files(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(iter_audio_files(path, AUDIO_EXTENSIONS))
+        elif path.is_file():
+            files.append(path)
+    return sorted(files)
+
+
+def read_record(path):
+    try:
+        return path, get_catalog().read(path)
+    except Exception:
+        return path, None
+
+
+def find_duplicates(files, workers=DEFAULT_WORKERS):
+    """
+    Возвращает (группы, статистика); группа - список путей с одинаковыми
+    аудиоданными, первый путь считается оригиналом
+    """
+    catalog = get_catalog()
+    stats = {'files': len(files), 'unreadable': 0, 'candidates': 0}
+    buckets = defaultdict(list)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, record in executor.map(read_record, files):
+            if record:
+                buckets[length_key(record)].append((path, record))
+            else:
+                stats['unreadable'] += 1
+
+        # Хэшируем только файлы, у которых есть пара по формату и длительности
+        candidates = [item for items in buckets.values() if len(items) > 1 for item in items]
+        stats['candidates'] = len(candidates)
+        by_fingerprint = defaultdict(list)
+        prints = executor.map(lambda item: fingerprint(item[0], item[1], catalog), candidates)
+        for (path, _), print_ in zip(candidates, prints):
+            if print_:
+                by_fingerprint[print_].append(path)
+    return [paths for paths in by_fingerprint.values() if len(paths) > 1], stats
+
+
+def reclaimable(group):
+    """Сколько байт освободится, если оставить только первый файл (жесткие ссылки не считаются)"""
+    seen = set()
+    total = 0
+    for path in group:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        if seen:
+            total += st.st_size
+        seen.add((st.st_dev, st.st_ino))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск точных дубликатов аудиофайлов')
+    parser.add_argument('paths', nargs='+', help='папки или файлы')
+    parser.add_argument('--json', action='store_true', help='вывести отчет в JSON')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'потоков чтения (по умолчанию {DEFAULT_WORKERS})')
+    inst.add_arguments(parser)
+    args = parser.parse_args()
+    inst.configure_from_args(args)
+
+    started = time.perf_counter()
+    with inst.stage('discover'):
+        files = collect_files(args.paths)
+    groups, stats = find_duplicates(files, max(1, args.workers))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'groups': [{'files': [str(p) for p in group], 'reclaimable_bytes': reclaimable(group)}
+                   for group in sorted(groups)],
+        **stats,
+        'elapsed_s': round(elapsed, 3),
+        'files_per_s': round(len(files) / elapsed, 1) if elapsed > 0 else None,
+    }
+    report['duplicates'] = sum(len(group['files']) - 1 for group in report['groups'])
+    report['reclaimable_mb'] = round(sum(group['reclaimable_bytes'] for group in report['groups']) / (1024 * 1024), 1)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    for group in report['groups']:
+        original, *copies = group['files']
+        print(f"\n🎵 {original}")
+        for path in copies:
+            print(f"   ♻️  {path}")
+    print(f"\n📊 Файлов: {report['files']}, проверено хэшем: {report['candidates']}, "
+          f"не прочитано: {report['unreadable']}")
+    print(f"   ♻️  Дубликатов: {report['duplicates']} в {len(report['groups'])} группах, "
+          f"можно освободить {report['reclaimable_mb']} МБ")
+    print(f"   ⏱  {report['elapsed_s']} с, {report['files_per_s']} файлов/с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,470 @@
 import sys
 import os
+import argparse
+import hashlib
+import io
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from mutagen.flac import FLAC, Picture
+from discovery import iter_audio_files, FLAC_EXTENSIONS
+from flac_writer import picture_headers, DEFAULT_PADDING_BUDGET
+from tag_catalog import get_catalog, detach_catalog, first_tag, pool_task, merge_catalog_updates
+from tag_writer import TagChange, commit, set_dry_run, is_dry_run
+import instrumentation as inst
+
+# Pillow нужен только для уменьшения обложек
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FRONT_COVER = 3
+COVER_DESC = "Cover"
+DEFAULT_WORKERS = os.cpu_count() or 2
+DEFAULT_QUALITY = 85
+
+# Режим --extract: имя файла обложки папки (расширение по типу картинки)
+COVER_NAME = "cover"
+COVER_EXTENSIONS = {'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/png': '.png', 'image/gif': '.gif'}
+EMBEDDED_MODES = ('keep', 'thumbnail', 'remove')
+DEFAULT_THUMB_PX = 300
+
+def describe_pictures(pictures):
+    # Короткое описание обложек для сравнения и плана изменений
+    return [f"type={p.type} mime={p.mime} desc={p.desc} {len(p.data)} bytes" for p in pictures]
+
+def needs_shrink(header, max_bytes=None, max_px=None):
+    # Обложка больше лимита по размеру данных или по стороне
+    if max_bytes and header.length > max_bytes:
+        return True
+    return bool(max_px and max(header.width, header.height) > max_px)
+
+def inspect_artwork(flac_path, max_bytes=None, max_px=None):
+    """
+    Проверка по заголовкам блоков PICTURE, без чтения изображений
+    Возвращает (действие, хэш обложки): 'none', 'correct', 'fix' или 'shrink'
+    Хэш считается только для обложек, которые надо уменьшать
+    """
+    record = get_catalog().lookup(flac_path)
+    if record and record['info'].get('pictures') == 0:
+        return 'none', None
+
+    headers = picture_headers(flac_path)
+    if not headers:
+        return 'none', None
+    cover = headers[0]
+    if needs_shrink(cover, max_bytes, max_px):
+        digest = hashlib.blake2b(digest_size=20)
+        with open(flac_path, 'rb') as f:
+            f.seek(cover.offset)
+            digest.update(f.read(cover.length))
+        return 'shrink', digest.hexdigest()
+    if len(headers) == 1 and cover.type == FRONT_COVER and cover.desc == COVER_DESC:
+        return 'correct', None
+    return 'fix', None
+
+def shrink_cover(flac_path, max_bytes=None, max_px=None, quality=DEFAULT_QUALITY):
+    """
+    Уменьшает первую обложку файла (Pillow): сторона до max_px, JPEG с quality
+    Возвращает (data, mime, width, height) или None, если меньше не получилось
+    """
+    if Image is None:
+        return None
+    header = picture_headers(flac_path)[0]
+    with open(flac_path, 'rb') as f:
+        f.seek(header.offset)
+        data = f.read(header.length)
+
+    image = Image.open(io.BytesIO(data))
+    if max_px and max(image.size) > max_px:
+        image.thumbnail((max_px, max_px), Image.LANCZOS)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality, optimize=True)
+    if out.tell() >= len(data):
+        return None
+    return out.getvalue(), 'image/jpeg', image.size[0], image.size[1]
+
+def extract_and_reembed_artwork(flac_path, cover=None, quiet=False):
+    """
+    Оставляет в файле одну обложку Front Cover
+    cover - готовая уменьшенная обложка (data, mime, width, height) вместо исходной
+    Возвращает 'none', 'correct', 'fixed', 'planned' (dry-run)
+    """
+    # Каталог знает, сколько обложек в файле - файлы без них не открываем
+    record = get_catalog().lookup(flac_path)
+    if record and record['info'].get('pictures') == 0:
+        if not quiet:
+            print(f"❌ No artwork found in {flac_path}")
+        return 'none'
 
-def extract_and_reembed_artwork(flac_path):
     audio = FLAC(flac_path)
 
     # Найдём первое изображение (если оно уже есть)
     if not audio.pictures:
-        print(f"❌ No artwork found in {flac_path}")
-        return
+        get_catalog().refresh(flac_path, audio)
+        if not quiet:
+            print(f"❌ No artwork found in {flac_path}")
+        return 'none'
 
+    old_pictures = describe_pictures(audio.pictures)
     picture = audio.pictures[0]  # Берём первое изображение
 
     # Удалим все текущие обложки — на всякий случай
     audio.clear_pictures()
 
-    # Повторно добавим корректно
-    new_pic = Picture()
-    new_pic.data = picture.data
-    new_pic.type = 3  # Front Cover
-    new_pic.mime = picture.mime
-    new_pic.desc = "Cover"
-    new_pic.width = picture.width
-    new_pic.height = picture.height
-    new_pic.depth = picture.depth
-    new_pic.colors = picture.colors
-
-    audio.add_picture(new_pic)
-    audio.save()
-    print(f"✅ Fixed artwork in: {flac_path}")
+    # Повторно добавим корректно (данные не копируем - тот же объект)
+    picture.type = FRONT_COVER
+    picture.desc = COVER_DESC
+    if cover is not None:
+        picture.data, picture.mime, picture.width, picture.height = cover
+    audio.add_picture(picture)
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python fix_flac_artwork.py path/to/file.flac")
-    else:
-        for path in sys.argv[1:]:
-            if os.path.isfile(path) and path.lower().endswith(".flac"):
+    # Если обложка уже была одна и правильная - файл не пишем
+    new_pictures = describe_pictures(audio.pictures)
+    changes = [TagChange(flac_path, 'PICTURE', old_pictures, new_pictures)] if old_pictures != new_pictures else []
+    update = commit(audio, changes)
+
+    if not changes:
+        get_catalog().refresh(flac_path, audio)
+        if not quiet:
+            print(f"👌 Artwork already correct: {flac_path}")
+        return 'correct'
+    if not update.written:
+        return 'planned'
+    report = update.report
+    if not quiet:
+        how = "in place" if report.in_place else "file rewritten"
+        print(f"✅ Fixed artwork in: {flac_path} ({report.bytes_written / 1024:.1f} KB written, {how})")
+    return 'fixed'
+
+def strip_artwork(flac_path, thumbnail=None):
+    """
+    Удаляет встроенные обложки (обложка уже лежит файлом в папке)
+    thumbnail - маленькая обложка (data, mime, width, height), которая остается в файле
+    Освободившееся место не оставляется в PADDING - файл уменьшается
+    Возвращает 'fixed', 'planned' или 'correct'
+    """
+    audio = FLAC(flac_path)
+    old_pictures = describe_pictures(audio.pictures)
+    audio.clear_pictures()
+    if thumbnail is not None:
+        picture = Picture()
+        picture.type = FRONT_COVER
+        picture.desc = COVER_DESC
+        picture.data, picture.mime, picture.width, picture.height = thumbnail
+        picture.depth = 24
+        audio.add_picture(picture)
+    new_pictures = describe_pictures(audio.pictures)
+    changes = [TagChange(flac_path, 'PICTURE', old_pictures, new_pictures)] if old_pictures != new_pictures else []
+    update = commit(audio, changes, max_padding=DEFAULT_PADDING_BUDGET)
+    if not changes:
+        return 'correct'
+    return 'fixed' if update.written else 'planned'
+
+def time_tag_reads(files):
+    # Сколько секунд занимает полная загрузка тегов mutagen для всех файлов
+    started = time.perf_counter()
+    for path in files:
+        FLAC(path)
+    return time.perf_counter() - started
+
+# --- пакетный режим (пул процессов) ---
+
+def _init_worker(dry_run):
+    # Каталог только на чтение: новые записи возвращаются родителю (pool_task)
+    detach_catalog()
+    set_dry_run(dry_run)
+
+def _inspect_task(args):
+    path, max_bytes, max_px = args
+    try:
+        action, digest = inspect_artwork(path, max_bytes, max_px)
+        return path, action, digest, os.path.getsize(path), None
+    except Exception as e:
+        return path, 'error', None, 0, str(e)
+
+def _shrink_task(args):
+    path, max_bytes, max_px, quality = args
+    try:
+        return shrink_cover(path, max_bytes, max_px, quality)
+    except Exception as e:
+        print(f"⚠️ Cannot shrink cover of {path}: {e}")
+        return None
+
+def _fix_task(args):
+    path, cover = args
+    try:
+        status = extract_and_reembed_artwork(path, cover, quiet=True)
+        return path, status, os.path.getsize(path), None
+    except Exception as e:
+        return path, 'error', 0, str(e)
+
+def _cover_task(path):
+    # Обложка трека для режима --extract: (путь, папка, альбом, хэш, mime) или ошибка
+    try:
+        headers = picture_headers(path)
+        if not headers:
+            return path, None, None, None, None, None
+        cover = next((h for h in headers if h.type == FRONT_COVER), headers[0])
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            f.seek(cover.offset)
+            digest.update(f.read(cover.length))
+        record = get_catalog().read(path)
+        album = first_tag(record['tags'], ['ALBUM']) if record else None
+        return path, os.path.dirname(path), album, digest.hexdigest(), cover.mime, None
+    except Exception as e:
+        return path, None, None, None, None, str(e)
+
+def _strip_task(args):
+    path, thumbnail = args
+    try:
+        return path, strip_artwork(path, thumbnail), None
+    except Exception as e:
+        return path, 'error', str(e)
+
+def read_cover_data(path):
+    # Данные обложки, которую выбрали для папки (первая Front Cover)
+    headers = picture_headers(path)
+    cover = next((h for h in headers if h.type == FRONT_COVER), headers[0])
+    with open(path, 'rb') as f:
+        f.seek(cover.offset)
+        return f.read(cover.length)
+
+def write_folder_cover(folder, data, mime):
+    """
+    Пишет обложку папки (cover.jpg/png), не затирая чужую
+    Возвращает путь файла обложки или None, если в папке уже другая обложка
+    """
+    path = os.path.join(folder, COVER_NAME + COVER_EXTENSIONS.get(mime.lower(), '.jpg'))
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return path if f.read() == data else None
+    if is_dry_run():
+        print(f"🧪 {path}: write folder cover ({len(data) / 1024:.0f} KB)")
+        return path
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+def extract_folder_covers(files, workers=DEFAULT_WORKERS, embedded='keep',
+                          thumb_px=DEFAULT_THUMB_PX, quality=DEFAULT_QUALITY):
+    """
+    Выносит общую обложку альбома в файл папки:
+    1) хэши встроенных обложек всех треков (параллельно);
+    2) в каждой папке - обложка самого большого альбома (по числу треков
+       с одинаковым хэшем) пишется в cover.jpg;
+    3) у треков с этой же обложкой встроенная копия удаляется (remove)
+       или заменяется миниатюрой thumb_px (thumbnail, одна на каждую обложку)
+    Возвращает сводку (dict), включая время чтения тегов до и после
+    """
+    started = time.perf_counter()
+    stats = {'files': len(files), 'folders': 0, 'covers_written': 0, 'conflicts': 0,
+             'stripped': 0, 'planned': 0, 'errors': 0, 'bytes_saved': 0}
+    if embedded == 'thumbnail' and Image is None:
+        print("⚠️ Pillow is not installed - embedded covers are kept")
+        embedded = 'keep'
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(is_dry_run(),)) as pool:
+        by_folder = defaultdict(list)
+        mimes = {}
+        covers = merge_catalog_updates(pool.map(pool_task(_cover_task), files, chunksize=16))
+        for path, folder, album, digest, mime, error in covers:
+            if error:
+                stats['errors'] += 1
+                print(f"❌ {path}: {error}")
+            elif digest:
+                by_folder[folder].append((path, album, digest))
+                mimes[digest] = mime
+
+        to_strip = {}        # путь → хэш обложки
+        for folder, tracks in sorted(by_folder.items()):
+            # Треки одного альбома с одной обложкой; побеждает самая большая группа
+            groups = Counter((album, digest) for _, album, digest in tracks)
+            (_, digest), _ = groups.most_common(1)[0]
+            paths = [path for path, _, d in tracks if d == digest]
+            stats['folders'] += 1
+            cover_path = write_folder_cover(folder, read_cover_data(paths[0]), mimes[digest])
+            if cover_path is None:
+                stats['conflicts'] += 1
+                print(f"⚠️ {folder}: another cover file already exists, embedded artwork kept")
+                continue
+            stats['covers_written'] += 1
+            if embedded != 'keep':
+                to_strip.update((path, digest) for path in paths)
+
+        if to_strip:
+            thumbnails = {}
+            if embedded == 'thumbnail':
+                representatives = {}
+                for path, digest in to_strip.items():
+                    representatives.setdefault(digest, path)
+                digests = list(representatives)
+                thumbnails = dict(zip(digests, pool.map(_shrink_task, [(representatives[d], None, thumb_px, quality)
+                                                                        for d in digests])))
+            # Миниатюра не меньше оригинала - файл не трогаем
+            tasks = [(path, thumbnails.get(digest)) for path, digest in to_strip.items()
+                     if embedded == 'remove' or thumbnails.get(digest) is not None]
+            paths = [path for path, _ in tasks]
+            sizes = {path: os.path.getsize(path) for path in paths}
+            stats['read_before_s'] = round(time_tag_reads(paths), 3)
+            for path, status, error in merge_catalog_updates(pool.map(pool_task(_strip_task), tasks)):
+                if status == 'error':
+                    stats['errors'] += 1
+                    print(f"❌ {path}: {error}")
+                elif status == 'fixed':
+                    stats['stripped'] += 1
+                    stats['bytes_saved'] += sizes[path] - os.path.getsize(path)
+                elif status == 'planned':
+                    stats['planned'] += 1
+            if not is_dry_run():
+                stats['read_after_s'] = round(time_tag_reads(paths), 3)
+
+    stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def collect_flac_files(paths, recursive=True):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            with inst.stage('discover'):
+                files.extend(iter_audio_files(path, FLAC_EXTENSIONS, max_depth=None if recursive else 0))
+        elif os.path.isfile(path) and path.lower().endswith(".flac"):
+            files.append(path)
+        else:
+            print(f"⚠️ Skipping: {path}")
+    return sorted(str(f) for f in files)
+
+def process_batch(files, workers=DEFAULT_WORKERS, max_bytes=None, max_px=None, quality=DEFAULT_QUALITY):
+    """
+    1) заголовки PICTURE всех файлов параллельно - правильные пропускаются без записи;
+    2) каждая различная большая обложка уменьшается один раз;
+    3) файлы, которым нужна правка, переписываются параллельно
+    Возвращает сводку (dict)
+    """
+    started = time.perf_counter()
+    stats = {'files': len(files), 'correct': 0, 'fixed': 0, 'planned': 0, 'none': 0, 'errors': 0,
+             'distinct_covers': 0, 'shrunk_covers': 0, 'bytes_saved': 0}
+    if max_bytes or max_px:
+        if Image is None:
+            print("⚠️ Pillow is not installed - covers will not be downscaled")
+            max_bytes = max_px = None
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(is_dry_run(),)) as pool:
+        todo = {}            # путь → хэш обложки (None - только исправить тип)
+        sizes = {}
+        inspected = merge_catalog_updates(pool.map(pool_task(_inspect_task),
+                                                   [(f, max_bytes, max_px) for f in files], chunksize=16))
+        for done, (path, action, digest, size, error) in enumerate(inspected, 1):
+            inst.progress(done, len(files), 'inspect ')
+            if action == 'error':
+                stats['errors'] += 1
+                print(f"❌ {path}: {error}")
+            elif action in ('none', 'correct'):
+                stats[action] += 1
+            else:
+                todo[path] = digest
+                sizes[path] = size
+
+        # Одна уменьшенная копия на каждую различную обложку
+        representatives = {}
+        for path, digest in todo.items():
+            if digest is not None:
+                representatives.setdefault(digest, path)
+        stats['distinct_covers'] = len(representatives)
+        digests = list(representatives)
+        shrunk = dict(zip(digests, pool.map(_shrink_task, [(representatives[d], max_bytes, max_px, quality)
+                                                            for d in digests])))
+        stats['shrunk_covers'] = sum(1 for cover in shrunk.values() if cover is not None)
+
+        tasks = [(path, shrunk.get(digest)) for path, digest in todo.items()]
+        fixed = merge_catalog_updates(pool.map(pool_task(_fix_task), tasks))
+        for done, (path, status, size, error) in enumerate(fixed, 1):
+            inst.progress(done, len(tasks), 'fix ')
+            if status == 'error':
+                stats['errors'] += 1
+                print(f"❌ {path}: {error}")
+                continue
+            stats[status] += 1
+            if status == 'fixed':
+                stats['bytes_saved'] += sizes[path] - size
+                inst.vprint(f"✅ Fixed artwork in: {path}")
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed_s'] = round(elapsed, 3)
+    stats['files_per_s'] = round(len(files) / elapsed, 1) if elapsed > 0 else None
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fix embedded FLAC artwork: one front cover per file")
+    parser.add_argument("paths", nargs="+", help="FLAC files or folders (folders are scanned recursively)")
+    parser.add_argument("--dry-run", action="store_true", help="show planned changes without writing")
+    parser.add_argument("--no-recursive", action="store_true", help="only top level of given folders")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"worker processes for folders (default {DEFAULT_WORKERS})")
+    parser.add_argument("--max-kb", type=int, help="recompress covers larger than this (needs Pillow)")
+    parser.add_argument("--max-px", type=int, help="downscale covers with a longer side (needs Pillow)")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY,
+                        help=f"JPEG quality for recompressed covers (default {DEFAULT_QUALITY})")
+    parser.add_argument("--extract", action="store_true",
+                        help=f"write the shared album cover to {COVER_NAME}.jpg in each folder")
+    parser.add_argument("--embedded", choices=EMBEDDED_MODES, default='keep',
+                        help="with --extract: keep, replace with a thumbnail or remove embedded covers (default keep)")
+    parser.add_argument("--thumb-px", type=int, default=DEFAULT_THUMB_PX,
+                        help=f"thumbnail size for --embedded thumbnail (default {DEFAULT_THUMB_PX})")
+    inst.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def run_extract(files, args):
+    print(f"🔍 Extracting folder covers from {len(files)} files ({max(1, args.workers)} processes)...")
+    stats = extract_folder_covers(files, max(1, args.workers), args.embedded, args.thumb_px, args.quality)
+    print(f"\n📊 Folders: {stats['folders']}, cover files: {stats['covers_written']}, "
+          f"conflicts: {stats['conflicts']}, errors: {stats['errors']}")
+    print(f"   ✂️  Embedded covers {'stripped' if args.embedded == 'remove' else 'replaced'}: {stats['stripped']}"
+          f", planned: {stats['planned']}")
+    print(f"   💾 Saved: {stats['bytes_saved'] / (1024 * 1024):.1f} MB")
+    if 'read_after_s' in stats:
+        before, after = stats['read_before_s'], stats['read_after_s']
+        speedup = f", {before / after:.1f}x faster" if after > 0 else ""
+        print(f"   📖 Tag reads (mutagen): {before} s → {after} s{speedup}")
+    print(f"   ⏱  {stats['elapsed_s']} s")
+    return 1 if stats['errors'] else 0
+
+def main():
+    args = parse_args()
+    inst.configure_from_args(args)
+    set_dry_run(args.dry_run)
+    max_bytes = args.max_kb * 1024 if args.max_kb else None
+
+    # Только файлы без ограничений размера - как раньше, по одному
+    if not (max_bytes or args.max_px or args.extract) and all(os.path.isfile(p) for p in args.paths):
+        for path in args.paths:
+            if path.lower().endswith(".flac"):
                 extract_and_reembed_artwork(path)
             else:
-                print(f"⚠️ Skipping: {path}")
\ No newline at end of file
+                print(f"⚠️ Skipping: {path}")
+        return 0
+
+    files = collect_flac_files(args.paths, recursive=not args.no_recursive)
+    if not files:
+        print("❌ No FLAC files found")
+        return 1
+    if args.extract:
+        return run_extract(files, args)
+    print(f"🔍 Checking artwork in {len(files)} files ({max(1, args.workers)} processes)...")
+    stats = process_batch(files, max(1, args.workers), max_bytes, args.max_px, args.quality)
+    print(f"\n📊 Files: {stats['files']}, already correct: {stats['correct']}, fixed: {stats['fixed']}, "
+          f"planned: {stats['planned']}, no artwork: {stats['none']}, errors: {stats['errors']}")
+    if stats['distinct_covers']:
+        print(f"   🖼  Distinct large covers: {stats['distinct_covers']}, downscaled: {stats['shrunk_covers']}")
+    print(f"   💾 Saved: {stats['bytes_saved'] / (1024 * 1024):.1f} MB")
+    print(f"   ⏱  {stats['elapsed_s']} s, {stats['files_per_s']} files/s")
+    return 1 if stats['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
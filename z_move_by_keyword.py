@@ -1,29 +1,159 @@
-import os
-import shutil
-import mutagen.flac
+import sys
+import time
+import json
+import argparse
+from pathlib import Path
+from tag_catalog import get_catalog
+from discovery import iter_audio_files, AUDIO_EXTENSIONS, FLAC_EXTENSIONS
+from keyword_rules import KeywordRules, KeywordRulesError
+from prefetch import Prefetcher
+from move_engine import MoveEngine
+from name_index import NameIndex
+from tag_writer import set_dry_run, is_dry_run
+import instrumentation as inst
 
-# Запрос данных
-source_folder = input('📁 Введите путь к папке c FLAC-файлами: ').strip()
-destination_folder = input('📂 Введите путь для перемещения подходящих файлов: ').strip()
-keyword = input('🔍 Введите ключевое слово для поиска в комментариях: ').strip().lower()
+DEFAULT_WORKERS = 4
 
-# Проверка и создание папки назначения
-os.makedirs(destination_folder, exist_ok=True)
+# Сколько раз подбирать новое имя, если его занял другой процесс
+MAX_NAME_RETRIES = 5
 
-# Обработка файлов
-for filename in os.listdir(source_folder):
-    if filename.lower().endswith('.flac'):
-        filepath = os.path.join(source_folder, filename)
+def read_record(path):
+    try:
+        return get_catalog().read(path)
+    except Exception as e:
+        print(f'⚠️ Ошибка при чтении {path.name}: {e}')
+        return None
 
+def route_files(files, rules, output_folder, workers=DEFAULT_WORKERS, quiet=False):
+    """
+    Раскладывает файлы по правилам за один проход
+    Теги читаются параллельно (каталог + пул потоков), перемещения - по порядку
+    quiet=True - не печатать каждое перемещение (сводка в JSON);
+    иначе они печатаются только с --verbose, а без него - строка прогресса
+    Возвращает сводку (dict)
+    """
+    started = time.perf_counter()
+    summary = {'total': 0, 'moved': 0, 'unmatched': 0, 'errors': 0,
+               'rules': {name: 0 for name in rules.names}}
+    names = NameIndex()
+    engine = MoveEngine()
+    created = set()
+
+    with Prefetcher(files, read_record, depth=workers * 4, workers=workers) as prefetcher:
+        for i, path in enumerate(files):
+            summary['total'] += 1
+            inst.progress(i + 1, len(files))
+            record = prefetcher.get(i)
+            if record is None:
+                summary['errors'] += 1
+                continue
+            with inst.stage('decide'):
+                index, folder = rules.resolve(record)
+            if folder is None:
+                summary['unmatched'] += 1
+                continue
+            if index is not None:
+                summary['rules'][rules.names[index]] += 1
+
+            destination_folder = Path(output_folder) / folder
+            if destination_folder.resolve() == path.parent.resolve():
+                continue
+            destination = names.reserve(destination_folder, path.name)
+            if is_dry_run():
+                print(f'🧪 {path} → {destination}')
+                summary['moved'] += 1
+                continue
+            try:
+                if destination_folder not in created:
+                    destination_folder.mkdir(parents=True, exist_ok=True)
+                    created.add(destination_folder)
+                if not quiet:
+                    inst.vprint(f'✅ {path.name} → {destination_folder}')
+                for attempt in range(MAX_NAME_RETRIES):
+                    try:
+                        engine.move(path, destination)
+                        break
+                    except FileExistsError:
+                        # Имя занял другой процесс - оно занято, берем следующее
+                        names.taken(destination)
+                        if attempt == MAX_NAME_RETRIES - 1:
+                            raise
+                        destination = names.reserve(destination_folder, path.name)
+                get_catalog().move(path, destination)
+                summary['moved'] += 1
+            except Exception as e:
+                if not isinstance(e, FileExistsError) and path.exists():
+                    names.release(destination)
+                summary['errors'] += 1
+                print(f'⚠️ Ошибка при обработке {path.name}: {e}')
+
+    elapsed = time.perf_counter() - started
+    summary['elapsed_s'] = round(elapsed, 3)
+    summary['files_per_s'] = round(summary['total'] / elapsed, 1) if elapsed > 0 else None
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Перемещение аудиофайлов по ключевым словам в тегах')
+    parser.add_argument('--rules', metavar='FILE',
+                        help='JSON-файл правил ключевое слово/regex → папка (см. keyword_rules.py); '
+                             'без него - один вопрос про ключевое слово')
+    parser.add_argument('--search', help='где искать файлы')
+    parser.add_argument('--output', help='от какой папки считать относительные папки правил (по умолчанию --search)')
+    parser.add_argument('--fields', help='поля тегов через запятую (по умолчанию из правил или comment)')
+    parser.add_argument('--no-recursive', action='store_true', help='только верхний уровень папки')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'потоков чтения тегов (по умолчанию {DEFAULT_WORKERS})')
+    parser.add_argument('--dry-run', action='store_true', help='только показать, что куда переместится')
+    parser.add_argument('--json', action='store_true', help='сводка в JSON')
+    inst.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    inst.configure_from_args(args)
+    set_dry_run(args.dry_run)
+
+    if args.rules:
+        if not args.search:
+            print('❌ Нужен --search', file=sys.stderr)
+            return 2
         try:
-            audio = mutagen.flac.FLAC(filepath)
-            comments = audio.get('comment', [])
+            rules = KeywordRules.load(args.rules)
+        except KeywordRulesError as e:
+            print(f'❌ Ошибка в правилах: {e}', file=sys.stderr)
+            return 2
+        source_folder = args.search
+        output_folder = args.output or args.search
+        extensions = AUDIO_EXTENSIONS
+        max_depth = 0 if args.no_recursive else None
+    else:
+        # Как раньше: одно ключевое слово, FLAC в корне папки
+        source_folder = args.search or input('📁 Введите путь к папке c FLAC-файлами: ').strip()
+        output_folder = args.output or input('📂 Введите путь для перемещения подходящих файлов: ').strip()
+        keyword = input('🔍 Введите ключевое слово для поиска в комментариях: ').strip()
+        if not keyword:
+            print('❌ Ключевое слово не задано', file=sys.stderr)
+            return 2
+        rules = KeywordRules([{'keyword': keyword, 'folder': '.'}])
+        extensions = FLAC_EXTENSIONS
+        max_depth = 0
+
+    if args.fields:
+        rules.fields = tuple(field.strip() for field in args.fields.split(',') if field.strip())
 
-            if any(keyword in comment.lower() for comment in comments):
-                print(f'✅ Найдено слово "{keyword}" в {filename} — перемещаем...')
-                shutil.move(filepath, os.path.join(destination_folder, filename))
+    with inst.stage('discover'):
+        files = sorted(iter_audio_files(source_folder, extensions, max_depth=max_depth))
+    summary = route_files(files, rules, output_folder, max(1, args.workers), quiet=args.json)
 
-        except Exception as e:
-            print(f'⚠️ Ошибка при обработке {filename}: {e}')
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        for name, hits in summary['rules'].items():
+            print(f'   🔍 "{name}": {hits}')
+        print(f"📊 Файлов: {summary['total']}, перемещено: {summary['moved']}, без совпадений: {summary['unmatched']}, "
+              f"ошибок: {summary['errors']} ({summary['files_per_s']} файлов/с)")
+        print('🎉 Завершено.')
+    return 1 if summary['errors'] else 0
 
-print('🎉 Завершено.')
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
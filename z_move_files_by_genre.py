@@ -4,36 +4,106 @@
 Читает тег GENRE из файлов и перемещает их в соответствующие подпапки
 Поддерживает: FLAC, MP3, MP4, OGG, OPUS, AIFF
 При создании новой папки предлагает выбор из похожих существующих папок
+С --batch --watch работает как демон: раскладывает новые файлы по мере поступления
 """
 
 import os
-import shutil
 from pathlib import Path
 import sys
-from mutagen import File as MutagenFile
-from mutagen.flac import FLAC
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4
-from mutagen.oggvorbis import OggVorbis
-from mutagen.oggopus import OggOpus
-from mutagen.aiff import AIFF
-from mutagen.id3 import TCON
-import re
 import signal
 import subprocess
 import platform
 import threading
 import time
-import select
+import argparse
+import json
+from datetime import datetime
+from contextlib import nullcontext
+from collections import namedtuple
+from tag_catalog import get_catalog, first_tag, GENRE_KEYS
+import format_sniff
+import instrumentation as inst
+from audio_handle import AudioHandle, handle_stats
+from prefetch import Prefetcher
+from genre_rules import GenreRules, RulesError
+from discovery import iter_audio_files, AUDIO_EXTENSIONS
+from folder_index import FolderIndex
+from genre_aliases import AliasTable, clean_genre
+from player import make_player, play_until_keypress
+from preview_cache import PreviewCache, make_decoder, DEFAULT_PREVIEW_OFFSET, DEFAULT_PREVIEW_LENGTH, DEFAULT_CACHE_MB
+from flac_writer import format_report
+from tag_writer import update_tags, plan_changes, set_dry_run, is_dry_run
+from journal import Journal, JournalError, list_runs, undo_run
+from move_engine import MoveEngine, DEFAULT_MOVE_WORKERS, file_digest, same_device
+from name_index import NameIndex
+from duplicate_index import DuplicateIndex
+from folder_watch import FolderWatcher, WatchError, DEFAULT_SETTLE
 
 # Глобальная переменная для отслеживания прерывания
 interrupted = False
 
+# Счетчик созданных папок - по нему видно, что предзагруженные данные о папках устарели
+folder_generation = 0
+
+# Папки, которые были бы созданы в режиме dry-run
+dry_run_folders = set()
+
+# Индексы папок вывода (строятся один раз за сессию): путь → FolderIndex
+folder_indexes = {}
+
+# Сколько похожих папок показывать оператору
+SIMILAR_FOLDERS_LIMIT = 5
+
+# Таблица псевдонимов жанр → папка (решения оператора между запусками)
+ALIASES_NAME = "_genre_aliases.json"
+aliases_file = None
+alias_tables = {}
+
+# folder_indexes и alias_tables заполняются и из потоков предзагрузки
+_session_lock = threading.Lock()
+
+# Кэш фрагментов для прослушивания (None - играем исходный файл)
+preview_cache = None
+
+# Плеер для прослушивания (создается при первом треке)
+player = None
+
+# Журнал операций текущего запуска (None в dry-run)
+journal = None
+
+# Перемещение файлов (rename или проверенное копирование между дисками)
+move_engine = None
+
+# Занятые имена в папках назначения (свободное имя без stat)
+destination_names = NameIndex()
+
+# Сколько раз подбирать новое имя, если его занял другой процесс
+MAX_NAME_RETRIES = 5
+
+# Что делать с точным дубликатом (те же аудиоданные уже есть в папке):
+# skip - оставить на месте, keep - положить рядом под новым именем,
+# link - жесткая ссылка на существующий файл (только байт-в-байт, один диск)
+DUPLICATE_POLICIES = ('skip', 'keep', 'link')
+duplicate_policy = 'skip'
+duplicates = None
+
+# Параметры предзагрузки по умолчанию
+DEFAULT_PREFETCH_DEPTH = 8
+DEFAULT_PREFETCH_WORKERS = 4
+
+# Очередь файлов, которые пакетный режим не смог разложить сам
+REVIEW_QUEUE_NAME = "_review_queue.jsonl"
+
+# Тег жанра, подготовленный до перемещения: seq - запись журнала, planned - изменения,
+# header - новые метаданные для копии (None - тег уже записан в исходник), handle - AudioHandle
+Retag = namedtuple('Retag', ['seq', 'planned', 'header', 'handle'])
+
 def signal_handler(sig, frame):
     """Обработчик сигнала прерывания"""
     global interrupted
     interrupted = True
-    print("\n\n⏹️  Получен сигнал прерывания. Завершение работы...")
+    # В stderr - в пакетном режиме stdout занят сводкой в JSON
+    print("\n\n⏹️  Получен сигнал прерывания. Завершение работы...", file=sys.stderr)
     sys.exit(0)
 
 def check_exit(input_str):
@@ -46,7 +116,8 @@ def check_exit(input_str):
 def safe_input(prompt):
     """Безопасный ввод с возможностью выхода"""
     try:
-        user_input = input(prompt).strip()
+        with inst.stage('wait-for-human'):
+            user_input = input(prompt).strip()
         check_exit(user_input)
         return user_input
     except KeyboardInterrupt:
@@ -105,73 +176,26 @@ def play_audio_file(file_path, background=False):
 
 def play_audio_with_interrupt(file_path):
     """
-    Воспроизводит аудиофайл с возможностью прерывания по нажатию клавиши
+    Воспроизводит аудиофайл с возможностью прерывания по нажатию Enter
     Начинает с 1-й минуты (пропускает первые 60 секунд)
+    Если фрагмент уже есть в локальном кэше - играет его сразу
+    Плеер один на всю сессию (см. player.py)
     """
+    global player
     try:
-        system = platform.system().lower()
-        
-        # Используем ffplay для всех систем - он поддерживает -ss для пропуска времени
-        cmd = ["ffplay", "-ss", "60", "-nodisp", "-autoexit", str(file_path)]
-        
-        # Запускаем процесс
-        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        print("   (нажмите любую клавишу для остановки)")
+        if player is None:
+            player = make_player()
+            if player is None:
+                print("   ❌ ⚠️  Не найден mpv или ffplay")
+                return False
         
-        # Ждем завершения процесса или нажатия клавиши
-        while process.poll() is None:
-            try:
-                # Проверяем, есть ли ввод от пользователя
-                if sys.stdin in select.select([sys.stdin], [], [], 0.1)[0]:
-                    input()  # Читаем ввод
-                    # Сразу принудительно завершаем ffplay
-                    process.terminate()
-                    try:
-                        process.wait(timeout=0.5)
-                    except subprocess.TimeoutExpired:
-                        process.kill()
-                    break
-            except:
-                # Если select не работает, используем простую проверку
-                try:
-                    import msvcrt
-                    if msvcrt.kbhit():
-                        msvcrt.getch()
-                        # Сразу принудительно завершаем ffplay
-                        process.terminate()
-                        try:
-                            process.wait(timeout=0.5)
-                        except subprocess.TimeoutExpired:
-                            process.kill()
-                        break
-                except:
-                    pass
-            time.sleep(0.1)
+        clip = preview_cache.prepare(file_path) if preview_cache else None
         
-        # Останавливаем процесс
-        if process.poll() is None:
-            process.terminate()
-            try:
-                process.wait(timeout=1)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                try:
-                    process.wait(timeout=1)
-                except subprocess.TimeoutExpired:
-                    # Принудительное завершение через pkill для ffplay
-                    if system in ["darwin", "linux"]:
-                        try:
-                            subprocess.run(["pkill", "-f", "ffplay"], 
-                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                        except:
-                            pass
-                    elif system == "windows":
-                        try:
-                            subprocess.run(["taskkill", "/F", "/IM", "ffplay.exe"], 
-                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                        except:
-                            pass
+        print("   (нажмите Enter для остановки)")
+        if clip:
+            play_until_keypress(player, clip)
+        else:
+            play_until_keypress(player, file_path, start=60)
         
         print("   ⏹️  Воспроизведение остановлено")
         return True
@@ -215,133 +239,116 @@ def play_audio_and_return(audio_file):
         print("❌ Ошибка воспроизведения")
     return 'back'
 
-def debug_mp3_tags(file_path):
+def debug_mp3_tags(handle):
     """
     Отладочная функция для просмотра всех тегов в MP3 файле
+    Теги берутся из уже прочитанной записи - файл второй раз не открывается
     """
-    try:
-        audio = MP3(str(file_path))
-        print(f"      🔍 Доступные теги в {file_path.name}:")
-        for key, value in audio.items():
-            print(f"         {key}: {value}")
-        return True
-    except Exception as e:
-        print(f"      ❌ Ошибка чтения тегов: {str(e)}")
-        return False
+    print(f"      🔍 Доступные теги в {handle.path.name}:")
+    for key, value in handle.record['tags'].items():
+        print(f"         {key}: {value}")
+    return True
 
-def get_genre_from_file(file_path):
+def get_genre_from_file(file_path, quiet=False):
     """
     Извлекает жанр из аудиофайла
     Поддерживает: FLAC, MP3, MP4, OGG, OPUS, AIFF
+    Теги берутся из каталога, файл разбирается только если он изменился
+    file_path - путь или AudioHandle (тогда разобранный файл потом
+    используется для записи тега, см. audio_handle.py)
+    quiet=True отключает отладочный вывод (для фоновой предзагрузки)
     """
     try:
-        # Определяем тип файла по расширению
-        file_ext = file_path.suffix.lower()
-        
-        if file_ext == '.flac':
-            audio = FLAC(str(file_path))
-        elif file_ext == '.mp3':
-            audio = MP3(str(file_path))
-        elif file_ext in ['.m4a', '.mp4']:
-            audio = MP4(str(file_path))
-        elif file_ext == '.ogg':
-            # Пробуем определить тип OGG файла
-            try:
-                audio = OggVorbis(str(file_path))
-            except:
-                audio = OggOpus(str(file_path))
-        elif file_ext == '.opus':
-            audio = OggOpus(str(file_path))
-        elif file_ext == '.aiff':
-            audio = AIFF(str(file_path))
-        else:
-            # Пробуем универсальный метод
-            audio = MutagenFile(str(file_path))
+        # Каталог сам решает, нужно ли заново разбирать файл
+        # (формат определяется по содержимому, а не по расширению)
+        handle = file_path if isinstance(file_path, AudioHandle) else AudioHandle(file_path)
+        record = handle.load()
         
-        if audio is None:
+        if record is None:
             return None
+        
+        tags = record['tags']
             
         # Получаем жанр - для MP3 пробуем разные теги
         genre = None
         
-        if file_ext == '.mp3':
+        if record['format'] == 'MP3':
             # Для MP3 пробуем разные варианты тегов жанра
             genre_tags = ['TCON', 'GENRE', 'Genre', 'genre']
             for tag in genre_tags:
-                if tag in audio:
-                    genre_value = audio[tag]
-                    print(f"      🔍 Найден тег {tag}: {genre_value} (тип: {type(genre_value)})")
+                if tag in tags:
+                    genre_value = tags[tag]
+                    if not quiet:
+                        inst.vprint(f"      🔍 Найден тег {tag}: {genre_value} (тип: {type(genre_value)})")
                     
-                    # Обрабатываем разные типы значений
-                    if isinstance(genre_value, list) and len(genre_value) > 0:
+                    if genre_value:
                         genre = str(genre_value[0])
-                    elif isinstance(genre_value, str):
-                        genre = genre_value
-                    elif hasattr(genre_value, 'text'):
-                        # Для некоторых объектов mutagen
-                        genre = str(genre_value.text[0]) if genre_value.text else str(genre_value)
-                    else:
-                        # Пробуем преобразовать в строку
-                        genre = str(genre_value)
                     
                     if genre:
-                        print(f"      ✅ Извлечен жанр: '{genre}'")
+                        if not quiet:
+                            inst.vprint(f"      ✅ Извлечен жанр: '{genre}'")
                         break
             
-            # Если жанр не найден, показываем отладочную информацию
-            if not genre:
+            # Если жанр не найден, показываем отладочную информацию (--verbose)
+            if not genre and not quiet and inst.is_verbose():
                 print(f"      ⚠️  Жанр не найден в MP3 файле")
-                debug_mp3_tags(file_path)
+                debug_mp3_tags(handle)
         else:
-            # Для других форматов используем стандартный GENRE
-            if 'GENRE' in audio:
-                genre_value = audio['GENRE']
-                if isinstance(genre_value, list) and len(genre_value) > 0:
-                    genre = str(genre_value[0])
-                elif isinstance(genre_value, str):
-                    genre = genre_value
+            # Для других форматов используем стандартный GENRE (©gen для MP4)
+            genre = first_tag(tags, GENRE_KEYS)
         
-        # Очищаем жанр от лишних символов
-        if genre:
-            # Сначала обрезаем по символу '/' и берем только первую часть
-            genre = genre.split('/')[0].strip()
-            
-            # Убираем другие недопустимые символы для имен папок
-            genre = re.sub(r'[<>:"\\|?*]', '_', genre.strip())
-            genre = re.sub(r'\s+', ' ', genre)  # Убираем лишние пробелы
-            
-        return genre if genre else None
+        # Очищаем жанр от лишних символов (результат запоминается для каждой строки)
+        return clean_genre(genre)
         
     except Exception as e:
         print(f"      ❌ Ошибка чтения метаданных: {str(e)}")
         return None
 
+def get_folder_index(base_path):
+    """
+    Индекс подпапок base_path, один на сессию
+    Дальше пополняется в create_genre_folder, диск больше не читается
+    """
+    key = str(Path(base_path).absolute())
+    with _session_lock:
+        index = folder_indexes.get(key)
+        if index is None:
+            index = folder_indexes[key] = FolderIndex(Path(base_path))
+        return index
+
+def get_alias_table(base_path):
+    """
+    Таблица псевдонимов для папки вывода (по умолчанию <output>/_genre_aliases.json)
+    В dry-run решения запоминаются только в памяти
+    """
+    path = Path(aliases_file) if aliases_file else Path(base_path) / ALIASES_NAME
+    key = str(path.absolute())
+    with _session_lock:
+        table = alias_tables.get(key)
+        if table is None:
+            table = alias_tables[key] = AliasTable(path, save=not is_dry_run())
+        return table
+
 def find_similar_folders(base_path, genre):
     """
-    Ищет похожие существующие папки
+    Ищет похожие существующие папки (лучшие совпадения первыми)
     """
-    existing_folders = [folder.name for folder in base_path.iterdir() if folder.is_dir()]
-    similar_folders = []
-    
-    # Простой поиск по частичному совпадению
-    genre_lower = genre.lower()
-    for folder in existing_folders:
-        folder_lower = folder.lower()
-        if genre_lower in folder_lower or folder_lower in genre_lower:
-            similar_folders.append(folder)
-    
-    return similar_folders
+    return get_folder_index(base_path).similar(genre, limit=SIMILAR_FOLDERS_LIMIT)
 
-def get_folder_name_from_user(base_path, genre, audio_file=None):
+def get_folder_name_from_user(base_path, genre, audio_file=None, similar_folders=None):
     """
     Упрощенный процесс получения названия папки от пользователя
     Если папка не найдена - сразу запускает трек
+    similar_folders можно передать заранее (из предзагрузки)
     """
     # Ищем похожие папки
-    similar_folders = find_similar_folders(base_path, genre)
+    if similar_folders is None:
+        similar_folders = find_similar_folders(base_path, genre)
     
     if similar_folders:
         print(f"\n🔍 Найдена папка для жанра '{genre}': {similar_folders[0]}")
+        if len(similar_folders) > 1:
+            print(f"   📂 Еще похожие: {', '.join(similar_folders[1:])}")
         if audio_file:
             print(f"🎵 Трек: {audio_file.name}")
             print(f"🎵 ▶️  Запускаю трек...")
@@ -371,29 +378,57 @@ def get_folder_name_from_user(base_path, genre, audio_file=None):
         
         return folder_name
 
-def create_genre_folder(base_path, genre, audio_file=None):
+def create_genre_folder(base_path, genre, audio_file=None, prefetched=None):
     """
     Создает папку для жанра с упрощенным процессом
+    prefetched - результат resolve_file, если он еще актуален
     Возвращает (genre_folder, new_genre_name, is_custom, was_created)
     """
+    global folder_generation
+    
     # Сначала проверяем, существует ли уже папка с таким именем
     genre_folder = base_path / genre
-    if genre_folder.exists():
+    if prefetched is not None:
+        folder_exists = prefetched['folder_exists']
+        similar_folders = prefetched['similar_folders']
+    else:
+        folder_exists = genre_folder.exists() or genre_folder in dry_run_folders
+        similar_folders = None
+    
+    if folder_exists:
         print(f"   ✅ Найдена папка: {genre}")
         return genre_folder, genre, False, False
     
-    # Если папки нет, спрашиваем пользователя
-    folder_name = get_folder_name_from_user(base_path, genre, audio_file)
+    # Этот жанр (или его другое написание) уже разбирали - берем прошлое решение
+    aliases = get_alias_table(base_path)
+    alias = aliases.lookup(genre)
+    if alias and alias in get_folder_index(base_path):
+        print(f"   🔗 Папка по псевдониму: {genre} → {alias}")
+        is_custom = alias != genre and not alias.startswith('_')
+        return base_path / alias, alias, is_custom, False
+    
+    # Если папки нет, спрашиваем пользователя и запоминаем ответ
+    folder_name = get_folder_name_from_user(base_path, genre, audio_file, similar_folders)
+    aliases.record(genre, folder_name)
     genre_folder = base_path / folder_name
     
     try:
         was_created = False
-        if genre_folder.exists():
+        if genre_folder.exists() or genre_folder in dry_run_folders:
             print(f"   ✅ Найдена папка: {folder_name}")
+        elif is_dry_run():
+            dry_run_folders.add(genre_folder)
+            print(f"   🧪 Будет создана папка: {folder_name}")
+            was_created = True
+            folder_generation += 1
         else:
             genre_folder.mkdir(exist_ok=True)
+            if journal:
+                journal.record('mkdir', path=str(genre_folder))
             print(f"   ✅ Создана папка: {folder_name}")
             was_created = True
+            folder_generation += 1
+        get_folder_index(base_path).add(folder_name)
         
         # Определяем, было ли выбрано кастомное имя
         is_custom = folder_name != genre and not folder_name.startswith('_')
@@ -402,97 +437,324 @@ def create_genre_folder(base_path, genre, audio_file=None):
         print(f"      ❌ Ошибка создания папки {folder_name}: {str(e)}")
         return None, None, False, False
 
-def update_genre_in_file(file_path, new_genre):
+def genre_from_folder(folder_name):
+    """
+    Жанр для тега по имени папки: до '/' и без '_' в начале
+    """
+    if not folder_name:
+        return folder_name
+    return folder_name.split('/')[0].strip().lstrip('_')
+
+def update_genre_in_file(file_path, new_genre, quiet=False, handle=None):
     """
-    Обновляет жанр в аудиофайле
+    Обновляет жанр в аудиофайле, если он отличается от текущего
+    Ключ тега подбирается по формату (GENRE, TCON, ©gen - см. tag_writer)
+    FLAC сохраняется на месте, если хватает PADDING (см. flac_writer)
+    Старые значения тега пишутся в журнал до записи (для undo)
+    handle - AudioHandle, через который файл уже читался (без него - новый)
     """
+    seq = None
     try:
-        # Определяем тип файла по расширению
-        file_ext = file_path.suffix.lower()
+        clean_genre = genre_from_folder(new_genre)
         
-        if file_ext == '.flac':
-            audio = FLAC(str(file_path))
-        elif file_ext == '.mp3':
-            audio = MP3(str(file_path))
-        elif file_ext in ['.m4a', '.mp4']:
-            audio = MP4(str(file_path))
-        elif file_ext == '.ogg':
-            try:
-                audio = OggVorbis(str(file_path))
-            except:
-                audio = OggOpus(str(file_path))
-        elif file_ext == '.opus':
-            audio = OggOpus(str(file_path))
-        elif file_ext == '.aiff':
-            audio = AIFF(str(file_path))
-        else:
-            audio = MutagenFile(str(file_path))
+        if handle is None:
+            handle = AudioHandle(file_path)
+        if journal:
+            record = handle.load()
+            planned = plan_changes(file_path, record, {'genre': clean_genre}) if record else []
+            if planned:
+                seq = journal.plan('retag', path=str(file_path),
+                                   changes=[{'field': c.field, 'old': c.old, 'new': c.new} for c in planned])
         
-        if audio is None:
-            return False
-            
-        # Очищаем жанр перед обновлением
-        if new_genre:
-            # Сначала обрезаем по '/'
-            clean_genre = new_genre.split('/')[0].strip()
-            # Убираем символы '_' из начала названия папки
-            clean_genre = clean_genre.lstrip('_')
-        else:
-            clean_genre = new_genre
-            
-        # Обновляем жанр - для MP3 используем TCON тег
-        if file_ext == '.mp3':
-            # Для MP3 используем TCON (Text Content) - стандартный тег для жанра в ID3v2
-            # Создаем правильный объект TCON
-            audio['TCON'] = TCON(encoding=3, text=clean_genre)
-        else:
-            # Для других форматов используем GENRE
-            audio['GENRE'] = clean_genre
-            
-        audio.save()
+        update = handle.update_tags({'genre': clean_genre})
+        if seq:
+            journal.done(seq)
+        if update.report and not quiet:
+            print(f"      💾 Записано: {format_report(update.report)}")
         return True
         
     except Exception as e:
+        if seq:
+            journal.fail(seq, e)
         print(f"      ❌ Ошибка обновления жанра: {str(e)}")
         return False
 
-def move_file_to_genre_folder(file_path, genre_folder, genre, new_genre_name=None):
+def find_free_destination(genre_folder, file_path):
+    """
+    Возвращает свободный путь для файла в папке (name, name_1, name_2, ...)
+    Имя берется из индекса папки и сразу считается занятым
+    """
+    return destination_names.reserve(genre_folder, file_path.name)
+
+def get_move_engine():
+    global move_engine
+    if move_engine is None:
+        move_engine = MoveEngine()
+    return move_engine
+
+def get_duplicate_index():
+    global duplicates
+    if duplicates is None:
+        duplicates = DuplicateIndex()
+    return duplicates
+
+def check_duplicate(file_path, genre_folder):
+    """
+    Файл в папке с теми же аудиоданными или None (политика keep - не ищем)
+    """
+    if duplicate_policy == 'keep':
+        return None
+    try:
+        return get_duplicate_index().find(file_path, genre_folder)
+    except OSError:
+        return None
+
+def link_duplicate(file_path, existing, genre_folder, genre, new_genre_name=None, quiet=False):
     """
-    Перемещает файл в папку жанра и обновляет тег жанра
+    Политика link: вместо копии - жесткая ссылка на уже лежащий в папке файл,
+    исходник удаляется. Только для одинаковых байт-в-байт файлов на одном диске,
+    иначе файл остается на месте (None)
+    В журнале - обычное перемещение с linked_to, undo вернет файл на место
     """
     try:
-        destination = genre_folder / file_path.name
+        if os.path.getsize(file_path) != os.path.getsize(existing) or \
+                not same_device(file_path, genre_folder) or file_digest(file_path) != file_digest(existing):
+            if not quiet:
+                print(f"   ♻️  Дубликат отличается тегами или лежит на другом диске - оставляю на месте")
+            return None
+    except OSError as e:
+        print(f"      ❌ Ошибка сравнения с дубликатом: {str(e)}")
+        return None
+    
+    destination = find_free_destination(genre_folder, file_path)
+    if is_dry_run():
+        print(f"🧪 {file_path} → {destination} (ссылка на {existing})")
+        return destination
+    
+    seq = None
+    if journal:
+        seq = journal.plan('move', src=str(file_path.absolute()), dst=str(destination.absolute()),
+                           genre=genre, folder=new_genre_name, linked_to=str(Path(existing).absolute()))
+    try:
+        os.link(existing, destination)
+        os.unlink(file_path)
+    except OSError as e:
+        if seq:
+            journal.fail(seq, e)
+        if isinstance(e, FileExistsError):
+            destination_names.taken(destination)
+        elif file_path.exists():
+            destination_names.release(destination)
+        print(f"      ❌ Ошибка создания ссылки: {str(e)}")
+        return None
+    if seq:
+        journal.done(seq)
+    # Тег не трогаем: файл общий с существующим
+    get_catalog().move(file_path, destination)
+    get_duplicate_index().add(destination)
+    return destination
+
+def retag_before_move(file_path, genre_folder, genre, new_genre_name=None, quiet=False, handle=None):
+    """
+    Обновляет тег жанра до перемещения, чтобы файл не переписывался еще раз
+    уже в папке назначения. FLAC, который уезжает на другой диск и которому
+    не хватает PADDING, получает новые метаданные прямо в копии (header для
+    MoveEngine); остальные файлы правятся в исходнике до rename/копирования
+    Возвращает Retag или None (менять нечего или не вышло - файл все равно переносится)
+    """
+    if not new_genre_name or new_genre_name == genre:
+        return None
+    if not quiet:
+        print(f"   🔄 Обновляю жанр в файле: '{genre}' → '{new_genre_name}'")
+    seq = None
+    try:
+        if handle is None:
+            handle = AudioHandle(file_path)
+        planned = handle.stage({'genre': genre_from_folder(new_genre_name)})
+        if not planned:
+            return None
+        if journal:
+            seq = journal.plan('retag', path=str(file_path.absolute()),
+                               changes=[{'field': c.field, 'old': c.old, 'new': c.new} for c in planned])
         
-        # Проверяем, не существует ли уже файл с таким именем
-        if destination.exists():
-            # Добавляем номер к имени файла
-            counter = 1
-            name_parts = file_path.stem, file_path.suffix
-            while destination.exists():
-                new_name = f"{name_parts[0]}_{counter}{name_parts[1]}"
-                destination = genre_folder / new_name
-                counter += 1
+        header = None
+        if not same_device(file_path, genre_folder):
+            plan = handle.plan_metadata()
+            if plan is not None and not plan.in_place:
+                header = (plan.data, plan.audio_offset, plan.audio_end)
+        if header is None:
+            update = handle.save(planned)
+            if seq:
+                journal.done(seq)
+            if update.report and not quiet:
+                print(f"      💾 Записано: {format_report(update.report)}")
+            if not quiet:
+                print(f"   ✅ Жанр обновлен в файле")
+        return Retag(seq, planned, header, handle)
+    except Exception as e:
+        if seq:
+            journal.fail(seq, e)
+        print(f"   ⚠️  Не удалось обновить жанр в файле: {file_path} ({str(e)})")
+        return None
+
+def revert_retag(file_path, retag, error):
+    """
+    Перемещение не удалось: тег, уже записанный в исходник, возвращается
+    как был, запись журнала - failed (undo ее не трогает). Тег, который
+    шел только в копию (retag.header), в исходник не попадал
+    Исходника нет - файл все же переехал, тег остается
+    """
+    if retag is None or not file_path.exists():
+        return
+    if retag.header is None:
+        try:
+            retag.handle.update_tags({c.field: c.old or None for c in retag.planned}, dry_run=False)
+        except Exception as e:
+            print(f"   ⚠️  Не удалось вернуть жанр в файле: {file_path} ({str(e)})")
+            return
+    if retag.seq:
+        journal.fail(retag.seq, error)
+
+def finish_move(file_path, destination, seq=None, quiet=False, handle=None, retag=None):
+    """
+    Все, что нужно после перемещения: журнал, каталог тегов, учет тега,
+    вписанного в копию (retag.header, см. retag_before_move)
+    """
+    if seq:
+        journal.done(seq)
+    migrated = get_catalog().move(file_path, destination)
+    if handle is not None:
+        handle.moved(destination)
+        # Копия между дисками (другой inode) проверена по хэшу - запись handle верна и для нее
+        if not migrated and handle.record is not None and (retag is None or retag.header is None):
+            get_catalog().store(destination, handle.record)
+    if retag is not None and retag.header is not None:
+        retag.handle.streamed(destination, retag.planned)
+        if retag.seq:
+            journal.done(retag.seq)
+        if not quiet:
+            print(f"   ✅ Жанр обновлен в копии")
+    
+    if duplicates is not None:
+        duplicates.add(destination)
+    if handle is not None:
+        handle.release()
+
+def move_file_to_genre_folder(file_path, genre_folder, genre, new_genre_name=None, quiet=False, handle=None):
+    """
+    Перемещает файл в папку жанра и обновляет тег жанра (до перемещения,
+    см. retag_before_move - файл пишется один раз)
+    Если имя успел занять другой процесс, подбирается следующее
+    quiet=True - выводить только ошибки (пакетный режим)
+    Перемещение пишется в журнал до и после (см. journal.py)
+    handle - AudioHandle, через который читался жанр (файл не разбирается заново)
+    """
+    seq = None
+    destination = None
+    retag = None
+    try:
+        destination = find_free_destination(genre_folder, file_path)
         
-        # Перемещаем файл
-        shutil.move(str(file_path), str(destination))
+        # В dry-run только показываем план, тег сверяем по исходному файлу
+        if is_dry_run():
+            print(f"🧪 {file_path} → {destination}")
+            if new_genre_name and new_genre_name != genre:
+                update_genre_in_file(file_path, new_genre_name, quiet, handle)
+            return destination
         
-        # Обновляем тег жанра в файле
-        if new_genre_name and new_genre_name != genre:
-            print(f"   🔄 Обновляю жанр в файле: '{genre}' → '{new_genre_name}'")
-            if update_genre_in_file(destination, new_genre_name):
-                print(f"   ✅ Жанр обновлен в файле")
-            else:
-                print(f"   ⚠️  Не удалось обновить жанр в файле")
+        retag = retag_before_move(file_path, genre_folder, genre, new_genre_name, quiet, handle)
+        header = retag.header if retag else None
         
+        # Перемещаем файл (без перезаписи: занятое снаружи имя - берем следующее)
+        for attempt in range(MAX_NAME_RETRIES):
+            if journal:
+                seq = journal.plan('move', src=str(file_path.absolute()), dst=str(destination.absolute()),
+                                   genre=genre, folder=new_genre_name)
+            try:
+                get_move_engine().move(file_path, destination, header)
+                break
+            except FileExistsError as e:
+                if seq:
+                    journal.fail(seq, e)
+                    seq = None
+                destination_names.taken(destination)
+                if attempt == MAX_NAME_RETRIES - 1:
+                    raise
+                destination = find_free_destination(genre_folder, file_path)
+        finish_move(file_path, destination, seq, quiet, handle, retag)
         return destination
         
     except Exception as e:
+        if seq and journal.operations[seq]['state'] == 'planned':
+            journal.fail(seq, e)
+        revert_retag(file_path, retag, e)
+        if destination is not None and not isinstance(e, FileExistsError) and file_path.exists():
+            destination_names.release(destination)
         print(f"      ❌ Ошибка перемещения файла: {str(e)}")
         return None
 
-def process_files_by_genre(search_directory=".", output_directory="."):
+def resolve_file(audio_file, output_path):
+    """
+    Готовит все, что нужно для вопроса оператору, без вывода на экран:
+    жанр, наличие папки, похожие папки и свободное имя в папке
+    Вызывается в фоне для следующих файлов (см. Prefetcher)
+    """
+    generation = folder_generation
+    handle = AudioHandle(audio_file)
+    genre = get_genre_from_file(handle, quiet=True)
+    target = genre or "Unknown"
+    genre_folder = output_path / target
+    folder_exists = target in get_folder_index(output_path)
+    
+    # Список имен папки читаем заранее - при перемещении он уже в памяти
+    if folder_exists:
+        destination_names.warm(genre_folder)
+    
+    # Оператора спросят про этот трек - заранее готовим фрагмент для прослушивания
+    if preview_cache and not folder_exists and target not in get_alias_table(output_path):
+        preview_cache.schedule(audio_file)
+    
+    return {
+        'handle': handle,
+        'genre': genre,
+        'generation': generation,
+        'folder_exists': folder_exists,
+        'similar_folders': None if folder_exists else find_similar_folders(output_path, target),
+    }
+
+def load_genre(audio_file):
+    """(AudioHandle, жанр) - для фоновой предзагрузки в пакетном режиме"""
+    handle = AudioHandle(audio_file)
+    return handle, get_genre_from_file(handle, quiet=True)
+
+def find_audio_files(search_path):
+    """
+    Ищет аудиофайлы только в корне директории поиска (без подпапок)
+    Один проход scandir, расширения без учета регистра
+    """
+    with inst.stage('discover'):
+        return sorted(iter_audio_files(search_path, AUDIO_EXTENSIONS, max_depth=0))
+
+def start_journal(mode, search_path, output_path, audio_files, **meta):
+    """
+    Открывает журнал нового запуска (если это не продолжение и не dry-run)
+    """
+    global journal
+    if journal is not None or is_dry_run():
+        return journal
+    meta.update(mode=mode, search=str(search_path.absolute()), output=str(output_path.absolute()),
+                duplicates=duplicate_policy)
+    journal = Journal.create(meta, [f.absolute() for f in audio_files])
+    return journal
+
+def process_files_by_genre(search_directory=".", output_directory=".",
+                           prefetch_depth=DEFAULT_PREFETCH_DEPTH, prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+                           audio_files=None):
     """
     Обрабатывает файлы и перемещает их в папки по жанрам
+    Теги, папки и свободные имена для следующих prefetch_depth файлов
+    готовятся в фоне (prefetch_workers потоков), пока оператор отвечает
+    audio_files - готовый список (продолжение по журналу), иначе поиск
     """
     search_path = Path(search_directory)
     output_path = Path(output_directory)
@@ -509,14 +771,10 @@ def process_files_by_genre(search_directory=".", output_directory="."):
     print(f"📁 Создаю папки жанров в: {output_path.absolute()}")
     print(f"🔍 Ищу аудиофайлы...")
     
-    # Поддерживаемые форматы
-    audio_extensions = ['.flac', '.FLAC', '.mp3', '.MP3', '.m4a', '.M4A', 
-                       '.mp4', '.MP4', '.ogg', '.OGG', '.opus', '.OPUS',
-                       '.aiff', '.AIFF']
-    
     # Счетчики для статистики
     total_files = 0
     moved_files = 0
+    duplicate_files = 0
     no_genre_files = 0
     errors = 0
     genres_found = set()
@@ -524,77 +782,116 @@ def process_files_by_genre(search_directory=".", output_directory="."):
     existing_folders = set()
     
     # Ищем все аудиофайлы только в корне директории поиска (без подпапок)
-    audio_files = []
-    for ext in audio_extensions:
-        found_files = list(search_path.glob(f"*{ext}"))
-        audio_files.extend(found_files)
+    if audio_files is None:
+        audio_files = find_audio_files(search_path)
     
     if not audio_files:
         print(f"❌ Аудиофайлы не найдены!")
-        print(f"🔍 Поддерживаемые форматы: {', '.join(audio_extensions)}")
+        print(f"🔍 Поддерживаемые форматы: {', '.join(sorted(AUDIO_EXTENSIONS))}")
         return
     
     print(f"🎧 Найдено {len(audio_files)} аудиофайлов")
+    if start_journal('interactive', search_path, output_path, audio_files):
+        print(f"📒 Журнал операций: {journal.run_id}")
     
     # Создаем папку "Unknown" для файлов без жанра в директории вывода
     unknown_folder = output_path / "Unknown"
     
-    # Обрабатываем каждый файл
-    for i, audio_file in enumerate(audio_files, 1):
-        # Проверяем, не было ли прерывания
-        if interrupted:
-            print("\n⏹️  Обработка прервана пользователем")
-            break
-            
-        print(f"\n🎵 [{i}/{len(audio_files)}] Обрабатываю: {audio_file.name}")
-        print(f"   📂 Текущий путь: {audio_file.parent}")
-        
-        try:
-            total_files += 1
-            
-            # Получаем жанр из файла
-            genre = get_genre_from_file(audio_file)
-            
-            if not genre:
-                print(f"   ⚠️  Жанр не найден, перемещаю в папку 'Unknown'")
-                genre = "Unknown"
-                no_genre_files += 1
-            else:
-                print(f"   🎭 Жанр: {genre}")
-                genres_found.add(genre)
-            
-            # Создаем папку для жанра (с интерактивным выбором)
-            genre_folder, new_genre_name, is_custom, was_created = create_genre_folder(output_path, genre, audio_file)
-            if not genre_folder:
-                errors += 1
-                continue
-            
-            # Обновляем статистику папок
-            if was_created:
-                created_folders.add(new_genre_name)
-            else:
-                existing_folders.add(new_genre_name)
+    # Обрабатываем каждый файл, следующие готовятся в фоне
+    with Prefetcher(audio_files, lambda f: resolve_file(f, output_path),
+                    depth=prefetch_depth, workers=prefetch_workers) as prefetcher:
+        for i, audio_file in enumerate(audio_files, 1):
+            # Проверяем, не было ли прерывания
+            if interrupted:
+                print("\n⏹️  Обработка прервана пользователем")
+                break
+                
+            print(f"\n🎵 [{i}/{len(audio_files)}] Обрабатываю: {audio_file.name}")
+            inst.vprint(f"   📂 Текущий путь: {audio_file.parent}")
             
-            # Перемещаем файл (обновление тега жанра происходит внутри функции)
-            destination = move_file_to_genre_folder(audio_file, genre_folder, genre, new_genre_name)
-            if destination:
-                moved_files += 1
-                print(f"   ✅ Перемещен в: {destination}")
-            else:
-                errors += 1
+            handle = None
+            try:
+                total_files += 1
                 
-        except Exception as e:
-            errors += 1
-            print(f"   ❌ ОШИБКА: {str(e)}")
+                # Получаем жанр из файла (обычно уже готов в фоне)
+                resolved = prefetcher.get(i - 1)
+                genre = resolved['genre']
+                handle = resolved['handle']
+                
+                # Пока файл ждал очереди, могли появиться новые папки
+                if resolved['generation'] != folder_generation:
+                    resolved = None
+                
+                if not genre:
+                    print(f"   ⚠️  Жанр не найден, перемещаю в папку 'Unknown'")
+                    genre = "Unknown"
+                    no_genre_files += 1
+                else:
+                    print(f"   🎭 Жанр: {genre}")
+                    genres_found.add(genre)
+                
+                # Создаем папку для жанра (с интерактивным выбором)
+                genre_folder, new_genre_name, is_custom, was_created = create_genre_folder(output_path, genre, audio_file, resolved)
+                if not genre_folder:
+                    errors += 1
+                    continue
+                
+                # Обновляем статистику папок
+                if was_created:
+                    created_folders.add(new_genre_name)
+                else:
+                    existing_folders.add(new_genre_name)
+                
+                # Те же аудиоданные уже лежат в папке
+                existing = check_duplicate(audio_file, genre_folder)
+                if existing:
+                    print(f"   ♻️  Дубликат: {existing}")
+                    if duplicate_policy == 'link':
+                        destination = link_duplicate(audio_file, existing, genre_folder, genre, new_genre_name)
+                        if destination:
+                            moved_files += 1
+                            print(f"   🔗 Ссылка: {destination}")
+                            continue
+                    duplicate_files += 1
+                    print(f"   ⏭️  Оставлен на месте")
+                    continue
+                
+                # Перемещаем файл (обновление тега жанра происходит внутри функции)
+                destination = move_file_to_genre_folder(audio_file, genre_folder, genre, new_genre_name,
+                                                        handle=handle)
+                if destination:
+                    moved_files += 1
+                    print(f"   ✅ Перемещен в: {destination}")
+                else:
+                    errors += 1
+                    
+            except Exception as e:
+                errors += 1
+                print(f"   ❌ ОШИБКА: {str(e)}")
+            finally:
+                # Дубликат, отказ, ошибка - объект mutagen больше не нужен
+                if handle is not None:
+                    handle.release()
     
     # Выводим статистику
     print(f"\n" + "="*60)
     print(f"📊 ФИНАЛЬНАЯ СТАТИСТИКА:")
     print(f"   🎵 Всего файлов обработано: {total_files}")
     print(f"   ✅ Успешно перемещено: {moved_files}")
+    print(f"   ♻️  Дубликатов оставлено на месте: {duplicate_files}")
     print(f"   ⚠️  Без жанра (в папку 'Unknown'): {no_genre_files}")
     print(f"   ❌ Ошибок: {errors}")
     print(f"   🎭 Найдено жанров: {len(genres_found)}")
+    print(f"   🔗 Папок по псевдонимам: {get_alias_table(output_path).hits}")
+    if move_engine and move_engine.files:
+        transfer = move_engine.report()
+        print(f"   🚚 Перенесено: {transfer['mb']} МБ ({transfer['copied']} копий между дисками), "
+              f"{transfer['mb_per_s']} МБ/с, {transfer['files_per_s']} файлов/с")
+    io = handle_stats()
+    print(f"   📖 Разобрано файлов: {io['parsed']} (из каталога: {io['cached']}), записано: {io['written']}, "
+          f"макс. на файл: {io['max_reads']} чт. / {io['max_writes']} зап.")
+    if preview_cache:
+        print(f"   🎧 Фрагменты из кэша: {preview_cache.hits}, с ожиданием: {preview_cache.misses}")
     
     if genres_found:
         print(f"\n🎭 Найденные жанры:")
@@ -616,6 +913,199 @@ def process_files_by_genre(search_directory=".", output_directory="."):
     
     print(f"="*60)
 
+def add_to_review_queue(review_file, audio_file, genre, reason):
+    """
+    Записывает файл в очередь на ручной разбор (одна JSON-строка на файл)
+    review_file=None (dry-run) - только печатает
+    """
+    entry = {
+        'path': str(audio_file.absolute()),
+        'genre': genre,
+        'reason': reason,
+        'time': datetime.now().isoformat(timespec='seconds'),
+    }
+    if review_file is None:
+        print(f"🧪 В очередь на разбор: {entry['path']} ({reason})")
+        return
+    review_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def process_files_batch(search_directory, output_directory, rules, review_queue=None,
+                        workers=DEFAULT_PREFETCH_WORKERS, audio_files=None, rules_path=None,
+                        move_workers=DEFAULT_MOVE_WORKERS):
+    """
+    Неинтерактивный режим: раскладывает файлы по правилам без вопросов
+    Файлы, для которых правило не нашлось, остаются на месте
+    и попадают в очередь на разбор (JSON Lines)
+    audio_files - готовый список (продолжение по журналу), иначе поиск
+    Возвращает сводку (dict), которая печатается как JSON
+    """
+    started = time.time()
+    search_path = Path(search_directory)
+    output_path = Path(output_directory)
+    review_path = Path(review_queue) if review_queue else output_path / REVIEW_QUEUE_NAME
+    
+    summary = {
+        'mode': 'batch',
+        'dry_run': is_dry_run(),
+        'search_directory': str(search_path.absolute()),
+        'output_directory': str(output_path.absolute()),
+        'review_queue': str(review_path.absolute()),
+        'total': 0,
+        'moved': 0,
+        'review': 0,
+        'duplicates': 0,
+        'linked': 0,
+        'no_genre': 0,
+        'errors': 0,
+        'rules': {},
+        'folders': {},
+        'created_folders': [],
+    }
+    
+    if not search_path.is_dir() or not output_path.is_dir():
+        summary['error'] = 'search or output directory does not exist'
+        return summary
+    
+    if audio_files is None:
+        audio_files = find_audio_files(search_path)
+    if start_journal('batch', search_path, output_path, audio_files,
+                     rules=str(Path(rules_path).absolute()) if rules_path else None,
+                     review_queue=str(review_path.absolute())):
+        summary['run_id'] = journal.run_id
+    existing_folders = get_folder_index(output_path)
+    aliases = get_alias_table(output_path)
+    engine = MoveEngine(workers=move_workers)
+    
+    def submit(audio_file, handle, genre, folder, rule, attempt=0, retag=None):
+        """
+        Ставит перемещение в пул; готовые к этому моменту - сразу завершаем
+        Тег жанра обновляется до постановки (см. retag_before_move)
+        """
+        if attempt == 0:
+            retag = retag_before_move(audio_file, output_path / folder, genre or "Unknown", folder,
+                                      quiet=True, handle=handle)
+        destination = find_free_destination(output_path / folder, audio_file)
+        seq = None
+        if journal:
+            seq = journal.plan('move', src=str(audio_file.absolute()), dst=str(destination.absolute()),
+                               genre=genre or "Unknown", folder=folder)
+        token = (audio_file, handle, genre, folder, rule, seq, attempt, retag)
+        for result in engine.submit(audio_file, destination, token, retag.header if retag else None):
+            complete(result)
+    
+    def complete(result):
+        """Перемещение завершено (в порядке готовности копий)"""
+        audio_file, handle, genre, folder, rule, seq, attempt, retag = result.token
+        if result.error is not None:
+            if seq:
+                journal.fail(seq, result.error)
+            # Имя занял другой процесс - оно занято, пробуем следующее
+            if isinstance(result.error, FileExistsError):
+                destination_names.taken(result.dst)
+                if attempt + 1 < MAX_NAME_RETRIES:
+                    submit(audio_file, handle, genre, folder, rule, attempt + 1, retag)
+                    return
+            elif audio_file.exists():
+                destination_names.release(result.dst)
+            revert_retag(audio_file, retag, result.error)
+            summary['errors'] += 1
+            print(f"❌ {audio_file}: {str(result.error)}", file=sys.stderr)
+            add_to_review_queue(review_file, audio_file, genre, 'move_failed')
+            handle.release()
+            return
+        finish_move(audio_file, result.dst, seq, quiet=True, handle=handle, retag=retag)
+        summary['moved'] += 1
+        summary['rules'][rule] = summary['rules'].get(rule, 0) + 1
+        summary['folders'][folder] = summary['folders'].get(folder, 0) + 1
+    
+    # Чтение тегов идет параллельно с перемещениями - упираемся только в диск
+    with Prefetcher(audio_files, load_genre,
+                    depth=workers * 4, workers=workers) as prefetcher, \
+            (nullcontext() if is_dry_run() else open(review_path, 'a', encoding='utf-8')) as review_file:
+        try:
+            for i, audio_file in enumerate(audio_files):
+                if interrupted:
+                    summary['interrupted'] = True
+                    break
+            
+                summary['total'] += 1
+                inst.progress(i + 1, len(audio_files))
+                handle = None
+                submitted = False
+                try:
+                    handle, genre = prefetcher.get(i)
+                    if not genre:
+                        summary['no_genre'] += 1
+                
+                    # Сначала решения оператора из интерактивного режима, потом правила
+                    with inst.stage('decide'):
+                        folder, rule = aliases.lookup(genre), 'alias'
+                        if not folder:
+                            folder, rule = rules.resolve(genre, existing_folders)
+                    if folder is None:
+                        add_to_review_queue(review_file, audio_file, genre, 'no_genre' if not genre else 'no_rule')
+                        summary['review'] += 1
+                        continue
+                
+                    genre_folder = output_path / folder
+                    if folder not in existing_folders:
+                        if not is_dry_run() and not genre_folder.exists():
+                            genre_folder.mkdir(parents=True, exist_ok=True)
+                            if journal:
+                                journal.record('mkdir', path=str(genre_folder.absolute()))
+                        existing_folders.add(folder)
+                        summary['created_folders'].append(folder)
+                
+                    existing = check_duplicate(audio_file, genre_folder)
+                    if existing:
+                        if duplicate_policy == 'link' and link_duplicate(audio_file, existing, genre_folder,
+                                                                         genre or "Unknown", folder, quiet=True):
+                            summary['linked'] += 1
+                            continue
+                        add_to_review_queue(review_file, audio_file, genre, 'duplicate')
+                        summary['duplicates'] += 1
+                        continue
+                
+                    if is_dry_run():
+                        if move_file_to_genre_folder(audio_file, genre_folder, genre or "Unknown", folder,
+                                                     quiet=True, handle=handle):
+                            summary['moved'] += 1
+                            summary['rules'][rule] = summary['rules'].get(rule, 0) + 1
+                            summary['folders'][folder] = summary['folders'].get(folder, 0) + 1
+                        continue
+                
+                    # Копии между дисками идут в пуле потоков, остальное - по мере готовности
+                    submitted = True
+                    submit(audio_file, handle, genre, folder, rule)
+                except Exception as e:
+                    summary['errors'] += 1
+                    print(f"❌ {audio_file}: {str(e)}", file=sys.stderr)
+                finally:
+                    # Поставленный в очередь файл отпускается в finish_move / complete
+                    if handle is not None and not submitted:
+                        handle.release()
+        finally:
+            # И при исключении: копии в пути дожидаются и попадают в журнал и сводку
+            try:
+                # Завершение может поставить повторные попытки - крутимся, пока есть результаты
+                results = engine.finish()
+                while results:
+                    for result in results:
+                        complete(result)
+                    results = engine.finish()
+            finally:
+                engine.close()
+    
+    summary['transfer'] = engine.report()
+    # Файлы, у которых расширение не совпало с содержимым (формат взят по содержимому)
+    summary['format_mismatches'] = len(format_sniff.mismatches)
+    # Сколько раз файлы разбирались и писались (на файл - не больше одного раза)
+    summary['io'] = handle_stats()
+    elapsed = time.time() - started
+    summary['elapsed_s'] = round(elapsed, 3)
+    summary['files_per_s'] = round(summary['total'] / elapsed, 1) if elapsed > 0 else None
+    return summary
+
 def get_search_directory():
     """
     Получает директорию для поиска файлов
@@ -703,13 +1193,230 @@ def get_output_directory():
     
     return output_dir
 
+def parse_args(argv=None):
+    """
+    Разбирает параметры командной строки
+    """
+    parser = argparse.ArgumentParser(description="Перемещение аудиофайлов в папки по жанрам")
+    parser.add_argument("--search", help="где искать аудиофайлы (без вопроса)")
+    parser.add_argument("--output", help="где создавать папки жанров (без вопроса)")
+    parser.add_argument("--batch", metavar="RULES",
+                        help="неинтерактивный режим: JSON-файл правил жанр → папка (см. genre_rules.py)")
+    parser.add_argument("--watch", action="store_true",
+                        help="с --batch: не выходить, а следить за папкой поиска и раскладывать новые файлы")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help=f"с --watch: сколько секунд файл не должен меняться (по умолчанию {DEFAULT_SETTLE})")
+    parser.add_argument("--poll", action="store_true",
+                        help="с --watch: опрашивать папку вместо inotify (сетевые ФС)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="только показать план (перемещения и изменения тегов), ничего не меняя")
+    parser.add_argument("--review-queue", metavar="FILE",
+                        help=f"куда писать неразобранные файлы в пакетном режиме (по умолчанию <output>/{REVIEW_QUEUE_NAME})")
+    parser.add_argument("--aliases", metavar="FILE",
+                        help=f"таблица псевдонимов жанр → папка (по умолчанию <output>/{ALIASES_NAME})")
+    parser.add_argument("--preview-offset", type=float, default=DEFAULT_PREVIEW_OFFSET,
+                        help=f"с какой секунды играть фрагмент (по умолчанию {DEFAULT_PREVIEW_OFFSET})")
+    parser.add_argument("--preview-length", type=float, default=DEFAULT_PREVIEW_LENGTH,
+                        help=f"длина фрагмента в секундах (по умолчанию {DEFAULT_PREVIEW_LENGTH})")
+    parser.add_argument("--preview-cache-mb", type=int, default=DEFAULT_CACHE_MB,
+                        help=f"размер кэша фрагментов, 0 - выключить (по умолчанию {DEFAULT_CACHE_MB})")
+    parser.add_argument("--resume", nargs="?", const="last", metavar="RUN",
+                        help="продолжить прерванный запуск по журналу (по умолчанию последний)")
+    parser.add_argument("--undo", nargs="?", const="last", metavar="RUN",
+                        help="отменить запуск: вернуть файлы и теги (по умолчанию последний)")
+    parser.add_argument("--runs", action="store_true", help="показать журналы запусков")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default='skip',
+                        help="точный дубликат в папке: skip - оставить на месте, keep - положить рядом, "
+                             "link - жесткая ссылка (по умолчанию skip)")
+    parser.add_argument("--move-workers", type=int, default=DEFAULT_MOVE_WORKERS,
+                        help=f"потоков копирования между дисками в пакетном режиме (по умолчанию {DEFAULT_MOVE_WORKERS})")
+    parser.add_argument("--prefetch-depth", type=int, default=DEFAULT_PREFETCH_DEPTH,
+                        help=f"сколько следующих файлов готовить заранее, 0 - выключить (по умолчанию {DEFAULT_PREFETCH_DEPTH})")
+    parser.add_argument("--prefetch-workers", type=int, default=DEFAULT_PREFETCH_WORKERS,
+                        help=f"потоков предзагрузки (по умолчанию {DEFAULT_PREFETCH_WORKERS})")
+    inst.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def load_batch_rules(args):
+    """
+    Правила пакетного режима или None (ошибка уже напечатана)
+    """
+    if not args.search or not args.output:
+        print("❌ В пакетном режиме нужны --search и --output", file=sys.stderr)
+        return None
+    try:
+        return GenreRules.load(args.batch)
+    except RulesError as e:
+        print(f"❌ Ошибка в правилах: {e}", file=sys.stderr)
+        return None
+
+def run_batch(args, audio_files=None):
+    """
+    Пакетный режим для cron: без вопросов, сводка в JSON на stdout
+    Код возврата: 0 - все разложено, 1 - были ошибки, 2 - неверные параметры
+    """
+    rules = load_batch_rules(args)
+    if rules is None:
+        return 2
+    
+    summary = process_files_batch(args.search, args.output, rules, args.review_queue,
+                                  workers=args.prefetch_workers, audio_files=audio_files, rules_path=args.batch,
+                                  move_workers=args.move_workers)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary['errors'] or summary.get('error') else 0
+
+def reset_session_caches():
+    """
+    Забывает индексы папок вывода, занятые имена и дубликаты - в режиме
+    наблюдения между пачками папки могли поменять вручную
+    """
+    global destination_names, duplicates
+    with _session_lock:
+        folder_indexes.clear()
+        alias_tables.clear()
+    destination_names = NameIndex()
+    duplicates = None
+
+def run_watch(args):
+    """
+    Демон для входящей папки: ждет файлы (inotify, иначе опрос), и как только
+    они перестали расти, раскладывает их пачкой тем же путем, что --batch
+    Между поступлениями процесс спит. Сводка каждой пачки - строка JSON на stdout,
+    у каждой пачки свой журнал (--undo отменяет одну пачку)
+    """
+    global journal
+    rules = load_batch_rules(args)
+    if rules is None:
+        return 2
+    if not Path(args.output).is_dir():
+        print(f"❌ Директория вывода {args.output} не существует!", file=sys.stderr)
+        return 2
+    try:
+        watcher = FolderWatcher(args.search, settle=args.settle, use_inotify=not args.poll)
+    except WatchError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    
+    signal.signal(signal.SIGTERM, signal_handler)
+    print(f"👀 Слежу за {Path(args.search).absolute()} ({watcher.backend}), "
+          f"папки жанров в {Path(args.output).absolute()}", file=sys.stderr)
+    errors = 0
+    with watcher:
+        while not interrupted:
+            try:
+                audio_files = watcher.next_batch()
+            except WatchError as e:
+                print(f"❌ {e}", file=sys.stderr)
+                return 1
+            reset_session_caches()
+            summary = process_files_batch(args.search, args.output, rules, args.review_queue,
+                                          workers=args.prefetch_workers, audio_files=audio_files,
+                                          rules_path=args.batch, move_workers=args.move_workers)
+            if journal:
+                journal.close()
+                journal = None
+            errors += summary['errors']
+            print(json.dumps(summary, ensure_ascii=False), flush=True)
+    return 1 if errors else 0
+
+def resume_run(args):
+    """
+    Продолжение прерванного запуска по журналу, без повторного поиска файлов
+    Параметры (папки, правила) берутся из журнала
+    Возвращает список оставшихся файлов
+    """
+    global journal, duplicate_policy
+    journal = Journal.open(args.resume)
+    if journal.undone:
+        raise JournalError(f"run {journal.run_id} was undone")
+    recovered = journal.reconcile()
+    # Файл успели переместить, но тег могли не обновить
+    for entry in recovered:
+        if entry.get('folder') and entry['folder'] != entry.get('genre'):
+            update_genre_in_file(Path(entry['dst']), entry['folder'], quiet=True)
+    meta = journal.header['meta']
+    args.search = meta['search']
+    args.output = meta['output']
+    duplicate_policy = meta.get('duplicates', duplicate_policy)
+    if meta['mode'] == 'batch':
+        args.batch = meta['rules']
+        args.review_queue = meta.get('review_queue')
+    pending = journal.pending_files()
+    print(f"📒 Продолжаю запуск {journal.run_id}: осталось {len(pending)} файлов"
+          f" (восстановлено по диску: {len(recovered)})", file=sys.stderr)
+    return pending
+
+def undo_move(destination, source):
+    """Возвращает файл на старое место (для undo)"""
+    get_move_engine().move(destination, source)
+    destination_names.release(destination)
+    get_catalog().move(destination, source)
+
+def undo_retag(path, field, old_values):
+    """Возвращает прежнее значение тега (для undo)"""
+    update_tags(path, {field: old_values or None})
+
+def run_undo(run_id):
+    """
+    Отменяет все операции запуска: теги, перемещения, созданные папки
+    """
+    try:
+        run_journal = Journal.open(run_id)
+        print(f"↩️  Отменяю запуск {run_journal.run_id}...")
+        stats = undo_run(run_journal, undo_retag, undo_move)
+    except JournalError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    print(f"   📦 Возвращено файлов: {stats['moved_back']}")
+    print(f"   🏷️  Возвращено тегов: {stats['retagged']}")
+    print(f"   📁 Удалено папок: {stats['folders_removed']}")
+    print(f"   ⏭️  Пропущено: {stats['skipped']}")
+    print(f"   ❌ Ошибок: {stats['errors']}")
+    return 1 if stats['errors'] else 0
+
 def main():
     """
     Главная функция
     """
+    global aliases_file, preview_cache, duplicate_policy
+    args = parse_args()
+    inst.configure_from_args(args)
+    set_dry_run(args.dry_run)
+    aliases_file = args.aliases
+    duplicate_policy = args.duplicates
+    
     # Устанавливаем обработчик сигналов
     signal.signal(signal.SIGINT, signal_handler)
     
+    if args.runs:
+        for run_id in list_runs():
+            print(run_id)
+        return 0
+    
+    if (args.undo or args.resume) and is_dry_run():
+        print("❌ --undo и --resume не сочетаются с --dry-run", file=sys.stderr)
+        return 2
+    
+    if args.undo:
+        return run_undo(args.undo)
+    
+    audio_files = None
+    if args.resume:
+        try:
+            audio_files = resume_run(args)
+        except JournalError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 2
+    
+    if args.watch:
+        if not args.batch or args.resume:
+            print("❌ --watch работает только с --batch и без --resume", file=sys.stderr)
+            return 2
+        return run_watch(args)
+    
+    if args.batch:
+        return run_batch(args, audio_files)
+    
     print("🎵 Скрипт перемещения файлов по жанрам")
     print("=" * 50)
     print("⚠️  ВНИМАНИЕ: Этот скрипт перемещает файлы!")
@@ -719,14 +1426,20 @@ def main():
     print("=" * 50)
     
     # Получаем директорию для поиска файлов
-    search_dir, _ = get_search_directory()
-    if search_dir is None:
-        return
+    if args.search:
+        search_dir = args.search
+    else:
+        search_dir, _ = get_search_directory()
+        if search_dir is None:
+            return
     
     # Получаем директорию для создания папок жанров
-    output_dir = get_output_directory()
-    if output_dir is None:
-        return
+    if args.output:
+        output_dir = args.output
+    else:
+        output_dir = get_output_directory()
+        if output_dir is None:
+            return
     
     # Показываем параметры операции
     print(f"\n🎵 Начинаем обработку файлов:")
@@ -734,12 +1447,23 @@ def main():
     print(f"📁 Создаем папки жанров в: {Path(output_dir).absolute()}")
     print(f"📋 Файлы будут перемещены в подпапки по жанрам!")
     
+    # Фрагменты для прослушивания декодируются заранее (нужен ffmpeg)
+    decoder = make_decoder() if args.preview_cache_mb > 0 else None
+    if decoder:
+        preview_cache = PreviewCache(max_bytes=args.preview_cache_mb * 1024 * 1024, decoder=decoder,
+                                     offset=args.preview_offset, length=args.preview_length)
+    
     try:
-        process_files_by_genre(search_dir, output_dir)
+        process_files_by_genre(search_dir, output_dir,
+                               prefetch_depth=args.prefetch_depth, prefetch_workers=args.prefetch_workers,
+                               audio_files=audio_files)
     except KeyboardInterrupt:
         print("\n\n⏹️  Прервано пользователем")
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {str(e)}")
+    finally:
+        if preview_cache:
+            preview_cache.close()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Правка тегов по файлу правил (см. tag_rewrite.py) за один проход
+Запуск:
+  python z_rewrite_tags.py --rules rules.json папка файл ... [--dry-run] [--workers N]
+Каждый файл читается один раз (каталог тегов) и пишется не больше одного раза,
+папки обходятся рекурсивно, файлы обрабатываются в пуле процессов.
+В конце - сколько раз сработало каждое правило и сколько времени оно заняло.
+По каждому файлу печатается строка только с --verbose (ошибки - всегда).
+"""
+
+import argparse
+import os
+import sys
+
+import instrumentation as inst
+from discovery import iter_audio_files, AUDIO_EXTENSIONS
+from tag_rewrite import TagRewriter, RewriteError, load_rules, rewrite_files, DEFAULT_WORKERS
+from tag_writer import set_dry_run
+
+
+def collect_files(paths, extensions=AUDIO_EXTENSIONS):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            with inst.stage('discover'):
+                files.extend(str(f) for f in iter_audio_files(path, extensions))
+        elif os.path.isfile(path) and os.path.splitext(path)[1].lower() in extensions:
+            files.append(path)
+        else:
+            print(f"⚠️ Skipping: {path}")
+    return sorted(files)
+
+
+def print_result(path, status, message):
+    if status == 'updated':
+        inst.vprint(f"✅ Updated: {path} ({message})")
+    elif status == 'error':
+        print(f"❌ Error processing {path}: {message}")
+
+
+def print_report(rewriter, summary):
+    print(f"\n{'rule':<32}{'hits':>8}{'ms':>10}")
+    for name, hits, ms in rewriter.report():
+        print(f"{name[:31]:<32}{hits:>8}{ms:>10.2f}")
+    print(f"\n📊 Files: {summary['files']}, updated: {summary['updated']}, planned: {summary['planned']}, "
+          f"unchanged: {summary['unchanged']}, errors: {summary['error']}")
+    print(f"   ⏱  {summary['elapsed_s']} s, {summary['files_per_s']} files/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite tags with an ordered list of regex rules")
+    parser.add_argument("paths", nargs="+", help="audio files or folders (scanned recursively)")
+    parser.add_argument("--rules", required=True, help="JSON rules file (see tag_rewrite.py)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"worker processes (default {DEFAULT_WORKERS})")
+    parser.add_argument("--dry-run", action="store_true", help="print the planned changes without writing")
+    inst.add_arguments(parser)
+    args = parser.parse_args()
+    inst.configure_from_args(args)
+    set_dry_run(args.dry_run)
+
+    try:
+        rules = load_rules(args.rules)
+        TagRewriter.from_dicts(rules)
+    except RewriteError as e:
+        print(f"❌ Bad rules file: {e}", file=sys.stderr)
+        return 2
+
+    files = collect_files(args.paths)
+    if not files:
+        print("❌ No audio files found")
+        return 1
+    rewriter, summary = rewrite_files(files, rules, max(1, args.workers), on_result=print_result)
+    print_report(rewriter, summary)
+    return 1 if summary['error'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
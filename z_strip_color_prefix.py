@@ -1,54 +1,56 @@
 import sys
 import os
-import re
 from mutagen.flac import FLAC
+from tag_rewrite import TagRewriter, rewrite_files, rewrite_one
+from tag_writer import set_dry_run
+import instrumentation as inst
+from discovery import iter_audio_files, FLAC_EXTENSIONS
 
-def strip_color_prefix(comment):
-    # Заменяем все вхождения 'color=' на '', не трогая значение
-    return re.sub(r'\bcolor=', '', comment)
+# То же как правило для z_rewrite_tags.py
+STRIP_COLOR_RULES = [
+    {'name': 'strip-color', 'field': 'comment', 'regex': r'\bcolor=', 'replace': '', 'formats': ['FLAC']},
+]
 
-def process_file(filepath):
-    try:
-        audio = FLAC(filepath)
-        changed = False
-
-        if "comment" in audio:
-            old_comments = audio["comment"]
-            new_comments = [strip_color_prefix(c) for c in old_comments]
-            if old_comments != new_comments:
-                audio["comment"] = new_comments
-                changed = True
+def print_result(path, status, message):
+    if status == 'updated':
+        inst.vprint(f"✅ Updated: {path} ({message})")
+    elif status == 'error':
+        print(f"❌ Error processing {path}: {message}")
 
-        if changed:
-            audio.save()
-            print(f"✅ Updated: {filepath}")
-        else:
-            print(f"👌 No changes needed: {filepath}")
-    except Exception as e:
-        print(f"❌ Error processing {filepath}: {e}")
+def process_file(filepath):
+    # Сравниваем по каталогу - неизмененные файлы повторно не разбираются
+    path, status, message = rewrite_one(TagRewriter.from_dicts(STRIP_COLOR_RULES), filepath, opener=FLAC)
+    if status == 'unchanged':
+        print(f"👌 No changes needed: {filepath}")
+    elif status == 'updated':
+        print(f"✅ Updated: {path} ({message})")
+    else:
+        print_result(path, status, message)
 
 def process_directory(directory):
     """Recursively process all FLAC files in a directory"""
-    flac_count = 0
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.flac'):
-                filepath = os.path.join(root, file)
-                process_file(filepath)
-                flac_count += 1
-    
-    if flac_count == 0:
+    files = sorted(str(f) for f in iter_audio_files(directory, FLAC_EXTENSIONS))
+    if not files:
         print(f"📁 No FLAC files found in: {directory}")
-    else:
-        print(f"📁 Processed {flac_count} FLAC files in: {directory}")
+        return
+    _, summary = rewrite_files(files, STRIP_COLOR_RULES, opener=FLAC, on_result=print_result)
+    print(f"📁 Processed {len(files)} FLAC files in: {directory} "
+          f"({summary['updated'] + summary['planned']} changed, {summary['unchanged']} unchanged)")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python strip_color_prefix.py file1.flac [file2.flac ...] [directory1] [directory2] ...")
+    args = sys.argv[1:]
+    inst.pop_arguments(args)
+    if "--dry-run" in args:
+        args.remove("--dry-run")
+        set_dry_run(True)
+
+    if not args:
+        print("Usage: python strip_color_prefix.py [--dry-run] [--verbose] file1.flac [file2.flac ...] [directory1] [directory2] ...")
         print("  - Files: Process individual FLAC files")
         print("  - Directories: Recursively process all FLAC files in the directory")
+        print("  - --dry-run: Print the planned changes without writing")
     else:
-        for path in sys.argv[1:]:
+        for path in args:
             if os.path.isfile(path):
                 if path.lower().endswith(".flac"):
                     process_file(path)
@@ -57,4 +59,4 @@ if __name__ == "__main__":
             elif os.path.isdir(path):
                 process_directory(path)
             else:
-                print(f"⚠️ Path not found: {path}")
\ No newline at end of file
+                print(f"⚠️ Path not found: {path}")
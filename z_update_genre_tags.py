@@ -4,15 +4,32 @@
 """
 
 import os
-import glob
 from mutagen.flac import FLAC
 from pathlib import Path
 import sys
+from flac_writer import format_report
+from tag_writer import update_tags, set_dry_run, is_dry_run
+from discovery import iter_audio_files, list_subdirectories, FLAC_EXTENSIONS
+import instrumentation as inst
+
+def set_folder_genre(flac_file, folder_name):
+    """
+    Записывает название папки в GENRE, только если жанр отличается
+    Возвращает (было, TagUpdate)
+    """
+    update = update_tags(flac_file, {'genre': folder_name}, opener=FLAC)
+    if update.changes:
+        old = update.changes[0].old
+        current_genre = old[0] if old else 'НЕТ'
+    else:
+        current_genre = folder_name
+    return current_genre, update
 
 def update_genre_tags(root_directory="."):
     """
     Проходит по всем папкам и обновляет тег Genre в FLAC файлах
     на название папки, в которой они находятся
+    По каждому файлу печатается строка только с --verbose, иначе - строка прогресса
     """
     root_path = Path(root_directory)
     
@@ -27,7 +44,9 @@ def update_genre_tags(root_directory="."):
     total_files = 0
     updated_files = 0
     errors = 0
+    unchanged_files = 0
     processed_folders = 0
+    bytes_written = 0
     
     # Если передана конкретная папка (не текущая директория)
     if root_directory != ".":
@@ -37,23 +56,10 @@ def update_genre_tags(root_directory="."):
             print(f"\n📁 Обрабатываю выбранную папку: {folder_name}")
             print(f"📂 Полный путь: {root_path.absolute()}")
             
-            # Ищем все FLAC файлы в этой папке
-            print(f"🔍 Ищу FLAC файлы в папке...")
-            flac_patterns = ["*.flac", "*.FLAC"]
-            flac_files = []
-            
-            for pattern in flac_patterns:
-                found_files = list(root_path.glob(pattern))
-                flac_files.extend(found_files)
-                print(f"   🔍 По маске {pattern}: найдено {len(found_files)} файлов")
-            
-            # Также проверим рекурсивно во вложенных папках
-            for pattern in flac_patterns:
-                found_files = list(root_path.rglob(pattern))
-                for f in found_files:
-                    if f not in flac_files:
-                        flac_files.append(f)
-                print(f"   🔍 Рекурсивно по маске {pattern}: всего найдено {len(list(root_path.rglob(pattern)))} файлов")
+            # Ищем все FLAC файлы в этой папке и во вложенных - один проход scandir
+            print(f"🔍 Ищу FLAC файлы в папке (рекурсивно)...")
+            with inst.stage('discover'):
+                flac_files = sorted(iter_audio_files(root_path, FLAC_EXTENSIONS))
             
             if not flac_files:
                 print(f"   ❌ FLAC файлы не найдены!")
@@ -70,93 +76,93 @@ def update_genre_tags(root_directory="."):
             
             # Обрабатываем каждый FLAC файл
             for i, flac_file in enumerate(flac_files, 1):
-                print(f"\n   🎵 [{i}/{len(flac_files)}] Обрабатываю: {flac_file.name}")
-                print(f"      📂 Путь: {flac_file.parent}")
+                inst.vprint(f"\n   🎵 [{i}/{len(flac_files)}] Обрабатываю: {flac_file.name}")
+                inst.vprint(f"      📂 Путь: {flac_file.parent}")
+                inst.progress(i, len(flac_files))
                 
                 try:
                     total_files += 1
                     
-                    # Проверяем размер файла
-                    file_size = flac_file.stat().st_size
-                    print(f"      📏 Размер файла: {file_size / 1024 / 1024:.1f} MB")
-                    
-                    # Открываем файл для редактирования метаданных
-                    print(f"      🔓 Открываю файл для чтения метаданных...")
-                    audio = FLAC(str(flac_file))
-                    
-                    # Получаем текущий жанр
-                    current_genre = audio.get('GENRE', [''])[0] if 'GENRE' in audio else 'НЕТ'
-                    
-                    # Устанавливаем новый жанр
-                    audio['GENRE'] = folder_name
+                    # Файл пишется, только если жанр действительно меняется
+                    current_genre, update = set_folder_genre(flac_file, folder_name)
                     
-                    # Сохраняем изменения
-                    audio.save()
-                    
-                    updated_files += 1
-                    print(f"      ✅ Жанр: было '{current_genre}' - стало '{folder_name}'")
+                    if not update.changes:
+                        unchanged_files += 1
+                        inst.vprint(f"      👌 Жанр уже '{folder_name}', файл не изменен")
+                    elif update.written:
+                        bytes_written += update.report.bytes_written
+                        updated_files += 1
+                        inst.vprint(f"      ✅ Жанр: было '{current_genre}' - стало '{folder_name}'")
+                        inst.vprint(f"      💾 Записано: {format_report(update.report)}")
+                    else:
+                        updated_files += 1
                     
                 except Exception as e:
                     errors += 1
-                    print(f"      ❌ ОШИБКА: {str(e)}")
+                    print(f"      ❌ ОШИБКА {flac_file}: {str(e)}")
                     import traceback
-                    print(f"      🐛 Детали ошибки: {traceback.format_exc()}")
+                    inst.vprint(f"      🐛 Детали ошибки: {traceback.format_exc()}")
         else:
             print(f"❌ {root_directory} не является папкой!")
             return
     else:
         # Обрабатываем все поддиректории в текущей папке
         print(f"🔍 Сканирую поддиректории...")
-        folders = [folder for folder in root_path.iterdir() if folder.is_dir()]
+        with inst.stage('discover'):
+            folders = list_subdirectories(root_path)
+            folder_files = [(folder_path, sorted(iter_audio_files(folder_path, FLAC_EXTENSIONS, max_depth=0)))
+                            for folder_path in folders]
         print(f"📁 Найдено папок: {len(folders)}")
+        found = sum(len(flac_files) for _, flac_files in folder_files)
         
-        for folder_path in folders:
+        for folder_path, flac_files in folder_files:
             folder_name = folder_path.name
-            print(f"\n📁 Обрабатываю папку: {folder_name}")
+            inst.vprint(f"\n📁 Обрабатываю папку: {folder_name}")
             processed_folders += 1
             
-            # Ищем все FLAC файлы в текущей папке
-            flac_files = list(folder_path.glob("*.flac")) + list(folder_path.glob("*.FLAC"))
-            
             if not flac_files:
-                print(f"   ℹ️  FLAC файлы не найдены")
+                inst.vprint(f"   ℹ️  FLAC файлы не найдены")
                 continue
                 
-            print(f"   🎧 Найдено {len(flac_files)} FLAC файлов")
+            inst.vprint(f"   🎧 Найдено {len(flac_files)} FLAC файлов")
             
             # Обрабатываем каждый FLAC файл
             for i, flac_file in enumerate(flac_files, 1):
-                print(f"   🎵 [{i}/{len(flac_files)}] {flac_file.name}")
+                inst.vprint(f"   🎵 [{i}/{len(flac_files)}] {flac_file.name}")
                 
                 try:
                     total_files += 1
+                    inst.progress(total_files, found)
                     
-                    # Открываем файл для редактирования метаданных
-                    audio = FLAC(str(flac_file))
-                    
-                    # Получаем текущий жанр
-                    current_genre = audio.get('GENRE', [''])[0] if 'GENRE' in audio else 'НЕТ'
+                    # Файл пишется, только если жанр действительно меняется
+                    current_genre, update = set_folder_genre(flac_file, folder_name)
                     
-                    # Устанавливаем новый жанр
-                    audio['GENRE'] = folder_name
-                    
-                    # Сохраняем изменения
-                    audio.save()
-                    
-                    updated_files += 1
-                    print(f"   ✅ Жанр: было '{current_genre}' - стало '{folder_name}'")
+                    if not update.changes:
+                        unchanged_files += 1
+                        inst.vprint(f"   👌 Жанр уже '{folder_name}'")
+                    elif update.written:
+                        bytes_written += update.report.bytes_written
+                        updated_files += 1
+                        inst.vprint(f"   ✅ Жанр: было '{current_genre}' - стало '{folder_name}' ({format_report(update.report)})")
+                    else:
+                        updated_files += 1
                     
                 except Exception as e:
                     errors += 1
-                    print(f"   ❌ Ошибка: {str(e)}")
+                    print(f"   ❌ Ошибка {flac_file}: {str(e)}")
     
     # Выводим статистику
     print(f"\n" + "="*60)
     print(f"📊 ФИНАЛЬНАЯ СТАТИСТИКА:")
     print(f"   📁 Обработано папок: {processed_folders}")
     print(f"   🎵 Всего файлов найдено: {total_files}")
-    print(f"   ✅ Успешно обновлено: {updated_files}")
+    if is_dry_run():
+        print(f"   🧪 Будет обновлено (dry-run): {updated_files}")
+    else:
+        print(f"   ✅ Успешно обновлено: {updated_files}")
+    print(f"   👌 Уже с нужным жанром: {unchanged_files}")
     print(f"   ❌ Ошибок: {errors}")
+    print(f"   💾 Записано на диск: {bytes_written / 1024 / 1024:.1f} MB")
     print(f"="*60)
     
     if errors > 0:
@@ -178,7 +184,7 @@ def select_directory():
     print("-" * 50)
     
     # Получаем список всех папок
-    folders = [folder for folder in current_path.iterdir() if folder.is_dir()]
+    folders = list_subdirectories(current_path)
     
     if not folders:
         print("❌ Папки не найдены!")
@@ -223,9 +229,18 @@ def main():
     print("🎵 Скрипт обновления тегов Genre в FLAC файлах")
     print("=" * 50)
     
+    # --dry-run: только показать, что изменится
+    # --verbose, --metrics FILE, --profile FILE - см. instrumentation.py
+    args = sys.argv[1:]
+    inst.pop_arguments(args)
+    if "--dry-run" in args:
+        args.remove("--dry-run")
+        set_dry_run(True)
+        print("🧪 Режим dry-run: файлы не изменяются")
+    
     # Если указан аргумент командной строки - используем его
-    if len(sys.argv) > 1:
-        directory = sys.argv[1]
+    if args:
+        directory = args[0]
         print(f"📁 Используется директория из аргумента: {directory}")
     else:
         # Интерактивный выбор папки